@@ -0,0 +1,296 @@
+"""Async JSON API tier: FastAPI on async SQLAlchemy (aiosqlite) next to the Flask app.
+
+Serves the /api/* endpoints for stays, members, activity logs, loans, undo/redo and the
+/api/events change stream with the models and query builders from main.py. Reads and loan
+writes run natively on an AsyncSession, so a slow query waits on the event loop instead of
+holding a worker thread. Undo/redo go through the ledger code in main.py, which is
+synchronous; they run in a thread pool inside a Flask app context. Point shares stay on
+Flask, whose route serves the loans page's form with a flash message and redirect. An /api/events subscriber waits on the event broker as a suspended coroutine,
+so idle dashboards hold no threads. In multi-tenant mode (TENANT_DIR) each request uses
+the database of the tenant in its X-Tenant header, else the one chosen in the browser
+session (the Flask tier's signed cookie), else DEFAULT_TENANT. Every other path
+falls through to the mounted Flask app, so one ASGI server serves both tiers:
+
+    uvicorn api:app --workers 4
+"""
+import json
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from fastapi import Depends, FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from itsdangerous import BadSignature
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.concurrency import run_in_threadpool
+from werkzeug.http import parse_etags, quote_etag
+
+from main import (
+    ACTIVITY_LOGS_DEFAULT_LIMIT, ACTIVITY_LOGS_MAX_LIMIT, CONFLICT_ERRORS, SSE_HEADERS, SSE_HEARTBEAT_SECONDS,
+    STAYS_BATCH_SIZE,
+    ActivityLog, ActivityLogArchive, Member, PointLoan, Stay, app as flask_app,
+    activity_logs_etag, activity_logs_page, activity_logs_query, broker, build_stays_query, configure_sqlite_engine,
+    data_version, db, invalidate_cache_on_commit, is_tenant, parse_stay_cursor,
+    point_loan_log, record_transfer, redo_last, serialize_activity_log, serialize_stay,
+    sse_chunk, sse_cursor, sse_opening, stay_load_options, stays_page_query, tenant_context, tenant_names, undo_last, upgrade_database
+)
+
+
+def create_engine(tenant=None):
+    """Async engine on the Flask app's (or tenant's) database, with the same pool size and SQLite settings"""
+    with tenant_context(tenant):
+        url = db.engine.url
+    if url.get_backend_name() != 'sqlite':
+        raise RuntimeError('The async API tier only supports SQLite databases')
+
+    options = {name: value for name, value in flask_app.config['SQLALCHEMY_ENGINE_OPTIONS'].items()
+               if name != 'connect_args'}
+    engine = create_async_engine(url.set(drivername='sqlite+aiosqlite'), **options)
+    configure_sqlite_engine(engine.sync_engine)
+    # Writes made here must also drop the Flask tier's cached pages
+    invalidate_cache_on_commit(engine.sync_engine)
+    return engine
+
+
+engines = {}  # tenant (None without tenancy) -> async engine
+session_makers = {}
+
+
+def async_session(tenant=None):
+    """New AsyncSession on the tenant's database, creating its engine on first use"""
+    if tenant not in session_makers:
+        engines[tenant] = create_engine(tenant)
+        session_makers[tenant] = async_sessionmaker(engines[tenant], expire_on_commit=False, info={'tenant': tenant})
+    return session_makers[tenant]()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    for tenant in tenant_names() if flask_app.config['TENANT_DIR'] else [None]:
+        await run_in_threadpool(in_app_context, tenant, upgrade_database)
+    yield
+    for engine in engines.values():
+        await engine.dispose()
+
+
+app = FastAPI(title='DVC Points API', lifespan=lifespan)
+
+
+def error(message, status_code=400):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+
+@app.exception_handler(RequestValidationError)
+async def invalid_parameters(request, exc):
+    problems = '; '.join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())
+    return error(f'Invalid parameters: {problems}')
+
+
+class UnknownTenant(Exception):
+    pass
+
+
+@app.exception_handler(UnknownTenant)
+async def unknown_tenant(request, exc):
+    return error('Unknown or missing tenant; send an X-Tenant header')
+
+
+def session_tenant(request):
+    """Tenant chosen at /tenants/<name>, read from the Flask tier's signed session cookie"""
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if not cookie or serializer is None:
+        return None
+    try:
+        data = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return data.get('tenant')
+
+
+def request_tenant(request: Request):
+    """Tenant from the X-Tenant header, the browser session, or DEFAULT_TENANT, like main.select_tenant"""
+    if not flask_app.config['TENANT_DIR']:
+        return None
+    name = request.headers.get('x-tenant') or session_tenant(request) or flask_app.config['DEFAULT_TENANT']
+    if not is_tenant(name):
+        raise UnknownTenant()
+    return name
+
+
+async def begin_write(session):
+    """Start the session's transaction with BEGIN IMMEDIATE under the production SQLite profile"""
+    await session.connection(execution_options={'write_transaction': True})
+
+
+def in_app_context(tenant, func, *args):
+    """Run synchronous main.py code on the Flask session for tenant, in a write transaction"""
+    with tenant_context(tenant):
+        db.session.connection(execution_options={'write_transaction': True})
+        try:
+            return func(*args)
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+async def request_data(request):
+    """JSON or form body, like Flask's request.get_json() / request.form"""
+    if request.headers.get('content-type', '').startswith('application/json'):
+        return await request.json()
+    return await request.form()
+
+
+@app.get('/api/stays')
+async def get_stays(use_year: int | None = None, status: str | None = None, member_id: int | None = None,
+                    limit: int | None = None, after: str | None = None, tenant=Depends(request_tenant)):
+    try:
+        after = parse_stay_cursor(after) if after else None
+    except ValueError as e:
+        return error(f'Invalid parameters: {str(e)}')
+
+    if limit is not None and limit <= 0:
+        return error('limit must be positive')
+
+    query = build_stays_query(use_year=use_year, status=status, member_id=member_id)
+
+    if limit is not None:
+        # Single page: load one extra row to know whether there is a next page
+        async with async_session(tenant) as session:
+            stays = (await session.scalars(stays_page_query(query, after, limit + 1))).all()
+        headers = {}
+        if len(stays) > limit:
+            stays = stays[:limit]
+            last = stays[-1]
+            headers['X-Next-Cursor'] = f"{last.check_in.strftime('%Y-%m-%d')}:{last.id}"
+        return JSONResponse([serialize_stay(stay) for stay in stays], headers=headers)
+
+    return StreamingResponse(stream_stays(tenant, query, after), media_type='application/json')
+
+
+async def stream_stays(tenant, query, after):
+    """Walk the keyset in fixed-size batches, sending each batch as one chunk"""
+    async with async_session(tenant) as session:
+        yield '['
+        separator = ''
+        while True:
+            stays = (await session.scalars(stays_page_query(query, after))).all()
+            if stays:
+                yield separator + ','.join(json.dumps(serialize_stay(stay)) for stay in stays)
+                separator = ','
+            if len(stays) < STAYS_BATCH_SIZE:
+                break
+            after = (stays[-1].check_in, stays[-1].id)
+            session.expunge_all()
+        yield ']'
+
+
+@app.get('/api/stays/{stay_id}')
+async def get_stay(stay_id: int, tenant=Depends(request_tenant)):
+    async with async_session(tenant) as session:
+        stay = await session.get(Stay, stay_id, options=stay_load_options())
+        if stay is None:
+            return error('Stay not found', 404)
+        return serialize_stay(stay)
+
+
+@app.get('/api/members')
+async def get_members(tenant=Depends(request_tenant)):
+    async with async_session(tenant) as session:
+        members = (await session.scalars(select(Member))).all()
+    return [{'id': m.id, 'name': m.name} for m in members]
+
+
+@app.get('/api/activity_logs')
+async def get_activity_logs(request: Request, limit: int = ACTIVITY_LOGS_DEFAULT_LIMIT,
+                            before_id: int | None = None, since_id: int | None = None, archived: bool = False,
+                            tenant=Depends(request_tenant)):
+    limit = min(limit, ACTIVITY_LOGS_MAX_LIMIT)
+    if limit <= 0:
+        return error('limit must be positive')
+    model = ActivityLogArchive if archived else ActivityLog
+
+    async with async_session(tenant) as session:
+        # Same validator as the Flask tier, so clients can switch tiers without refetching
+        min_id, max_id = (await session.execute(select(func.min(model.id), func.max(model.id)))).one()
+        version = await session.run_sync(lambda sync_session: data_version(sync_session.connection()))
+        etag = activity_logs_etag(version, archived, min_id, max_id, limit, before_id, since_id)
+        headers = {'ETag': quote_etag(etag)}
+        if parse_etags(request.headers.get('if-none-match')).contains(etag):
+            return Response(status_code=304, headers=headers)
+
+        logs, next_since_id = activity_logs_page(
+            (await session.scalars(activity_logs_query(model, limit, before_id, since_id))).all(), limit, since_id
+        )
+    if next_since_id is not None:
+        headers['X-Next-Since-Id'] = str(next_since_id)
+    return JSONResponse([serialize_activity_log(log) for log in logs], headers=headers)
+
+
+@app.get('/api/events')
+async def event_stream(request: Request, tenant=Depends(request_tenant)):
+    last_seen, stale = sse_cursor(request.headers.get('last-event-id'))
+
+    async def generate():
+        nonlocal last_seen
+        yield sse_opening(last_seen, stale)
+        while not await request.is_disconnected():
+            events, missed, last_seen = await broker.wait_async(last_seen, SSE_HEARTBEAT_SECONDS, tenant)
+            yield sse_chunk(events, missed)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+@app.post('/api/loans')
+async def create_loan(request: Request, tenant=Depends(request_tenant)):
+    async with async_session(tenant) as session:
+        try:
+            data = await request_data(request)
+            await begin_write(session)
+
+            loan = PointLoan(
+                lender_id=int(data['lender_id']),
+                borrower_id=int(data['borrower_id']),
+                points=int(data['points']),
+                use_year=int(data['use_year'])
+            )
+            session.add(loan)
+            await session.flush()
+            await session.run_sync(record_transfer, loan.lender_id, loan.borrower_id, loan.points, loan.use_year)
+
+            lender = await session.get(Member, loan.lender_id)
+            borrower = await session.get(Member, loan.borrower_id)
+            session.add(point_loan_log(loan, lender, borrower))
+
+            await session.commit()
+            return {'message': 'Point sharing recorded successfully'}
+
+        except Exception as e:
+            await session.rollback()
+            flask_app.logger.exception('Error recording point loan')
+            return error(str(e), 500)
+
+
+async def reverse_action(tenant, func):
+    try:
+        await run_in_threadpool(in_app_context, tenant, func)
+    except CONFLICT_ERRORS as e:
+        return error(f'Conflicting update, please retry: {e}', 409)
+    except Exception as e:
+        return error(str(e))
+    return {'status': 'success'}
+
+
+@app.post('/api/undo_last_action')
+async def undo_last_action(tenant=Depends(request_tenant)):
+    return await reverse_action(tenant, undo_last)
+
+
+@app.post('/api/redo_last_action')
+async def redo_last_action(tenant=Depends(request_tenant)):
+    return await reverse_action(tenant, redo_last)
+
+
+# Everything not routed above (HTML pages, forms, exports, the rest of /api) goes to Flask
+app.mount('/', WSGIMiddleware(flask_app))
@@ -0,0 +1,171 @@
+"""Concurrent-request throughput of the Flask (WSGI) and FastAPI (async) API tiers.
+
+Builds a database with benchmarks/dataset.py, then starts each tier in its own uvicorn
+process against it: the Flask app through a2wsgi's thread pool, and api.py's async app.
+For every concurrency level an httpx client keeps that many requests in flight for a
+fixed time, cycling through a mix of /api/* reads (and with --writes, loan inserts), and
+reports throughput and latency percentiles per tier. The full /api/stays stream is in
+the mix as the slow request that occupies a Flask worker thread for its whole duration.
+
+    python benchmarks/async_tier.py --preset medium --concurrency 1 8 32 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import dataset
+from routes import percentile
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+WSGI_THREADS = 10  # a2wsgi's default, the same pool size as a threaded Flask worker
+
+
+def flask_tier():
+    """uvicorn factory serving the Flask app alone through a2wsgi"""
+    from a2wsgi import WSGIMiddleware
+    sys.path.insert(0, dataset.ROOT)
+    import main
+    return WSGIMiddleware(main.app, workers=WSGI_THREADS)
+
+
+# uvicorn arguments for each tier
+TIERS = {
+    'flask': ['async_tier:flask_tier', '--factory', '--app-dir', BENCHMARK_DIR],
+    'fastapi': ['api:app', '--app-dir', dataset.ROOT],
+}
+
+
+class Workload:
+    """Weighted request mix; ids are read from the database before the servers start"""
+
+    def __init__(self, main, seed, writes):
+        self.rng = random.Random(seed)
+        with main.app.app_context():
+            self.use_year = main.get_use_year(main.date.today())
+            self.member_ids = [m.id for m in main.Member.query.all()]
+            self.stay_ids = [s.id for s in main.Stay.query.with_entities(main.Stay.id)]
+        self.requests = [
+            (30, lambda: ('GET', '/api/stays?limit=50', {})),
+            (30, lambda: ('GET', f'/api/stays/{self.rng.choice(self.stay_ids)}', {})),
+            (15, lambda: ('GET', '/api/members', {})),
+            (20, lambda: ('GET', '/api/activity_logs?limit=100', {})),
+            (1, lambda: ('GET', '/api/stays', {})),
+        ]
+        if writes:
+            self.requests.append((10, self.loan))
+
+    def loan(self):
+        lender_id, borrower_id = self.rng.sample(self.member_ids, 2)
+        return 'POST', '/api/loans', {'json': {'lender_id': lender_id, 'borrower_id': borrower_id,
+                                               'points': 1, 'use_year': self.use_year}}
+
+    def next(self):
+        weights = [weight for weight, _ in self.requests]
+        return self.rng.choices(self.requests, weights)[0][1]()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(tier, database_path, port):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database_path}',
+               # Without the response cache both tiers do the same database work per request
+               RESPONSE_CACHE_SIZE='0', PYTHONWARNINGS='ignore')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', *TIERS[tier], '--port', str(port), '--log-level', 'warning',
+         '--no-access-log'], env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'{tier} server exited with status {server.returncode}')
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/api/members').status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f'{tier} server did not start')
+
+
+async def measure(base_url, workload, concurrency, duration):
+    """Keep concurrency requests in flight for duration seconds"""
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        stop_at = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < stop_at:
+                method, path, kwargs = workload.next()
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += failed
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {'requests': len(latencies), 'rps': len(latencies) / elapsed,
+            'p50': percentile(latencies, 50), 'p99': percentile(latencies, 99), 'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--preset', choices=dataset.PRESETS, default='medium')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per tier and concurrency level')
+    parser.add_argument('--warmup', type=float, default=2, help='Unrecorded seconds before each tier')
+    parser.add_argument('--writes', action='store_true', help='Mix POST /api/loans into the requests')
+    parser.add_argument('--tiers', nargs='+', choices=TIERS, default=list(TIERS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, 'bench.db')
+        main_module = dataset.load_app(database_path)
+        counts = dataset.generate(main_module, seed=args.seed, **dataset.PRESETS[args.preset])
+        workload = Workload(main_module, args.seed, args.writes)
+
+        results = {}
+        for tier in args.tiers:
+            port = free_port()
+            server = start_server(tier, database_path, port)
+            try:
+                base_url = f'http://127.0.0.1:{port}'
+                asyncio.run(measure(base_url, workload, max(args.concurrency), args.warmup))
+                for concurrency in args.concurrency:
+                    results[tier, concurrency] = asyncio.run(measure(base_url, workload, concurrency, args.duration))
+            finally:
+                server.terminate()
+                server.wait()
+
+    print(f"preset {args.preset}: {counts['stays']} stays, {counts['activity']} activity rows, "
+          f"{args.duration:g}s per level{', with writes' if args.writes else ''}")
+    print(f"{'tier':<10}{'clients':>8}{'requests':>10}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for (tier, concurrency), result in results.items():
+        print(f"{tier:<10}{concurrency:>8}{result['requests']:>10}{result['rps']:>9.1f}"
+              f"{result['p50']:>9.2f}{result['p99']:>9.2f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Build seeded synthetic databases for benchmarking at realistic scale.
+
+The same seed and counts always produce the same rows. Balances are consistent with
+the ledger: every allocation is opened with an 'allocation' entry and reduced by the
+booked stays and point transfers generated against it, and the pairwise PointBalance
+matrix matches the loans and transfers, so `flask ledger-check` passes.
+
+    python benchmarks/dataset.py /tmp/medium.db --preset medium
+    python benchmarks/dataset.py /tmp/custom.db --members 50 --stays 20000 --seed 7
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRESETS = {
+    'small': {'members': 3, 'use_years': 2, 'stays': 60, 'guests': 2, 'guest_shares': 10,
+              'loans': 10, 'shares': 10, 'activity': 200},
+    'medium': {'members': 12, 'use_years': 4, 'stays': 2000, 'guests': 20, 'guest_shares': 400,
+               'loans': 300, 'shares': 300, 'activity': 10000},
+    'large': {'members': 40, 'use_years': 8, 'stays': 20000, 'guests': 80, 'guest_shares': 4000,
+              'loans': 3000, 'shares': 3000, 'activity': 100000},
+}
+
+RESORTS = ['Bay Lake Tower', 'Polynesian Villas', 'Grand Floridian Villas', 'Saratoga Springs',
+           'Old Key West', 'Animal Kingdom Lodge', 'Beach Club Villas', 'Riviera Resort',
+           'Aulani', 'Vero Beach', 'Hilton Head Island', 'Grand Californian']
+ACTIVITY_TYPES = ['stay_booked', 'stay_status_updated', 'points_banked', 'points_transferred',
+                  'point_share', 'stay_updated', 'add_guest', 'create_stay']
+BATCH_SIZE = 5000
+
+
+def load_app(database_path):
+    """Import main bound to database_path; must run before main is imported elsewhere"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(database_path)}'
+    sys.path.insert(0, ROOT)
+    import main
+    return main
+
+
+def insert_rows(main, table, rows):
+    from sqlalchemy import insert
+    for start in range(0, len(rows), BATCH_SIZE):
+        main.db.session.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+def populate(main, seed=0, members=3, use_years=2, stays=60, guests=2, guest_shares=10,
+             loans=10, shares=10, activity=200):
+    """Fill an empty, migrated database with synthetic rows. Returns the row counts."""
+    rng = random.Random(seed)
+    db = main.db
+    current_year = main.get_use_year(date.today())
+    years = list(range(current_year - use_years + 1, current_year + 1))
+    now = datetime.now()
+
+    db.session.add(main.Contract(use_year_start=9, total_points=230))
+    insert_rows(main, main.Member.__table__, [{'id': i, 'name': f'Member {i}'} for i in range(1, members + 1)])
+    insert_rows(main, main.AdditionalGuest.__table__, [{'id': i, 'name': f'Guest {i}'} for i in range(1, guests + 1)])
+    member_ids = list(range(1, members + 1))
+
+    # Stays spread across the use years, each split between one to three members
+    stay_rows, stay_member_rows, ledger_rows = [], [], []
+    debits = {}
+    for stay_id in range(1, stays + 1):
+        use_year = rng.choice(years)
+        check_in = date(use_year, 9, 1) + timedelta(days=rng.randrange(365))
+        status = rng.choice(['planned', 'booked'])
+        sharers = rng.sample(member_ids, min(len(member_ids), rng.randint(1, 3)))
+        member_points = [rng.randint(5, 60) for _ in sharers]
+        stay_rows.append({
+            'id': stay_id, 'resort': rng.choice(RESORTS), 'check_in': check_in,
+            'check_out': check_in + timedelta(days=rng.randint(1, 7)), 'use_year': use_year,
+            'points_cost': sum(member_points), 'status': status, 'version': 1
+        })
+        for member_id, points in zip(sharers, member_points):
+            stay_member_rows.append({'stay_id': stay_id, 'member_id': member_id, 'points_share': points})
+            if status == 'booked':
+                debits[(member_id, use_year)] = debits.get((member_id, use_year), 0) + points
+                ledger_rows.append(ledger_row(now, member_id, use_year, -points, 'stay_booked', stay_id=stay_id))
+
+    # Point transfers between members within a use year
+    share_rows = []
+    for _ in range(shares if members > 1 else 0):
+        lender_id, borrower_id = rng.sample(member_ids, 2)
+        use_year, points = rng.choice(years), rng.randint(1, 20)
+        share_rows.append({'lender_id': lender_id, 'borrower_id': borrower_id, 'points': points,
+                           'use_year': use_year, 'timestamp': now})
+        debits[(lender_id, use_year)] = debits.get((lender_id, use_year), 0) + points
+        debits[(borrower_id, use_year)] = debits.get((borrower_id, use_year), 0) - points
+        ledger_rows.append(ledger_row(now, lender_id, use_year, -points, 'points_transferred', counterparty_id=borrower_id))
+        ledger_rows.append(ledger_row(now, borrower_id, use_year, points, 'points_transferred', counterparty_id=lender_id))
+
+    # Guests attached to stays, their points split across the stay's members
+    guest_pairs = set()
+    stay_guest_rows, guest_point_rows = [], []
+    members_by_stay = {}
+    for row in stay_member_rows:
+        members_by_stay.setdefault(row['stay_id'], []).append(row['member_id'])
+    for _ in range(guest_shares if guests and stays else 0):
+        pair = (rng.randint(1, stays), rng.randint(1, guests))
+        if pair in guest_pairs:
+            continue
+        guest_pairs.add(pair)
+        stay_guest_rows.append({'id': len(stay_guest_rows) + 1, 'stay_id': pair[0], 'guest_id': pair[1]})
+        member_id, points = rng.choice(members_by_stay[pair[0]]), rng.randint(1, 20)
+        guest_point_rows.append({'stay_guest_id': len(stay_guest_rows), 'member_id': member_id, 'points': points})
+
+    # Recorded loans, which are records only and post nothing to the ledger
+    loan_rows = []
+    for _ in range(loans if members > 1 else 0):
+        lender_id, borrower_id = rng.sample(member_ids, 2)
+        use_year, points = rng.choice(years), rng.randint(1, 30)
+        loan_rows.append({'lender_id': lender_id, 'borrower_id': borrower_id, 'points': points,
+                          'use_year': use_year, 'timestamp': now})
+
+    # Opening allocations cover what booked stays and transfers debited, with some headroom left to spend
+    allocation_rows, opening_rows = [], []
+    for member_id in member_ids:
+        for use_year in years:
+            key = (member_id, use_year)
+            regular = max(debits.get(key, 0), 0) + rng.randint(50, 150)
+            banked = rng.randint(0, 80)
+            for points, is_banked in ((regular, False), (banked, True)):
+                spent = 0 if is_banked else debits.get(key, 0)
+                allocation_rows.append({'member_id': member_id, 'use_year': use_year, 'is_banked': is_banked,
+                                        'points': points - spent, 'version': 1})
+                opening_rows.append(ledger_row(now, member_id, use_year, points, 'allocation', is_banked=is_banked))
+
+    # History that is browsed but not undoable, oldest first
+    activity_rows = []
+    for i in range(activity):
+        member1_id, member2_id = rng.choice(member_ids), rng.choice([None] + member_ids)
+        activity_rows.append({
+            'timestamp': now - timedelta(minutes=activity - i), 'action_type': rng.choice(ACTIVITY_TYPES),
+            'description': f'Synthetic activity {i + 1}', 'member1_id': member1_id,
+            'member2_id': member2_id, 'stay_id': rng.randint(1, stays) if stays else None
+        })
+
+    insert_rows(main, main.Stay.__table__, stay_rows)
+    insert_rows(main, main.StayMember.__table__, stay_member_rows)
+    insert_rows(main, main.StayGuest.__table__, stay_guest_rows)
+    insert_rows(main, main.stay_additional_guest, [{'stay_id': r['stay_id'], 'guest_id': r['guest_id']}
+                                                   for r in stay_guest_rows])
+    insert_rows(main, main.GuestPoints.__table__, guest_point_rows)
+    insert_rows(main, main.PointAllocation.__table__, allocation_rows)
+    insert_rows(main, main.PointLedgerEntry.__table__, opening_rows + ledger_rows)
+    insert_rows(main, main.PointShare.__table__, share_rows)
+    insert_rows(main, main.PointLoan.__table__, loan_rows)
+    insert_rows(main, main.PointBalance.__table__, pair_balance_rows(main, share_rows + loan_rows, now))
+    insert_rows(main, main.ActivityLog.__table__, activity_rows)
+    db.session.commit()
+
+    return {'members': members, 'use_years': len(years), 'stays': len(stay_rows),
+            'allocations': len(allocation_rows), 'ledger_entries': len(opening_rows) + len(ledger_rows),
+            'guests': guests, 'guest_shares': len(stay_guest_rows), 'loans': len(loan_rows),
+            'shares': len(share_rows), 'activity': len(activity_rows)}
+
+
+def pair_balance_rows(main, transfers, timestamp):
+    """The PointBalance matrix the app would have built while recording these transfers"""
+    totals = {}
+    for row in transfers:
+        member1_id, member2_id, owed = main.transfer_pair(row['lender_id'], row['borrower_id'], row['points'])
+        key = (member1_id, member2_id, row['use_year'])
+        totals[key] = totals.get(key, 0) + owed
+    return [{'member1_id': member1_id, 'member2_id': member2_id, 'use_year': use_year, 'points': points,
+             'timestamp': timestamp} for (member1_id, member2_id, use_year), points in totals.items()]
+
+
+def ledger_row(timestamp, member_id, use_year, points, entry_type, is_banked=False, stay_id=None,
+               counterparty_id=None):
+    return {'timestamp': timestamp, 'member_id': member_id, 'use_year': use_year, 'is_banked': is_banked,
+            'points': points, 'entry_type': entry_type, 'stay_id': stay_id, 'counterparty_id': counterparty_id}
+
+
+def generate(main, seed=0, **counts):
+    """Create the schema in main's (empty) database and populate it"""
+    with main.app.app_context():
+        main.upgrade_database()
+        if main.Member.query.first():
+            raise SystemExit('Refusing to generate into a database that already has members')
+        return populate(main, seed=seed, **counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database', help='Path of the SQLite file to create')
+    parser.add_argument('--preset', choices=PRESETS, default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    for name in PRESETS['small']:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, help=f'Override the preset {name} count')
+    args = parser.parse_args()
+
+    counts = dict(PRESETS[args.preset])
+    counts.update({name: getattr(args, name) for name in counts if getattr(args, name) is not None})
+    if os.path.exists(args.database):
+        raise SystemExit(f'{args.database} already exists')
+
+    app = load_app(args.database)
+    for name, count in generate(app, seed=args.seed, **counts).items():
+        print(f'{name:<16}{count:>10}')
+
+
+if __name__ == '__main__':
+    main()
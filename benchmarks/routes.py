@@ -0,0 +1,282 @@
+"""Per-route latency percentiles and SQL statement counts against a synthetic dataset.
+
+Builds a database with benchmarks/dataset.py, then drives every route in main.py through
+Flask's test client: each iteration runs the read routes followed by a write sequence
+(create, book, unbook and edit a stay, bank, share, undo/redo, loans, guests, import). Results
+can be stored as a baseline per preset; --check compares against it and exits 1 when a
+route issues more SQL statements or starts failing. Latency is compared relative to the
+run's overall speed (the median p50 ratio to the baseline, so a slower machine is not a
+regression) and only reported, unless --strict-latency makes slower routes fail the check too.
+
+    python benchmarks/routes.py --preset medium --save-baseline
+    python benchmarks/routes.py --preset medium --check
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import dataset
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+class Context:
+    """Ids the request builders need, looked up outside the timed region"""
+
+    def __init__(self, main, seed):
+        self.main = main
+        self.rng = random.Random(seed)
+        with main.app.app_context():
+            self.use_year = main.get_use_year(main.date.today())
+            self.member_ids = [m.id for m in main.Member.query.all()]
+            self.guest_ids = [g.id for g in main.AdditionalGuest.query.all()]
+            self.stay_ids = [s.id for s in main.Stay.query.with_entities(main.Stay.id)]
+
+    def latest(self, model):
+        with self.main.app.app_context():
+            return self.main.db.session.query(self.main.func.max(model.id)).scalar()
+
+    def members(self, count=2):
+        return self.rng.sample(self.member_ids, min(count, len(self.member_ids)))
+
+    def stay_dates(self):
+        check_in = self.main.date(self.use_year, 9, 1) + self.main.timedelta(days=self.rng.randrange(300))
+        return check_in.isoformat(), (check_in + self.main.timedelta(days=3)).isoformat()
+
+
+def stay_payload(ctx):
+    check_in, check_out = ctx.stay_dates()
+    members = ctx.members()
+    return {'resort': 'Benchmark Villas', 'check_in': check_in, 'check_out': check_out,
+            'points_cost': len(members), 'status': 'planned',
+            'shares': [{'member_id': member_id, 'points': 1} for member_id in members]}
+
+
+def stay_form(ctx):
+    check_in, check_out = ctx.stay_dates()
+    members = ctx.members()
+    return {'resort': 'Benchmark Villas', 'check_in': check_in, 'check_out': check_out,
+            'points_cost': str(len(members)), 'status': 'planned',
+            'user_ids[]': [f'member_{member_id}' for member_id in members],
+            'point_shares[]': ['1'] * len(members)}
+
+
+def import_body(ctx):
+    lines = ['resort,check_in,check_out,points_cost,status,members']
+    with ctx.main.app.app_context():
+        names = [ctx.main.db.session.get(ctx.main.Member, member_id).name for member_id in ctx.members(1)]
+    for _ in range(5):
+        check_in, check_out = ctx.stay_dates()
+        lines.append(f'Imported Villas,{check_in},{check_out},1,planned,{names[0]}:1')
+    return '\n'.join(lines) + '\n'
+
+
+def edit_payload(ctx):
+    stay_id = ctx.latest(ctx.main.Stay)
+    with ctx.main.app.app_context():
+        stay = ctx.main.db.session.get(ctx.main.Stay, stay_id)
+        return f'/api/stays/{stay_id}', {'json': {
+            'check_in': stay.check_in.isoformat(), 'check_out': stay.check_out.isoformat(),
+            'members': [{'member_id': sm.member_id, 'points_share': sm.points_share} for sm in stay.members]
+        }}
+
+
+def transfer(ctx):
+    lender_id, borrower_id = ctx.members(2)
+    return {'lender_id': lender_id, 'borrower_id': borrower_id, 'points': 1, 'use_year': ctx.use_year}
+
+
+# (name, method, builder) where builder(ctx) returns (path, test client keyword arguments)
+READ_ROUTES = [
+    ('/', 'GET', lambda ctx: ('/', {})),
+    ('/point-sharing', 'GET', lambda ctx: ('/point-sharing', {})),
+    ('/activity', 'GET', lambda ctx: ('/activity', {})),
+    ('/guests', 'GET', lambda ctx: ('/guests', {})),
+    ('/stays/new', 'GET', lambda ctx: ('/stays/new', {})),
+    ('/stays/<id>/edit', 'GET', lambda ctx: (f'/stays/{ctx.rng.choice(ctx.stay_ids)}/edit', {})),
+    ('/bank_points/<member>/<year>', 'GET',
+     lambda ctx: (f'/bank_points/{ctx.members(1)[0]}/{ctx.use_year}', {})),
+    ('/api/members', 'GET', lambda ctx: ('/api/members', {})),
+    ('/api/stays', 'GET', lambda ctx: ('/api/stays', {})),
+    ('/api/stays?limit=100', 'GET', lambda ctx: ('/api/stays?limit=100', {})),
+    ('/api/stays?use_year', 'GET', lambda ctx: (f'/api/stays?use_year={ctx.use_year}', {})),
+    ('/api/stays/<id>', 'GET', lambda ctx: (f'/api/stays/{ctx.rng.choice(ctx.stay_ids)}', {})),
+    ('/api/activity_logs', 'GET', lambda ctx: ('/api/activity_logs', {})),
+    ('/api/activity_logs?archived=1', 'GET', lambda ctx: ('/api/activity_logs?archived=1', {})),
+    ('/api/activity_rollup', 'GET', lambda ctx: ('/api/activity_rollup', {})),
+    ('/api/balances', 'GET', lambda ctx: ('/api/balances', {})),
+    ('/api/ledger', 'GET', lambda ctx: ('/api/ledger', {})),
+    ('/api/projection', 'GET', lambda ctx: ('/api/projection?years=3', {})),
+    ('/api/point_balances', 'GET', lambda ctx: (f'/api/point_balances?use_year={ctx.use_year}', {})),
+    ('/api/settlements', 'GET', lambda ctx: (f'/api/settlements?use_year={ctx.use_year}', {})),
+    ('/export/stays.csv', 'GET', lambda ctx: ('/export/stays.csv', {})),
+    ('/export/activity.ndjson', 'GET', lambda ctx: ('/export/activity.ndjson', {})),
+    ('/metrics', 'GET', lambda ctx: ('/metrics', {})),
+]
+
+# Run in order: each write sets up state the next one uses (the stay just created is booked,
+# unbooked then edited, the share is undone and redone, the guest just added is removed)
+WRITE_ROUTES = [
+    ('POST /api/stays', 'POST', lambda ctx: ('/api/stays', {'json': stay_payload(ctx)})),
+    ('POST /api/stays/<id>/status', 'POST',
+     lambda ctx: (f'/api/stays/{ctx.latest(ctx.main.Stay)}/status', {'data': {'status': 'booked'}})),
+    ('POST /api/stays/bulk_status', 'POST',
+     lambda ctx: ('/api/stays/bulk_status', {'json': {'stay_ids': [ctx.latest(ctx.main.Stay)], 'status': 'planned'}})),
+    ('PUT /api/stays/<id>', 'PUT', edit_payload),
+    ('POST /stays/new', 'POST', lambda ctx: ('/stays/new', {'data': stay_form(ctx)})),
+    ('POST /bank_points', 'POST',
+     lambda ctx: (f'/bank_points/{ctx.members(1)[0]}/{ctx.use_year}', {'data': {'points_to_bank': 1}})),
+    ('POST /api/loans', 'POST', lambda ctx: ('/api/loans', {'json': transfer(ctx)})),
+    ('POST /api/guests', 'POST', lambda ctx: ('/api/guests', {'data': {'name': 'Benchmark Guest'}})),
+    ('POST /api/guests/<id>', 'POST',
+     lambda ctx: (f'/api/guests/{ctx.latest(ctx.main.AdditionalGuest)}', {})),
+    ('POST /api/points/share', 'POST', lambda ctx: ('/api/points/share', {'data': transfer(ctx)})),
+    ('POST /api/undo_last_action', 'POST', lambda ctx: ('/api/undo_last_action', {})),
+    ('POST /api/redo_last_action', 'POST', lambda ctx: ('/api/redo_last_action', {})),
+    ('POST /api/stays/import', 'POST',
+     lambda ctx: ('/api/stays/import?format=csv', {'data': import_body(ctx), 'content_type': 'text/csv'})),
+]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def run(main, iterations, seed):
+    """Time every route; returns {route: {'n', 'p50', 'p90', 'p99', 'max', 'statements', 'errors'}}"""
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    with main.app.app_context():
+        main.event.listen(main.db.engine, 'before_cursor_execute', count_statement)
+
+    client = main.app.test_client()
+    ctx = Context(main, seed)
+    samples = {name: {'latency': [], 'statements': [], 'errors': 0} for name, _, _ in READ_ROUTES + WRITE_ROUTES}
+
+    # The first iteration warms caches and is not recorded
+    for iteration in range(iterations + 1):
+        for name, method, build in READ_ROUTES + WRITE_ROUTES:
+            path, kwargs = build(ctx)
+            statements[0] = 0
+            started = time.perf_counter()
+            response = client.open(path, method=method, **kwargs)
+            response.get_data()  # Drain streamed bodies inside the timed region
+            elapsed = (time.perf_counter() - started) * 1000
+            response.close()
+            if not iteration:
+                continue
+            sample = samples[name]
+            sample['latency'].append(elapsed)
+            sample['statements'].append(statements[0])
+            if response.status_code >= 400:
+                sample['errors'] += 1
+
+    with main.app.app_context():
+        main.event.remove(main.db.engine, 'before_cursor_execute', count_statement)
+
+    return {name: {
+        'n': len(sample['latency']),
+        'p50': percentile(sample['latency'], 50),
+        'p90': percentile(sample['latency'], 90),
+        'p99': percentile(sample['latency'], 99),
+        'max': max(sample['latency']),
+        'statements': percentile(sample['statements'], 50),
+        'errors': sample['errors']
+    } for name, sample in samples.items()}
+
+
+def regressions(results, baseline):
+    """Describe every route that issues more SQL statements or fails more often than the baseline"""
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['statements'] > base['statements']:
+            problems.append(f"{name}: {result['statements']} statements (baseline {base['statements']})")
+        if result['errors'] > base['errors']:
+            problems.append(f"{name}: {result['errors']} failed requests (baseline {base['errors']})")
+    return problems
+
+
+def slowdowns(results, baseline, tolerance, min_delta_ms):
+    """Describe every route that got slower than the run as a whole, relative to the baseline.
+
+    Returns (machine speed factor, problems); the factor is the median p50 ratio over all routes."""
+    ratios = [result['p50'] / baseline[name]['p50'] for name, result in results.items()
+              if baseline.get(name, {}).get('p50')]
+    scale = percentile(ratios, 50) if ratios else 1.0
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ('p50', 'p90'):
+            expected = base[key] * scale
+            if result[key] > expected * (1 + tolerance) and result[key] - expected > min_delta_ms:
+                problems.append(f'{name}: {key} {result[key]:.1f}ms '
+                                f'(baseline {base[key]:.1f}ms, {expected:.1f}ms at this run\'s speed)')
+    return scale, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--preset', choices=dataset.PRESETS, default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--baseline', help='Baseline file (default: benchmarks/baselines/<preset>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit 1 if any route issues more SQL statements or fails; report slower routes')
+    parser.add_argument('--strict-latency', action='store_true', help='With --check, slower routes fail too')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed latency increase over the baseline scaled to this run\'s speed')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='Ignore latency changes below this')
+    args = parser.parse_args()
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f'{args.preset}.json')
+
+    with tempfile.TemporaryDirectory() as directory:
+        main_module = dataset.load_app(os.path.join(directory, 'bench.db'))
+        counts = dataset.generate(main_module, seed=args.seed, **dataset.PRESETS[args.preset])
+        results = run(main_module, args.iterations, args.seed)
+
+    print(f"preset {args.preset}: {counts['stays']} stays, {counts['activity']} activity rows, "
+          f'{args.iterations} iterations')
+    print(f"{'route':<32}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'sql':>6}{'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:<32}{result['p50']:>9.2f}{result['p90']:>9.2f}{result['p99']:>9.2f}"
+              f"{result['max']:>9.2f}{result['statements']:>6}{result['errors']:>8}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump({'preset': args.preset, 'iterations': args.iterations, 'routes': results}, f, indent=2)
+        print(f'Baseline saved to {baseline_path}')
+
+    if args.check:
+        if not os.path.exists(baseline_path):
+            raise SystemExit(f'No baseline at {baseline_path}; run with --save-baseline first')
+        with open(baseline_path) as f:
+            baseline = json.load(f)['routes']
+        problems = regressions(results, baseline)
+        scale, slower = slowdowns(results, baseline, args.tolerance, args.min_delta_ms)
+        print(f'This run is {scale:.2f}x the baseline\'s median latency')
+        for problem in problems:
+            print(f'REGRESSION {problem}')
+        for problem in slower:
+            print(f"{'REGRESSION' if args.strict_latency else 'SLOWER'} {problem}")
+        if problems or (slower and args.strict_latency):
+            sys.exit(1)
+        print('No regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
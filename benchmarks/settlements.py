@@ -0,0 +1,95 @@
+"""Latency of /api/settlements against a large synthetic history of point transfers.
+
+Builds a database with benchmarks/dataset.py holding only members, allocations and
+transfers (half loans, half point shares), then times the route through Flask's test
+client with the response cache off. The heap-based planner is also timed on its own,
+and so is netting by replaying every PointLoan and PointShare row, which is what the
+route would cost without the PointBalance matrix. Exits 1 when the route's p50 is over --max-ms.
+
+    python benchmarks/settlements.py --members 2000 --transfers 300000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import dataset
+from routes import percentile
+
+
+def timed(func, iterations):
+    """Run func iterations times; returns (milliseconds per run, last result)"""
+    samples, result = [], None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples, result
+
+
+def replay_nets(main):
+    """Net positions per use year from the full transfer history"""
+    nets = {}
+    for model in (main.PointLoan, main.PointShare):
+        for lender_id, borrower_id, use_year, points in main.db.session.query(
+            model.lender_id, model.borrower_id, model.use_year, model.points
+        ):
+            net = nets.setdefault(use_year, {})
+            net[lender_id] = net.get(lender_id, 0) + points
+            net[borrower_id] = net.get(borrower_id, 0) - points
+    return nets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--transfers', type=int, default=300000)
+    parser.add_argument('--use-years', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=1000, help='Fail when the route p50 is slower than this')
+    args = parser.parse_args()
+
+    os.environ['RESPONSE_CACHE_SIZE'] = '0'
+    with tempfile.TemporaryDirectory() as directory:
+        main_module = dataset.load_app(os.path.join(directory, 'bench.db'))
+        counts = dataset.generate(main_module, seed=args.seed, members=args.members, use_years=args.use_years,
+                                  stays=0, guests=0, guest_shares=0, activity=0,
+                                  loans=args.transfers // 2, shares=args.transfers - args.transfers // 2)
+        client = main_module.app.test_client()
+
+        route, response = timed(lambda: client.get('/api/settlements'), args.iterations)
+        if response.status_code != 200:
+            raise SystemExit(f'/api/settlements failed with status {response.status_code}')
+        plan = response.get_json()
+
+        with main_module.app.app_context():
+            nets = replay_nets(main_module)
+            planner, _ = timed(lambda: [main_module.plan_settlements(net) for net in nets.values()],
+                               args.iterations)
+            replay, _ = timed(lambda: replay_nets(main_module), max(1, args.iterations // 5))
+            pairs = main_module.PointBalance.query.count()
+
+    # The plan must settle exactly the positions the history adds up to
+    for year in plan:
+        net = dict(nets[year['use_year']])
+        for transfer in year['transfers']:
+            net[transfer['debtor_id']] += transfer['points']
+            net[transfer['creditor_id']] -= transfer['points']
+        if any(net.values()):
+            raise SystemExit(f"Plan for {year['use_year']} does not settle every member")
+
+    transfers = sum(len(year['transfers']) for year in plan)
+    print(f"{counts['members']} members, {counts['loans'] + counts['shares']} historical transfers, "
+          f"{pairs} member pairs, {len(plan)} use years -> {transfers} settlement transfers")
+    print(f"{'step':<34}{'p50 ms':>9}{'p90 ms':>9}{'max ms':>9}")
+    for name, samples in (('GET /api/settlements', route), ('plan_settlements (all years)', planner),
+                          ('netting by replaying history', replay)):
+        print(f'{name:<34}{percentile(samples, 50):>9.1f}{percentile(samples, 90):>9.1f}{max(samples):>9.1f}')
+
+    if percentile(route, 50) > args.max_ms:
+        raise SystemExit(f'GET /api/settlements p50 is over {args.max_ms:g}ms')
+
+
+if __name__ == '__main__':
+    main()
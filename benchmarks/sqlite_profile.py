@@ -0,0 +1,103 @@
+"""Compare read/write throughput of the SQLite engine profiles under concurrent workers.
+
+Each worker is a separate process (like a Gunicorn worker) with its own engine and
+connection pool, driving the Flask app through its test client against a shared
+database file. Writes record point loans (POST /api/loans); reads fetch balances and
+the activity log.
+
+    python benchmarks/sqlite_profile.py --workers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(database_path, profile):
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    os.environ['SQLITE_PROFILE'] = profile
+    sys.path.insert(0, ROOT)
+    import main
+    return main
+
+
+def setup_database(database_path, profile):
+    main = load_app(database_path, profile)
+    main.init_db()
+
+
+def run_worker(database_path, profile, seconds, write_ratio, seed, results):
+    main = load_app(database_path, profile)
+    client = main.app.test_client()
+    use_year = main.get_use_year(main.date.today())
+    rng = random.Random(seed)
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0, 'locked': 0}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if rng.random() < write_ratio:
+            lender, borrower = rng.sample([1, 2, 3], 2)
+            response = client.post('/api/loans', json={
+                'lender_id': lender, 'borrower_id': borrower, 'points': 1, 'use_year': use_year
+            })
+            kind = 'writes'
+        else:
+            response = client.get(rng.choice(['/api/balances', '/api/activity_logs?limit=50']))
+            kind = 'reads'
+
+        if response.status_code < 400:
+            counts[kind] += 1
+        else:
+            counts['errors'] += 1
+            if b'locked' in response.data:
+                counts['locked'] += 1
+    results.put(counts)
+
+
+def benchmark(profile, workers, seconds, write_ratio):
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, 'bench.db')
+        setup = context.Process(target=setup_database, args=(database_path, profile))
+        setup.start()
+        setup.join()
+
+        results = context.Queue()
+        processes = [
+            context.Process(target=run_worker, args=(database_path, profile, seconds, write_ratio, seed, results))
+            for seed in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        totals = {'reads': 0, 'writes': 0, 'errors': 0, 'locked': 0}
+        for _ in processes:
+            for key, value in results.get().items():
+                totals[key] += value
+        for process in processes:
+            process.join()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.3)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+    args = parser.parse_args()
+
+    print(f'{args.workers} workers, {args.seconds:g}s, {args.write_ratio:.0%} writes')
+    print(f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'errors':>8}{'locked':>8}")
+    for profile in args.profiles:
+        totals = benchmark(profile, args.workers, args.seconds, args.write_ratio)
+        print(f"{profile:<12}{totals['reads'] / args.seconds:>10.1f}{totals['writes'] / args.seconds:>10.1f}"
+              f"{totals['errors']:>8}{totals['locked']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,646 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, flash
+from flask import Flask, render_template, jsonify, request, redirect, url_for, flash, Response, stream_with_context, has_request_context, has_app_context, g, abort, send_from_directory, session
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from collections import OrderedDict, deque
+import asyncio
+import click
+import contextlib
+import cProfile
+import csv
+import functools
+import heapq
+import io
+import json
+import logging
+import math
 import os
+import pstats
 import re
-from sqlalchemy import func, extract
+import sqlite3
+import threading
+import time
+import migrations
+import numpy as np
+from sqlalchemy import create_engine, func, tuple_, inspect, event, insert, update, bindparam, select, union, values, column, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload, joinedload, validates
+from sqlalchemy.orm.exc import StaleDataError
+
+# SQLite connection profiles. 'default' leaves SQLite's own settings alone; 'production' is
+# tuned for several worker processes sharing one database file.
+SQLITE_PROFILES = {
+    'default': {
+        'pragmas': {},
+        'immediate_writes': False,
+    },
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',          # Readers no longer block the writer and vice versa
+            'synchronous': 'NORMAL',        # Safe with WAL, avoids an fsync per commit
+            'busy_timeout': 5000,           # Wait (ms) for the write lock instead of failing
+            'cache_size': -20000,           # Negative means KiB: 20 MB page cache per connection
+            'mmap_size': 268435456,         # Memory-map up to 256 MB of the database file
+            'temp_store': 'MEMORY',
+            'foreign_keys': 'ON',
+        },
+        # Take the write lock at BEGIN for write requests, so a read-then-write transaction
+        # waits for busy_timeout instead of failing when another worker commits first
+        'immediate_writes': True,
+    },
+}
+
+def request_stats():
+    """SQL counters of the request being served, or None outside a request"""
+    return g.get('request_stats') if has_request_context() else None
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Counts fetched rows, which SQLite does not report for SELECTs, for the metrics"""
+
+    def count(self, rows):
+        stats = request_stats()
+        if stats is not None:
+            stats['rows'] += rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self.count(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self.count(len(rows))
+        return rows
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
 
 app = Flask(__name__)
-app.secret_key = 'dev-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///dvc_points.db'
-db = SQLAlchemy(app)
+app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///dvc_points.db')
+app.config['SQLITE_PROFILE'] = os.environ.get('SQLITE_PROFILE', 'production')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    'pool_pre_ping': False,
+}
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] = {'factory': InstrumentedConnection}
+# Statements slower than this (ms) are logged with their query plan; 0 disables the log
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 0))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG')  # File path; default is stderr
+# What stay writes do when a member or guest would be in two overlapping stays: 'warn' or 'reject'
+app.config['STAY_OVERLAPS'] = os.environ.get('STAY_OVERLAPS', 'warn')
+# Multi-tenant mode: each contract (family) has its own SQLite file, TENANT_DIR/<tenant>.db
+app.config['TENANT_DIR'] = os.environ.get('TENANT_DIR')
+# Tenants this process serves (comma separated); by default every file in TENANT_DIR
+app.config['TENANTS'] = [name for name in os.environ.get('TENANTS', '').split(',') if name]
+# Tenant used by CLI commands and by requests that do not pick one
+app.config['DEFAULT_TENANT'] = os.environ.get('DEFAULT_TENANT')
+# Days of ActivityLog kept in the hot table; `flask activity-archive` moves older entries to the archive
+app.config['ACTIVITY_RETENTION_DAYS'] = int(os.environ.get('ACTIVITY_RETENTION_DAYS', 365))
+
+slow_query_log = logging.getLogger('dvc_points.slow_queries')
+if app.config['SLOW_QUERY_LOG']:
+    slow_query_log.addHandler(logging.FileHandler(app.config['SLOW_QUERY_LOG']))
+
+def sqlite_settings():
+    """Resolve the configured profile, applying any SQLITE_<PRAGMA> environment overrides"""
+    profile = SQLITE_PROFILES[app.config['SQLITE_PROFILE']]
+    pragmas = dict(profile['pragmas'])
+    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'foreign_keys'):
+        override = os.environ.get(f'SQLITE_{name.upper()}')
+        if override:
+            pragmas[name] = override
+    return pragmas, profile['immediate_writes']
+
+def current_tenant():
+    """Tenant whose database the current app context uses, or None in single-database mode"""
+    if not app.config['TENANT_DIR'] or not has_app_context():
+        return None
+    return g.get('tenant', app.config['DEFAULT_TENANT'])
+
+class TenantSQLAlchemy(SQLAlchemy):
+    """Points the default bind, and so db.session, db.engine and Model.query, at the current tenant"""
+
+    @property
+    def engines(self):
+        tenant = current_tenant()
+        if tenant is None:
+            return super().engines
+        return {None: tenant_engine(tenant)}
+
+db = TenantSQLAlchemy(app)
+
+def configure_sqlite_engine(engine):
+    pragmas, immediate_writes = sqlite_settings()
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself so the begin mode can be chosen per request
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(conn):
+        # Code running outside a Flask request marks its writes with the write_transaction option
+        write_request = conn.get_execution_options().get('write_transaction') or (
+            has_request_context() and request.method in ('POST', 'PUT', 'PATCH', 'DELETE'))
+        conn.exec_driver_sql('BEGIN IMMEDIATE' if immediate_writes and write_request else 'BEGIN')
+
+def explain_query_plan(cursor, statement, parameters, executemany):
+    """Ask SQLite how it runs a statement, on the statement's own connection"""
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    plan_cursor = cursor.connection.cursor(sqlite3.Cursor)
+    try:
+        rows = plan_cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    except sqlite3.Error as e:
+        return [f'(no plan: {e})']
+    finally:
+        plan_cursor.close()
+    return [detail for _, _, _, detail in rows]
+
+def instrument_engine(engine):
+    """Attribute statement counts, SQL time and transaction outcomes to the current request"""
+    explain = engine.dialect.name == 'sqlite'
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('statement_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def finish_statement(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['statement_start'].pop()
+        stats = request_stats()
+        if stats is None:
+            return
+        stats['statements'] += 1
+        stats['sql_seconds'] += elapsed
+        if executemany or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            stats['rows'] += max(cursor.rowcount, 0)
+
+        threshold = app.config['SLOW_QUERY_MS']
+        if threshold and elapsed * 1000 >= threshold:
+            stats['slow_queries'] += 1
+            plan = []
+            if explain and statement.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')):
+                plan = explain_query_plan(cursor, statement, parameters, executemany)
+            slow_query_log.warning(
+                'Slow query (%.1f ms) in %s %s: %s %.200r%s', elapsed * 1000, request.method, request.endpoint,
+                statement, parameters, ''.join(f'\n    {line}' for line in plan)
+            )
+
+    @event.listens_for(engine, 'commit')
+    def count_commit(conn):
+        stats = request_stats()
+        if stats is not None:
+            stats['commits'] += 1
+
+    @event.listens_for(engine, 'rollback')
+    def count_rollback(conn):
+        stats = request_stats()
+        if stats is not None:
+            stats['rollbacks'] += 1
+
+with app.app_context():
+    g.tenant = None  # The default engine; tenant engines are set up in tenant_engine()
+    if db.engine.dialect.name == 'sqlite':
+        configure_sqlite_engine(db.engine)
+    instrument_engine(db.engine)
+
+class RequestMetrics:
+    """Per-endpoint request and SQL metrics, rendered in the Prometheus text format.
+
+    Metrics are kept per process; with several workers each one serves its own /metrics
+    and Prometheus aggregates across the scraped instances.
+    """
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500)
+    COUNTERS = (
+        ('sql_statements_total', 'statements', 'SQL statements executed'),
+        ('sql_duration_seconds_total', 'sql_seconds', 'Time spent executing SQL statements'),
+        ('sql_rows_total', 'rows', 'Rows returned by queries or changed by writes'),
+        ('db_commits_total', 'commits', 'Committed transactions'),
+        ('db_rollbacks_total', 'rollbacks', 'Rolled back transactions'),
+        ('sql_slow_queries_total', 'slow_queries', 'Statements slower than SLOW_QUERY_MS'),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def observe(self, endpoint, method, status, seconds, stats):
+        with self.lock:
+            entry = self.endpoints.get((endpoint, method))
+            if entry is None:
+                entry = self.endpoints[(endpoint, method)] = {
+                    'status': {},
+                    'latency': [0] * (len(self.LATENCY_BUCKETS) + 1), 'latency_sum': 0.0,
+                    'per_request': [0] * (len(self.STATEMENT_BUCKETS) + 1),
+                    **{key: 0 for _, key, _ in self.COUNTERS}
+                }
+            entry['status'][status] = entry['status'].get(status, 0) + 1
+            entry['latency'][self.bucket_index(self.LATENCY_BUCKETS, seconds)] += 1
+            entry['latency_sum'] += seconds
+            entry['per_request'][self.bucket_index(self.STATEMENT_BUCKETS, stats['statements'])] += 1
+            for _, key, _ in self.COUNTERS:
+                entry[key] += stats[key]
+
+    @staticmethod
+    def bucket_index(buckets, value):
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                return index
+        return len(buckets)
+
+    @staticmethod
+    def labels(**labels):
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for value in labels.values())
+        return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+    def histogram(self, lines, name, buckets, counts, total, endpoint, method):
+        cumulative = 0
+        for bound, count in zip(buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{self.labels(endpoint=endpoint, method=method, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{self.labels(endpoint=endpoint, method=method)} {total}')
+        lines.append(f'{name}_count{self.labels(endpoint=endpoint, method=method)} {cumulative}')
+
+    def render(self):
+        with self.lock:
+            endpoints = sorted((key, dict(entry, status=dict(entry['status']),
+                                          latency=list(entry['latency']), per_request=list(entry['per_request'])))
+                               for key, entry in self.endpoints.items())
+
+        lines = ['# HELP dvc_http_requests_total Requests served, by response status',
+                 '# TYPE dvc_http_requests_total counter']
+        for (endpoint, method), entry in endpoints:
+            for status, count in sorted(entry['status'].items()):
+                lines.append(f'dvc_http_requests_total{self.labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+        lines += ['# HELP dvc_http_request_duration_seconds Request latency including streamed bodies',
+                  '# TYPE dvc_http_request_duration_seconds histogram']
+        for (endpoint, method), entry in endpoints:
+            self.histogram(lines, 'dvc_http_request_duration_seconds', self.LATENCY_BUCKETS,
+                           entry['latency'], entry['latency_sum'], endpoint, method)
+
+        lines += ['# HELP dvc_sql_statements_per_request SQL statements executed per request',
+                  '# TYPE dvc_sql_statements_per_request histogram']
+        for (endpoint, method), entry in endpoints:
+            self.histogram(lines, 'dvc_sql_statements_per_request', self.STATEMENT_BUCKETS,
+                           entry['per_request'], entry['statements'], endpoint, method)
+
+        for name, key, description in self.COUNTERS:
+            lines += [f'# HELP dvc_{name} {description}', f'# TYPE dvc_{name} counter']
+            for (endpoint, method), entry in endpoints:
+                lines.append(f'dvc_{name}{self.labels(endpoint=endpoint, method=method)} {entry[key]}')
+        return '\n'.join(lines) + '\n'
+
+metrics = RequestMetrics()
+
+def finish_request_stats(stats, endpoint, method, status):
+    if not stats['finished']:
+        stats['finished'] = True
+        metrics.observe(endpoint, method, status, time.perf_counter() - stats['start'], stats)
+
+@app.before_request
+def start_request_stats():
+    g.request_stats = {'start': time.perf_counter(), 'finished': False,
+                       **{key: 0 for _, key, _ in RequestMetrics.COUNTERS}}
+
+@app.after_request
+def record_request_metrics(response):
+    # The WSGI server closes the response once the body is sent, so the queries and time
+    # of streamed responses are included (teardown runs before streaming starts)
+    stats = request_stats()
+    if stats is not None:
+        endpoint, method, status = request.endpoint or 'unmatched', request.method, response.status_code
+        response.call_on_close(lambda: finish_request_stats(stats, endpoint, method, status))
+    return response
+
+@app.teardown_request
+def record_failed_request_metrics(error=None):
+    # Exceptions propagated past Flask's error handling never reach after_request
+    stats = request_stats()
+    if error is not None and stats is not None:
+        finish_request_stats(stats, request.endpoint or 'unmatched', request.method, 500)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    lines = []
+    for name, description in (('hits', 'Responses served from the response cache'),
+                              ('misses', 'Cacheable responses that had to be rendered'),
+                              ('evictions', 'Cached responses dropped by the size bound'),
+                              ('invalidations', 'Cache flushes caused by committed writes')):
+        lines += [f'# HELP dvc_response_cache_{name}_total {description}',
+                  f'# TYPE dvc_response_cache_{name}_total counter',
+                  f'dvc_response_cache_{name}_total {response_cache.stats()[name]}']
+    return Response(metrics.render() + '\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# Opt-in profiling: with PROFILING=1, requests sent with an X-Profile header or ?profile=1
+# run under cProfile and are saved to PROFILE_DIR. When disabled no hooks are installed.
+app.config['PROFILING'] = os.environ.get('PROFILING', '').lower() in ('1', 'true', 'yes')
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+PROFILES_KEPT = 100
+PROFILE_HOT_FUNCTIONS = 10
+
+def start_profiler():
+    if request.endpoint in ('list_profiles', 'download_profile'):
+        return
+    if request.headers.get('X-Profile') or request.args.get('profile', '').lower() in ('1', 'true', 'yes'):
+        g.profile_started = time.perf_counter()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+def attach_profiler(response):
+    # Keep profiling until the response is closed, so streamed bodies are included
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        details = profile_details(response.status_code)
+        started = g.profile_started
+        response.call_on_close(lambda: save_profile(profiler, time.perf_counter() - started, details))
+    return response
+
+def stop_failed_profiler(error=None):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        save_profile(profiler, time.perf_counter() - g.profile_started, profile_details(500))
+
+def profile_details(status):
+    return {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint or 'unmatched',
+        'status': status
+    }
+
+def save_profile(profiler, seconds, details):
+    """Write a .pstats dump plus a JSON summary of its hottest functions, keeping the newest"""
+    profiler.disable()
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.now()
+    name = f"{now:%Y%m%d-%H%M%S-%f}-{details['endpoint']}"
+    profiler.dump_stats(os.path.join(directory, f'{name}.pstats'))
+
+    # stats maps (file, line, function) to (primitive calls, calls, own time, cumulative time, callers)
+    hot = sorted(pstats.Stats(profiler).stats.items(), key=lambda item: item[1][2], reverse=True)
+    summary = dict(
+        details,
+        name=name,
+        timestamp=now.strftime('%Y-%m-%d %H:%M:%S'),
+        duration_ms=round(seconds * 1000, 2),
+        functions=[{
+            'function': f'{function} ({os.path.basename(file)}:{line})',
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3)
+        } for (file, line, function), (_, calls, own, cumulative, _) in hot[:PROFILE_HOT_FUNCTIONS]]
+    )
+    with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+        json.dump(summary, f)
+
+    summaries = sorted(entry for entry in os.listdir(directory) if entry.endswith('.json'))
+    for old in summaries[:-PROFILES_KEPT]:
+        for extension in ('.json', '.pstats'):
+            path = os.path.join(directory, old[:-len('.json')] + extension)
+            if os.path.exists(path):
+                os.remove(path)
+
+if app.config['PROFILING']:
+    app.before_request(start_profiler)
+    app.after_request(attach_profiler)
+    app.teardown_request(stop_failed_profiler)
+
+@app.route('/profiles')
+def list_profiles():
+    if not app.config['PROFILING']:
+        abort(404)
+    directory = app.config['PROFILE_DIR']
+    profiles = []
+    if os.path.isdir(directory):
+        for entry in sorted(os.listdir(directory), reverse=True):
+            if entry.endswith('.json'):
+                with open(os.path.join(directory, entry)) as f:
+                    profiles.append(json.load(f))
+    return render_template('profiles.html', profiles=profiles)
+
+@app.route('/profiles/<name>.pstats')
+def download_profile(name):
+    if not app.config['PROFILING']:
+        abort(404)
+    return send_from_directory(app.config['PROFILE_DIR'], f'{name}.pstats', as_attachment=True)
+
+# Rendered pages and JSON are cached until the next committed write; 0 disables the cache
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+WRITE_STATEMENT = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b', re.IGNORECASE)
+
+class ResponseCache:
+    """Size-bounded LRU of response bodies, valid for a single data version.
+
+    The version advances whenever a transaction that wrote anything commits in this
+    process, or when SQLite's PRAGMA data_version shows another connection (for example
+    another worker process) committed. Advancing it drops every cached response.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = 0
+        self.epoch = os.urandom(4).hex()  # Tells this process's versions apart from other workers'
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def bump(self):
+        with self.lock:
+            self.version += 1
+            self.invalidations += 1
+            self.entries.clear()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            # A write committed while this response was built: it may already be stale
+            if key[0] != self.version:
+                return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'version': self.version,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'])
+
+def invalidate_cache_on_commit(engine):
+    """Advance the cache version whenever a transaction that wrote something commits"""
+    @event.listens_for(engine, 'after_cursor_execute')
+    def note_write(conn, cursor, statement, parameters, context, executemany):
+        if WRITE_STATEMENT.match(statement):
+            conn.info['uncommitted_write'] = True
+
+    @event.listens_for(engine, 'commit')
+    def invalidate(conn):
+        if conn.info.pop('uncommitted_write', False):
+            response_cache.bump()
+
+    @event.listens_for(engine, 'rollback')
+    def forget_write(conn):
+        conn.info.pop('uncommitted_write', None)
+
+with app.app_context():
+    g.tenant = None
+    invalidate_cache_on_commit(db.engine)
+
+TENANT_NAME = re.compile(r'[a-z0-9][a-z0-9_-]{0,62}')
+tenant_engines = {}
+tenant_engines_lock = threading.Lock()
+
+def tenant_path(name):
+    return os.path.join(os.path.abspath(app.config['TENANT_DIR']), f'{name}.db')
+
+def is_tenant(name):
+    """Whether name is a tenant with a database file that this process serves"""
+    return bool(name) and TENANT_NAME.fullmatch(name) is not None \
+        and (not app.config['TENANTS'] or name in app.config['TENANTS']) \
+        and os.path.exists(tenant_path(name))
+
+def tenant_names():
+    directory = app.config['TENANT_DIR']
+    if not directory or not os.path.isdir(directory):
+        return []
+    return sorted(name for name, ext in map(os.path.splitext, os.listdir(directory))
+                  if ext == '.db' and is_tenant(name))
+
+def tenant_engine(name):
+    """Engine for a tenant's database file, set up like the default engine on first use"""
+    engine = tenant_engines.get(name)
+    if engine is None:
+        with tenant_engines_lock:
+            engine = tenant_engines.get(name)
+            if engine is None:
+                options = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], connect_args={'factory': InstrumentedConnection})
+                # mode=rw: a misspelt tenant fails to connect instead of creating an empty database
+                engine = create_engine(f'sqlite:///file:{tenant_path(name)}?mode=rw&uri=true', **options)
+                configure_sqlite_engine(engine)
+                instrument_engine(engine)
+                invalidate_cache_on_commit(engine)
+                tenant_engines[name] = engine
+    return engine
+
+@contextlib.contextmanager
+def tenant_context(name):
+    """App context using the given tenant's database (None: the default database or DEFAULT_TENANT)"""
+    with app.app_context():
+        if name is not None:
+            g.tenant = name
+        yield
+
+# Pages that work without a tenant: choosing one, and process-wide diagnostics
+TENANT_FREE_ENDPOINTS = {'list_tenants', 'choose_tenant', 'static', 'prometheus_metrics',
+                         'list_profiles', 'download_profile', 'cache_stats'}
+
+@app.before_request
+def select_tenant():
+    """Pick the tenant from the X-Tenant header, the tenant chosen in this browser session, or DEFAULT_TENANT"""
+    if not app.config['TENANT_DIR'] or request.endpoint in TENANT_FREE_ENDPOINTS:
+        return None
+    name = request.headers.get('X-Tenant') or session.get('tenant') or app.config['DEFAULT_TENANT']
+    if not is_tenant(name):
+        if request.path.startswith('/api/') or 'X-Tenant' in request.headers:
+            return jsonify({'error': 'Unknown or missing tenant; send an X-Tenant header'}), 400
+        return redirect(url_for('list_tenants'))
+    g.tenant = name
+
+@app.context_processor
+def inject_tenant():
+    return {'tenant': current_tenant()}
+
+@app.route('/tenants')
+def list_tenants():
+    if not app.config['TENANT_DIR']:
+        abort(404)
+    return render_template('tenants.html', tenants=tenant_names(), selected=session.get('tenant'))
+
+@app.route('/tenants/<name>')
+def choose_tenant(name):
+    if not app.config['TENANT_DIR'] or not is_tenant(name):
+        abort(404)
+    session['tenant'] = name
+    return redirect(url_for('home'))
+
+def data_version(connection=None):
+    """The cache version, first advanced if another connection committed since we last looked.
+
+    connection defaults to the Flask session's; the async tier passes its session's."""
+    if connection is None and db.engine.dialect.name == 'sqlite':
+        connection = db.session.connection()
+    if connection is not None and connection.dialect.name == 'sqlite':
+        seen = connection.exec_driver_sql('PRAGMA data_version').scalar()
+        # PRAGMA data_version is per connection, so remember it per pooled connection. A
+        # connection seen for the first time may have missed writes, so it invalidates too.
+        if connection.info.get('data_version') != seen:
+            connection.info['data_version'] = seen
+            response_cache.bump()
+    return response_cache.version
+
+def cached_response(view):
+    """Serve a view's rendered response from the cache until the next committed write"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # Pages showing flash messages consume them, so they are never cached or served cached
+        if not response_cache.max_entries or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        key = (data_version(), current_tenant(), request.endpoint, tuple(sorted(kwargs.items())),
+               tuple(sorted(request.args.items(multi=True))), date.today())
+        entry = response_cache.get(key)
+        if entry is not None:
+            body, status, content_type = entry
+            return Response(body, status=status, content_type=content_type, headers={'X-Cache': 'HIT'})
+
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            response_cache.put(key, (response.get_data(), response.status_code, response.content_type))
+            response.headers['X-Cache'] = 'MISS'
+        return response
+    return wrapper
+
+@app.route('/api/cache')
+def cache_stats():
+    return jsonify(response_cache.stats())
 
 class Contract(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -25,7 +657,35 @@ class PointAllocation(db.Model):
     member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
     use_year = db.Column(db.Integer, nullable=False)  # 2024
     points = db.Column(db.Integer, nullable=False)
-    is_banked = db.Column(db.Boolean, default=False)  # To track banked points
+    # Banked rows hold points banked into use_year from the year before, spendable alongside its regular points
+    is_banked = db.Column(db.Boolean, default=False)
+    version = db.Column(db.Integer, nullable=False, server_default='1')  # Bumped by every balance change
+
+    __table_args__ = (
+        db.Index('uq_point_allocation_member_year_banked', 'member_id', 'use_year', 'is_banked', unique=True),
+        db.Index('ix_point_allocation_use_year', 'use_year'),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
+class PointLedgerEntry(db.Model):
+    """Append-only record of every change to a PointAllocation balance"""
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    member_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
+    use_year = db.Column(db.Integer, nullable=False)
+    is_banked = db.Column(db.Boolean, nullable=False, default=False)
+    points = db.Column(db.Integer, nullable=False)  # Signed: positive credits, negative debits
+    entry_type = db.Column(db.String(50), nullable=False)  # 'allocation', 'stay_booked', 'points_banked', ...
+    stay_id = db.Column(db.Integer)  # No foreign key: audit rows outlive deleted stays
+    counterparty_id = db.Column(db.Integer, db.ForeignKey('member.id'))  # Other member in a transfer
+
+    member = db.relationship('Member', foreign_keys=[member_id])
+    counterparty = db.relationship('Member', foreign_keys=[counterparty_id])
+
+    __table_args__ = (
+        db.Index('ix_point_ledger_entry_balance', 'member_id', 'use_year', 'is_banked', 'id'),
+        db.Index('ix_point_ledger_entry_stay_id', 'stay_id'),
+    )
 
 class StayMember(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -34,19 +694,40 @@ class StayMember(db.Model):
     points_share = db.Column(db.Integer, nullable=False)  # Points allocated to this member
     member = db.relationship('Member', backref='stay_members', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_stay_member_stay_id', 'stay_id'),
+        db.Index('ix_stay_member_member_stay', 'member_id', 'stay_id'),
+    )
+
 class Stay(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     resort = db.Column(db.String(100), nullable=False)
     check_in = db.Column(db.Date, nullable=False)
     check_out = db.Column(db.Date, nullable=False)
+    use_year = db.Column(db.Integer, nullable=False, index=True)  # Derived from check_in
     points_cost = db.Column(db.Integer, nullable=False)
+    room_type = db.Column(db.String(100))  # Optional; points_cost is checked against its point chart
     status = db.Column(db.String(20), nullable=False)  # 'planned' or 'booked'
+    version = db.Column(db.Integer, nullable=False, server_default='1')  # Optimistic concurrency check
     members = db.relationship('StayMember', backref='stay', lazy=True)
     stay_guests = db.relationship('StayGuest', backref='stay', lazy=True)
     additional_guests = db.relationship('AdditionalGuest',
                                      secondary='stay_additional_guest',
                                      backref=db.backref('stays', lazy=True))
 
+    __table_args__ = (
+        db.Index('ix_stay_check_in_id', 'check_in', 'id'),
+        # Lets find_overlaps read the longest stay from the index instead of scanning
+        db.Index('ix_stay_nights', func.julianday(check_out) - func.julianday(check_in)),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
+    @validates('check_in')
+    def validate_check_in(self, key, check_in):
+        # Keep the persisted use year in step with every check-in write
+        self.use_year = get_use_year(check_in)
+        return check_in
+
 class ActivityLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -55,11 +736,53 @@ class ActivityLog(db.Model):
     member1_id = db.Column(db.Integer, db.ForeignKey('member.id'))
     member2_id = db.Column(db.Integer, db.ForeignKey('member.id'))
     stay_id = db.Column(db.Integer, db.ForeignKey('stay.id'))
+    undo_data = db.Column(db.JSON(none_as_null=True))  # How to reverse (and redo) the action; NULL if not undoable
+    undoes_id = db.Column(db.Integer, db.ForeignKey('activity_log.id'))  # Set on 'undo' entries
+    undone_by_id = db.Column(db.Integer, db.ForeignKey('activity_log.id'))  # The 'undo'/'redo' that reversed this
 
     member1 = db.relationship('Member', foreign_keys=[member1_id])
     member2 = db.relationship('Member', foreign_keys=[member2_id])
     stay = db.relationship('Stay', foreign_keys=[stay_id])
 
+    __table_args__ = (
+        db.Index('ix_activity_log_undone_by_id_id', 'undone_by_id', 'id'),
+        # Deleting (archiving) entries checks the undoes_id foreign key of every row
+        db.Index('ix_activity_log_undoes_id', 'undoes_id'),
+        db.Index('ix_activity_log_action_type_id', 'action_type', 'id'),
+        db.Index('ix_activity_log_timestamp', 'timestamp'),
+        db.Index('ix_activity_log_member1_id', 'member1_id'),
+        db.Index('ix_activity_log_member2_id', 'member2_id'),
+        db.Index('ix_activity_log_stay_id', 'stay_id'),
+    )
+
+class ActivityLogArchive(db.Model):
+    """ActivityLog entries older than the retention horizon, moved here by archive_activity() with their ids.
+
+    Nothing references archived rows, so there are no foreign keys; undo never reaches them."""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    action_type = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.String(500), nullable=False)
+    member1_id = db.Column(db.Integer)
+    member2_id = db.Column(db.Integer)
+    stay_id = db.Column(db.Integer)
+    undo_data = db.Column(db.JSON(none_as_null=True))
+    undoes_id = db.Column(db.Integer)
+    undone_by_id = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_activity_log_archive_timestamp', 'timestamp'),
+        db.Index('ix_activity_log_archive_member1_id', 'member1_id'),
+        db.Index('ix_activity_log_archive_member2_id', 'member2_id'),
+        db.Index('ix_activity_log_archive_stay_id', 'stay_id'),
+    )
+
+class ActivityRollup(db.Model):
+    """Archived ActivityLog entries counted per day (UTC) and action type"""
+    day = db.Column(db.Date, primary_key=True)
+    action_type = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+
 class PointLoan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lender_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
@@ -71,7 +794,15 @@ class PointLoan(db.Model):
     lender = db.relationship('Member', foreign_keys=[lender_id])
     borrower = db.relationship('Member', foreign_keys=[borrower_id])
 
+    __table_args__ = (
+        db.Index('ix_point_loan_lender_year', 'lender_id', 'use_year'),
+        db.Index('ix_point_loan_borrower_year', 'borrower_id', 'use_year'),
+    )
+
 class PointBalance(db.Model):
+    """Net points between two members in a use year, kept in step with every loan and transfer.
+
+    member1_id is the lower id of the pair; record_transfer() is the only writer."""
     id = db.Column(db.Integer, primary_key=True)
     member1_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
     member2_id = db.Column(db.Integer, db.ForeignKey('member.id'), nullable=False)
@@ -82,6 +813,13 @@ class PointBalance(db.Model):
     member1 = db.relationship('Member', foreign_keys=[member1_id])
     member2 = db.relationship('Member', foreign_keys=[member2_id])
 
+    __table_args__ = (
+        db.Index('uq_point_balance_pair_year', 'member1_id', 'member2_id', 'use_year', unique=True),
+        # Covering indexes: each member's side of the matrix sums per use year without a sort
+        db.Index('ix_point_balance_member1_sum', 'use_year', 'member1_id', 'points'),
+        db.Index('ix_point_balance_member2_sum', 'use_year', 'member2_id', 'points'),
+    )
+
 class AdditionalGuest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -92,30 +830,367 @@ stay_additional_guest = db.Table('stay_additional_guest',
     db.Column('guest_id', db.Integer, db.ForeignKey('additional_guest.id'), primary_key=True)
 )
 
+class EventBroker:
+    """In-process fan-out of change events to Server-Sent Events subscribers.
+
+    Events live in a bounded ring buffer with increasing sequence numbers. Subscribers only
+    remember the last sequence they sent, so an idle connection holds no queue of its own.
+    Flask's /api/events blocks a worker thread per subscriber in wait(); api.py serves the
+    same stream with wait_async(), where an idle subscriber is a suspended coroutine.
+    """
+    def __init__(self, history=1000):
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=history)
+        self.sequence = 0
+        self.async_waiters = set()  # (event loop, asyncio.Event) per waiting async subscriber
+
+    def publish(self, event_type, data, tenant=None):
+        with self.condition:
+            self.sequence += 1
+            self.events.append((self.sequence, event_type, data, tenant))
+            self.condition.notify_all()
+            waiters = list(self.async_waiters)
+        # Publishers run on worker threads as well as on the event loop
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:  # The loop has closed
+                pass
+
+    def collect(self, last_seen, tenant=None):
+        """(events, missed, sequence): the tenant's (sequence, type, data) events after last_seen,
+        whether some events already fell out of the buffer, and the sequence to resume after"""
+        with self.condition:
+            missed = bool(self.events) and self.events[0][0] > last_seen + 1
+            events = [e[:3] for e in self.events if e[0] > last_seen and e[3] == tenant]
+            return events, missed, self.sequence
+
+    def wait(self, last_seen, timeout, tenant=None):
+        """Block until there are events after last_seen or the timeout expires; returns collect()"""
+        with self.condition:
+            if self.sequence <= last_seen:
+                self.condition.wait(timeout)
+        return self.collect(last_seen, tenant)
+
+    async def wait_async(self, last_seen, timeout, tenant=None):
+        """Like wait(), but suspends the calling coroutine instead of blocking its thread"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self.condition:
+            idle = self.sequence <= last_seen
+            if idle:
+                self.async_waiters.add(waiter)
+        if idle:
+            try:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.condition:
+                    self.async_waiters.discard(waiter)
+        return self.collect(last_seen, tenant)
+
+broker = EventBroker()
+SSE_HEARTBEAT_SECONDS = 15
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def sse_cursor(last_event_id):
+    """(last_seen, stale) for a subscriber's Last-Event-ID header"""
+    try:
+        last_seen = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_seen = None
+    # A cursor from before a server restart can be ahead of the broker
+    stale = last_seen is not None and last_seen > broker.sequence
+    if last_seen is None or stale:
+        last_seen = broker.sequence
+    return last_seen, stale
+
+def sse_opening(last_seen, stale):
+    """First chunk of an event stream"""
+    return f'retry: 5000\nid: {last_seen}\n\n' + ('event: resync\ndata: {}\n\n' if stale else '')
+
+def sse_chunk(events, missed):
+    """One chunk of an event stream from a broker wait"""
+    # A client that fell behind the buffer should reload its state
+    chunk = 'event: resync\ndata: {}\n\n' if missed else ''
+    if not events:
+        chunk += ': keepalive\n\n'
+    for sequence, event_type, data in events:
+        chunk += f'id: {sequence}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+    return chunk
+
+@event.listens_for(Session, 'after_flush')
+def collect_change_events(session, flush_context):
+    """Remember activity and balance changes so they can be published once the transaction commits"""
+    activity = session.info.setdefault('pending_activity', [])
+    balances = session.info.setdefault('pending_balances', set())
+    for obj in session.new:
+        if isinstance(obj, ActivityLog):
+            activity.append({
+                'id': obj.id,
+                'action_type': obj.action_type,
+                'description': obj.description,
+                'member_ids': [m for m in (obj.member1_id, obj.member2_id) if m],
+                'stay_id': obj.stay_id
+            })
+        elif isinstance(obj, PointLedgerEntry):
+            balances.add((obj.member_id, obj.use_year))
+
+@event.listens_for(Session, 'after_commit')
+def publish_change_events(session):
+    # The async tier commits outside any Flask context, so its sessions carry their tenant
+    tenant = session.info['tenant'] if 'tenant' in session.info else current_tenant()
+    for data in session.info.pop('pending_activity', []):
+        broker.publish('activity', data, tenant)
+    balances = session.info.pop('pending_balances', None)
+    if balances:
+        broker.publish('balances', {
+            'changes': [{'member_id': m, 'use_year': y} for m, y in sorted(balances)]
+        }, tenant)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_change_events(session):
+    session.info.pop('pending_activity', None)
+    session.info.pop('pending_balances', None)
+
+@app.route('/api/events')
+def event_stream():
+    """Server-Sent Events; holds a worker thread per subscriber, so deployments serve it through api.py"""
+    last_seen, stale = sse_cursor(request.headers.get('Last-Event-ID'))
+    tenant = current_tenant()
+
+    def generate():
+        nonlocal last_seen
+        yield sse_opening(last_seen, stale)
+        while True:
+            events, missed, last_seen = broker.wait(last_seen, SSE_HEARTBEAT_SECONDS, tenant)
+            yield sse_chunk(events, missed)
+
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
 # Add these new routes:
+STAYS_BATCH_SIZE = 500  # Rows loaded per query when streaming the full stay list
+
+def serialize_stay(stay):
+    """Convert a stay (with members and guests already loaded) into a JSON-ready dict"""
+    return {
+        'id': stay.id,
+        'members': [{
+            'member_id': stay_member.member_id,
+            'name': stay_member.member.name,
+            'points_share': stay_member.points_share
+        } for stay_member in stay.members],
+        'guests': [{
+            'guest_id': stay_guest.guest_id,
+            'name': stay_guest.guest.name,
+            'member_points': {gp.member_id: gp.points for gp in stay_guest.member_points}
+        } for stay_guest in stay.stay_guests],
+        'resort': stay.resort,
+        'check_in': stay.check_in.strftime('%Y-%m-%d'),
+        'check_out': stay.check_out.strftime('%Y-%m-%d'),
+        'points_cost': stay.points_cost,
+        'room_type': stay.room_type,
+        'status': stay.status,
+        'version': stay.version
+    }
+
+def parse_stay_cursor(cursor):
+    """Parse a '<check_in>:<id>' keyset cursor as returned in X-Next-Cursor"""
+    check_in, stay_id = cursor.rsplit(':', 1)
+    return datetime.strptime(check_in, '%Y-%m-%d').date(), int(stay_id)
+
+def stay_load_options():
+    """Eager loads for everything serialize_stay touches"""
+    return (
+        selectinload(Stay.members).joinedload(StayMember.member),
+        selectinload(Stay.stay_guests).joinedload(StayGuest.guest),
+        selectinload(Stay.stay_guests).selectinload(StayGuest.member_points)
+    )
+
+def build_stays_query(use_year=None, status=None, member_id=None):
+    """Select stays ordered by (check_in, id) with members and guests eager-loaded.
+
+    Returns a plain select() so the async API tier (api.py) can run it on its own session."""
+    query = select(Stay).options(*stay_load_options())
+
+    if use_year is not None:
+        query = query.where(Stay.use_year == use_year)
+    if status:
+        query = query.where(Stay.status == status)
+    if member_id is not None:
+        query = query.where(Stay.members.any(StayMember.member_id == member_id))
+
+    return query.order_by(Stay.check_in, Stay.id)
+
+def stays_page_query(query, after=None, limit=STAYS_BATCH_SIZE):
+    """Restrict a stays query to one keyset page following the (check_in, id) cursor"""
+    if after:
+        query = query.where(tuple_(Stay.check_in, Stay.id) > after)
+    return query.limit(limit)
+
+def fetch_stays_page(query, after=None, limit=STAYS_BATCH_SIZE):
+    """Load one keyset page of stays following the (check_in, id) cursor"""
+    return db.session.scalars(stays_page_query(query, after, limit)).all()
+
 @app.route('/api/stays', methods=['GET'])
 def get_stays():
-    stays = Stay.query.all()
-    results = []
-    for stay in stays:
-        stay_members = []
-        for stay_member in stay.members:
-            member = Member.query.get(stay_member.member_id)
-            stay_members.append({
-                'name': member.name,
-                'points_share': stay_member.points_share
-            })
+    try:
+        use_year = request.args.get('use_year', type=int)
+        status = request.args.get('status')
+        member_id = request.args.get('member_id', type=int)
+        limit = request.args.get('limit', type=int)
+        after = request.args.get('after')
+        after = parse_stay_cursor(after) if after else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameters: {str(e)}'}), 400
+
+    if limit is not None and limit <= 0:
+        return jsonify({'error': 'limit must be positive'}), 400
+
+    query = build_stays_query(use_year=use_year, status=status, member_id=member_id)
+    headers = {}
+
+    if limit is not None:
+        # Single page: load one extra row to know whether there is a next page
+        stays = fetch_stays_page(query, after, limit + 1)
+        if len(stays) > limit:
+            stays = stays[:limit]
+            last = stays[-1]
+            headers['X-Next-Cursor'] = f"{last.check_in.strftime('%Y-%m-%d')}:{last.id}"
+        batches = iter([stays])
+    else:
+        # Full list: walk the keyset in fixed-size batches so memory stays flat
+        def iter_batches(cursor):
+            while True:
+                stays = fetch_stays_page(query, cursor)
+                if not stays:
+                    return
+                yield stays
+                if len(stays) < STAYS_BATCH_SIZE:
+                    return
+                cursor = (stays[-1].check_in, stays[-1].id)
+                db.session.expunge_all()
+        batches = iter_batches(after)
+
+    def generate():
+        yield '['
+        first = True
+        for stays in batches:
+            for stay in stays:
+                yield ('' if first else ',') + json.dumps(serialize_stay(stay))
+                first = False
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json', headers=headers)
+
+class OverlapError(ValueError):
+    pass
+
+def guest_links(stay_ids=None):
+    """(stay_id, guest_id) from both tables that attach guests to stays, optionally for some stays only"""
+    stay_guests = select(StayGuest.stay_id, StayGuest.guest_id)
+    additional_guests = select(stay_additional_guest.c.stay_id, stay_additional_guest.c.guest_id)
+    if stay_ids is not None:
+        stay_guests = stay_guests.where(StayGuest.stay_id.in_(stay_ids))
+        additional_guests = additional_guests.where(stay_additional_guest.c.stay_id.in_(stay_ids))
+    return union(stay_guests, additional_guests).subquery()
+
+def find_overlaps(stay):
+    """Other stays whose dates overlap a flushed stay and that share one of its members or guests.
+
+    Candidates come from a range on the check_in index: no stay that checked in more than the
+    longest stay's length before this one can still be running, so the scan covers only that
+    window instead of every earlier stay. Members and guests are then matched by stay id."""
+    longest = db.session.query(func.max(func.julianday(Stay.check_out) - func.julianday(Stay.check_in))).scalar()
+    earliest = stay.check_in - timedelta(days=math.ceil(longest or 0))
+    candidates = {
+        row.id: row for row in db.session.query(Stay.id, Stay.resort, Stay.check_in, Stay.check_out).filter(
+            Stay.check_in >= earliest, Stay.check_in < stay.check_out,
+            Stay.check_out > stay.check_in, Stay.id != stay.id
+        )
+    }
+    if not candidates:
+        return []
+
+    members = db.session.query(StayMember.stay_id, Member.id, Member.name)\
+        .join(Member, Member.id == StayMember.member_id)\
+        .filter(StayMember.stay_id.in_(candidates),
+                StayMember.member_id.in_(select(StayMember.member_id).where(StayMember.stay_id == stay.id)))
+    links, own_guests = guest_links(list(candidates)), guest_links([stay.id])
+    guests = db.session.query(links.c.stay_id, AdditionalGuest.id, AdditionalGuest.name)\
+        .join(AdditionalGuest, AdditionalGuest.id == links.c.guest_id)\
+        .filter(links.c.guest_id.in_(select(own_guests.c.guest_id)))
+
+    overlaps = [{
+        'stay_id': stay_id,
+        'resort': candidates[stay_id].resort,
+        'check_in': candidates[stay_id].check_in.strftime('%Y-%m-%d'),
+        'check_out': candidates[stay_id].check_out.strftime('%Y-%m-%d'),
+        key: person_id,
+        'name': name
+    } for key, rows in (('member_id', members), ('guest_id', guests))
+        for stay_id, person_id, name in rows.distinct()]
+    return sorted(overlaps, key=lambda o: (o['check_in'], o['stay_id']))
+
+def describe_overlaps(overlaps):
+    return 'Overlapping stays: ' + '; '.join(
+        f"{o['name']} at {o['resort']} {o['check_in']} to {o['check_out']} (stay {o['stay_id']})" for o in overlaps
+    )
 
-        results.append({
-            'id': stay.id,
-            'members': stay_members,
-            'resort': stay.resort,
-            'check_in': stay.check_in.strftime('%Y-%m-%d'),
-            'check_out': stay.check_out.strftime('%Y-%m-%d'),
-            'points_cost': stay.points_cost,
-            'status': stay.status
-        })
-    return jsonify(results)
+def check_overlaps(stay):
+    """Overlaps of a flushed stay, raising OverlapError if the STAY_OVERLAPS policy rejects them"""
+    overlaps = find_overlaps(stay)
+    if overlaps and app.config['STAY_OVERLAPS'] == 'reject':
+        raise OverlapError(describe_overlaps(overlaps))
+    return overlaps
+
+def sweep_overlaps(rows):
+    """Overlapping pairs among (person_id, stay_id, check_in, check_out) rows sorted by person and check-in.
+
+    Keeps the stays still running at each check-in in a heap keyed by check-out, so the pass
+    costs O((n + pairs) log n)."""
+    pairs = []
+    running, current = [], None
+    for person_id, stay_id, check_in, check_out in rows:
+        if person_id != current:
+            running, current = [], person_id
+        while running and running[0][0] <= check_in:
+            heapq.heappop(running)
+        for other_check_out, other_id in running:
+            pairs.append((person_id, other_id, stay_id, check_in, min(check_out, other_check_out)))
+        heapq.heappush(running, (check_out, stay_id))
+    return pairs
+
+@app.route('/api/conflicts')
+@cached_response
+def get_conflicts():
+    """All overlapping stays that share a member or guest, optionally within one use year"""
+    use_year = request.args.get('use_year', type=int)
+    links = guest_links()
+    sources = (
+        ('member_id', Member, db.session.query(StayMember.member_id, Stay.id, Stay.check_in, Stay.check_out)
+            .join(Stay, Stay.id == StayMember.stay_id)
+            .order_by(StayMember.member_id, Stay.check_in, Stay.id)),
+        ('guest_id', AdditionalGuest, db.session.query(links.c.guest_id, Stay.id, Stay.check_in, Stay.check_out)
+            .join(Stay, Stay.id == links.c.stay_id)
+            .order_by(links.c.guest_id, Stay.check_in, Stay.id)),
+    )
+
+    conflicts = []
+    for key, model, query in sources:
+        # A member who also pays for a guest has two stay_member rows for the same stay
+        query = query.distinct()
+        if use_year is not None:
+            query = query.filter(Stay.use_year == use_year)
+        names = dict(db.session.query(model.id, model.name))
+        conflicts.extend({
+            key: person_id,
+            'name': names.get(person_id),
+            'stay_ids': [first_id, second_id],
+            'overlap_start': start.strftime('%Y-%m-%d'),
+            'overlap_end': end.strftime('%Y-%m-%d')
+        } for person_id, first_id, second_id, start, end in sweep_overlaps(query))
+    return jsonify(conflicts)
 
 def validate_member_points(member_id, points_needed, is_banked=False):
     """Helper function to check if a member has enough points"""
@@ -128,6 +1203,411 @@ def validate_member_points(member_id, points_needed, is_banked=False):
     available_points = point_allocation.points if point_allocation else 0
     return available_points >= points_needed
 
+def get_allocation(member_id, use_year, is_banked=False):
+    """Look up the materialized balance row for a member, use year and bucket"""
+    return PointAllocation.query.filter_by(
+        member_id=member_id,
+        use_year=use_year,
+        is_banked=is_banked
+    ).first()
+
+class ConflictError(Exception):
+    """Another writer changed the rows this request depends on; the client should retry"""
+    pass
+
+def post_ledger_entry(member_id, use_year, points, entry_type, is_banked=False,
+                      stay_id=None, counterparty_id=None, require_available=False):
+    """Append a signed ledger entry and apply it to the member's balance in the same transaction.
+
+    The balance is changed with a single UPDATE so concurrent writers never overwrite each
+    other. With require_available a debit only applies while the balance still covers it,
+    otherwise ConflictError is raised."""
+    conditional = require_available and points < 0
+    statement = update(PointAllocation).where(
+        PointAllocation.member_id == member_id,
+        PointAllocation.use_year == use_year,
+        PointAllocation.is_banked == is_banked
+    ).values(
+        points=PointAllocation.points + points,
+        version=PointAllocation.version + 1
+    ).execution_options(synchronize_session='fetch')
+    if conditional:
+        statement = statement.where(PointAllocation.points >= -points)
+
+    if db.session.execute(statement).rowcount == 0:
+        if conditional:
+            raise ConflictError(
+                f'Member {member_id} no longer has {-points} {use_year} points available'
+            )
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(PointAllocation).values(
+                    member_id=member_id,
+                    use_year=use_year,
+                    points=points,
+                    is_banked=is_banked,
+                    version=1
+                ))
+        except IntegrityError:
+            raise ConflictError(f'Allocation for member {member_id} ({use_year}) was created concurrently')
+
+    db.session.add(PointLedgerEntry(
+        member_id=member_id,
+        use_year=use_year,
+        is_banked=is_banked,
+        points=points,
+        entry_type=entry_type,
+        stay_id=stay_id,
+        counterparty_id=counterparty_id
+    ))
+
+class InsufficientPointsError(ValueError):
+    pass
+
+# Lost races surface as either our own ConflictError or a failed version check on flush
+CONFLICT_ERRORS = (ConflictError, StaleDataError)
+
+def conflict_response(error):
+    db.session.rollback()
+    return jsonify({'error': f'Conflicting update, please retry: {error}'}), 409
+
+def check_version(obj, expected):
+    """Raise ConflictError if the client was working from an older version of obj"""
+    if expected not in (None, '') and int(expected) != obj.version:
+        raise ConflictError(f'{type(obj).__name__} {obj.id} is at version {obj.version}, not {expected}')
+
+def ledger_posting(member_id, use_year, points, is_banked=False, stay_id=None, counterparty_id=None):
+    """Describe a ledger change so it can be applied now and reversed or replayed later"""
+    return {
+        'member_id': member_id,
+        'use_year': use_year,
+        'points': points,
+        'is_banked': is_banked,
+        'stay_id': stay_id,
+        'counterparty_id': counterparty_id
+    }
+
+def apply_postings(postings, entry_type, sign=1):
+    """Post ledger postings (negated when sign is -1), refusing any that would overdraw a balance.
+
+    The up-front check gives a readable error; the conditional debit in post_ledger_entry
+    catches a concurrent writer spending the points in between. Debits from the same balance
+    (a member's own and guest shares of one stay) are checked together."""
+    debits = {}
+    for posting in postings:
+        points = sign * posting['points']
+        if points < 0:
+            key = (posting['member_id'], posting['use_year'], posting['is_banked'])
+            debits[key] = debits.get(key, 0) - points
+
+    for (member_id, use_year, is_banked), needed in debits.items():
+        allocation = get_allocation(member_id, use_year, is_banked)
+        available = allocation.points if allocation else 0
+        if available < needed:
+            bucket = 'banked' if is_banked else 'regular'
+            raise InsufficientPointsError(
+                f"Member {member_id} does not have enough {use_year} {bucket} points. "
+                f"Needed: {needed}, Available: {available}"
+            )
+
+    for posting in postings:
+        post_ledger_entry(
+            posting['member_id'], posting['use_year'], sign * posting['points'], entry_type,
+            is_banked=posting['is_banked'],
+            stay_id=posting['stay_id'],
+            counterparty_id=posting['counterparty_id'],
+            require_available=True
+        )
+
+def apply_postings_in_bulk(postings, entry_type):
+    """Set-based apply_postings for many postings at once.
+
+    Availability of every debited balance is checked with one grouped query, the balances
+    change with one UPDATE ... FROM a VALUES table, and the ledger entries are inserted as one
+    batch. As in post_ledger_entry, a debit only applies while the balance still covers it,
+    otherwise ConflictError is raised."""
+    changes = {}
+    for posting in postings:
+        key = (posting['member_id'], posting['use_year'], posting['is_banked'])
+        changes[key] = changes.get(key, 0) + posting['points']
+    changes = {key: points for key, points in changes.items() if points}
+    if not changes:
+        return
+
+    debits = [key for key, points in changes.items() if points < 0]
+    if debits:
+        balances = {(member_id, use_year, is_banked): points for member_id, use_year, is_banked, points in
+                    db.session.query(PointAllocation.member_id, PointAllocation.use_year,
+                                     PointAllocation.is_banked, PointAllocation.points)
+                    .filter(tuple_(PointAllocation.member_id, PointAllocation.use_year,
+                                   PointAllocation.is_banked).in_(debits))}
+        shortfalls = []
+        for member_id, use_year, is_banked in sorted(debits):
+            needed = -changes[member_id, use_year, is_banked]
+            available = balances.get((member_id, use_year, is_banked), 0)
+            if available < needed:
+                bucket = 'banked' if is_banked else 'regular'
+                shortfalls.append(f'Member {member_id} does not have enough {use_year} {bucket} points. '
+                                  f'Needed: {needed}, Available: {available}')
+        if shortfalls:
+            raise InsufficientPointsError('; '.join(shortfalls))
+
+    deltas = values(
+        column('member_id', db.Integer), column('use_year', db.Integer),
+        column('is_banked', db.Boolean), column('points', db.Integer),
+        name='deltas'
+    ).data([(*key, points) for key, points in changes.items()]).cte('deltas')
+    updated = db.session.execute(
+        update(PointAllocation).where(
+            PointAllocation.member_id == deltas.c.member_id,
+            PointAllocation.use_year == deltas.c.use_year,
+            PointAllocation.is_banked == deltas.c.is_banked,
+            or_(deltas.c.points > 0, PointAllocation.points >= -deltas.c.points)
+        ).values(
+            points=PointAllocation.points + deltas.c.points,
+            version=PointAllocation.version + 1
+        ).returning(PointAllocation.id).execution_options(synchronize_session=False)
+    ).all()
+    # Counted from RETURNING: sqlite3 reports no rowcount for a statement starting with WITH
+    if len(updated) != len(changes):
+        raise ConflictError('Point balances changed while they were being updated')
+
+    db.session.execute(insert(PointLedgerEntry), [dict(posting, entry_type=entry_type) for posting in postings])
+    # Core inserts bypass collect_change_events, so note the changed balances for it
+    db.session.info.setdefault('pending_balances', set()).update(
+        (posting['member_id'], posting['use_year']) for posting in postings
+    )
+
+def transfer_pair(lender_id, borrower_id, points):
+    """(member1_id, member2_id, owed): the PointBalance row a transfer lands in, and its change"""
+    member1_id, member2_id = sorted((lender_id, borrower_id))
+    return member1_id, member2_id, points if borrower_id == member1_id else -points
+
+def record_transfer(session, lender_id, borrower_id, points, use_year):
+    """Apply a transfer of points from lender to borrower to the pair's PointBalance row.
+
+    Call it in the transaction that inserts (or, with negated points, deletes) the PointLoan
+    or PointShare. The session is passed in so the async API tier can use it via run_sync."""
+    if lender_id == borrower_id or not points:
+        return
+    member1_id, member2_id, owed = transfer_pair(lender_id, borrower_id, points)
+    now = datetime.utcnow()
+    updated = session.execute(
+        update(PointBalance).where(
+            PointBalance.member1_id == member1_id,
+            PointBalance.member2_id == member2_id,
+            PointBalance.use_year == use_year
+        ).values(
+            points=PointBalance.points + owed,
+            timestamp=now
+        ).execution_options(synchronize_session='fetch')
+    ).rowcount
+
+    if updated == 0:
+        try:
+            with session.begin_nested():
+                session.execute(insert(PointBalance).values(
+                    member1_id=member1_id,
+                    member2_id=member2_id,
+                    use_year=use_year,
+                    points=owed,
+                    timestamp=now
+                ))
+        except IntegrityError:
+            raise ConflictError(f'Balance between members {member1_id} and {member2_id} ({use_year}) '
+                                f'was created concurrently')
+
+class PointChart(db.Model):
+    """Nightly points for one room type at one resort during a season (both dates inclusive)"""
+    id = db.Column(db.Integer, primary_key=True)
+    resort = db.Column(db.String(100), nullable=False)
+    room_type = db.Column(db.String(100), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    weekday_points = db.Column(db.Integer, nullable=False)  # Sunday through Thursday nights
+    weekend_points = db.Column(db.Integer, nullable=False)  # Friday and Saturday nights
+
+    __table_args__ = (
+        db.Index('ix_point_chart_resort_room_start', 'resort', 'room_type', 'start_date'),
+    )
+
+WEEKEND_NIGHTS = (4, 5)  # date.weekday() of Friday and Saturday
+
+class PointQuoter:
+    """Prices stays from the point charts with prefix sums.
+
+    For each (resort, room type, calendar year) it keeps cumulative[i], the points for the
+    first i nights of the year, and missing[i], how many of those nights no season covers.
+    A stay then costs cumulative[check_out] - cumulative[check_in] in each year it touches.
+    Tables are built on first use and dropped when the data version moves on.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.tables = {}
+
+    def table(self, version, resort, room_type, year):
+        key = (current_tenant(), resort, room_type, year)
+        with self.lock:
+            if version != self.version:
+                self.version, self.tables = version, {}
+            table = self.tables.get(key)
+        if table is None:
+            table = self.build(resort, room_type, year)
+            with self.lock:
+                if version == self.version:
+                    self.tables[key] = table
+        return table
+
+    def build(self, resort, room_type, year):
+        first, last = date(year, 1, 1), date(year, 12, 31)
+        costs = [None] * ((last - first).days + 1)
+        seasons = PointChart.query.filter(
+            PointChart.resort == resort,
+            PointChart.room_type == room_type,
+            PointChart.start_date <= last,
+            PointChart.end_date >= first
+        )
+        first_weekday = first.weekday()
+        for season in seasons:
+            start, end = max(season.start_date, first), min(season.end_date, last)
+            for night in range((start - first).days, (end - first).days + 1):
+                weekend = (first_weekday + night) % 7 in WEEKEND_NIGHTS
+                costs[night] = season.weekend_points if weekend else season.weekday_points
+
+        cumulative, missing = [0], [0]
+        for cost in costs:
+            cumulative.append(cumulative[-1] + (cost or 0))
+            missing.append(missing[-1] + (cost is None))
+        return cumulative, missing
+
+    def price(self, version, resort, room_type, check_in, check_out):
+        points, start = 0, check_in
+        while start < check_out:
+            year_start = date(start.year, 1, 1)
+            end = min(check_out, date(start.year + 1, 1, 1))
+            cumulative, missing = self.table(version, resort, room_type, start.year)
+            i, j = (start - year_start).days, (end - year_start).days
+            if missing[j] != missing[i]:
+                return None
+            points += cumulative[j] - cumulative[i]
+            start = end
+        return points
+
+    def quotes(self, stays):
+        """Points for each (resort, room_type, check_in, check_out), None where a night has no chart"""
+        version = data_version()
+        return [self.price(version, *stay) for stay in stays]
+
+    def quote(self, resort, room_type, check_in, check_out):
+        return self.quotes([(resort, room_type, check_in, check_out)])[0]
+
+point_quoter = PointQuoter()
+
+POINT_CHART_COLUMNS = ('resort', 'room_type', 'start_date', 'end_date', 'weekday_points', 'weekend_points')
+
+def load_point_chart(stream):
+    """Replace the chart of every resort and room type in a CSV upload. Returns (seasons, charts) loaded.
+
+    Columns: resort, room_type, start_date, end_date (inclusive), weekday_points, weekend_points."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+    charts = {}
+    for line, row in enumerate(reader, start=2):
+        try:
+            missing = [column for column in POINT_CHART_COLUMNS if not (row.get(column) or '').strip()]
+            if missing:
+                raise ValueError(f"Missing {', '.join(missing)}")
+            season = {
+                'resort': row['resort'].strip(),
+                'room_type': row['room_type'].strip(),
+                'start_date': datetime.strptime(row['start_date'].strip(), '%Y-%m-%d').date(),
+                'end_date': datetime.strptime(row['end_date'].strip(), '%Y-%m-%d').date(),
+                'weekday_points': int(row['weekday_points']),
+                'weekend_points': int(row['weekend_points'])
+            }
+            if season['end_date'] < season['start_date']:
+                raise ValueError('Season ends before it starts')
+            if season['weekday_points'] < 0 or season['weekend_points'] < 0:
+                raise ValueError('Points cannot be negative')
+        except ValueError as e:
+            raise ValueError(f'Line {line}: {str(e)}')
+        charts.setdefault((season['resort'], season['room_type']), []).append(season)
+
+    seasons = []
+    for (resort, room_type), chart in charts.items():
+        chart.sort(key=lambda season: season['start_date'])
+        for previous, season in zip(chart, chart[1:]):
+            if season['start_date'] <= previous['end_date']:
+                raise ValueError(f"{resort} {room_type}: season starting {season['start_date']} "
+                                 f"overlaps the one ending {previous['end_date']}")
+        PointChart.query.filter_by(resort=resort, room_type=room_type).delete()
+        seasons.extend(chart)
+
+    if seasons:
+        db.session.execute(insert(PointChart), seasons)
+    db.session.commit()
+    return len(seasons), len(charts)
+
+@app.cli.command('load-point-chart')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def load_point_chart_command(path):
+    """Load resort point charts from a CSV file, replacing the charts it contains"""
+    with open(path, 'rb') as f:
+        seasons, charts = load_point_chart(f)
+    print(f'Loaded {seasons} seasons for {charts} resort room types')
+
+QUOTE_MAX_RANGES = 1000
+
+@app.route('/api/quote', methods=['POST'])
+def quote_stays():
+    """Price candidate stays from the point charts.
+
+    Body: {"resort", "room_type", "ranges": [{"check_in", "check_out"}, ...]}; a range may
+    override resort and room_type. Points are null where the charts miss a night."""
+    data = request.get_json(silent=True) or {}
+    ranges = data.get('ranges')
+    if not isinstance(ranges, list) or not ranges:
+        return jsonify({'error': 'ranges must be a non-empty list'}), 400
+    if len(ranges) > QUOTE_MAX_RANGES:
+        return jsonify({'error': f'At most {QUOTE_MAX_RANGES} ranges per request'}), 400
+
+    stays = []
+    try:
+        for item in ranges:
+            resort = item.get('resort', data.get('resort'))
+            room_type = item.get('room_type', data.get('room_type'))
+            if not resort or not room_type:
+                raise ValueError('Missing resort or room_type')
+            check_in = datetime.strptime(item['check_in'], '%Y-%m-%d').date()
+            check_out = datetime.strptime(item['check_out'], '%Y-%m-%d').date()
+            if check_out <= check_in:
+                raise ValueError('Check-out date must be after check-in date')
+            stays.append((resort, room_type, check_in, check_out))
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid range: {str(e)}'}), 400
+
+    return jsonify({'quotes': [{
+        'resort': resort,
+        'room_type': room_type,
+        'check_in': check_in.strftime('%Y-%m-%d'),
+        'check_out': check_out.strftime('%Y-%m-%d'),
+        'nights': (check_out - check_in).days,
+        'points': points
+    } for (resort, room_type, check_in, check_out), points in zip(stays, point_quoter.quotes(stays))]})
+
+def chart_cost_error(stay):
+    """Why the stay's points_cost disagrees with its room type's point chart, or None.
+
+    Only checked when the stay has a room type and the chart covers every night."""
+    if not stay.room_type:
+        return None
+    quoted = point_quoter.quote(stay.resort, stay.room_type, stay.check_in, stay.check_out)
+    if quoted is not None and quoted != stay.points_cost:
+        return (f'Points cost {stay.points_cost} does not match the '
+                f'{stay.resort} {stay.room_type} point chart ({quoted} points)')
+    return None
+
 @app.route('/api/stays', methods=['POST'])
 def add_stay():
     try:
@@ -138,8 +1618,15 @@ def add_stay():
             check_in=datetime.strptime(data['check_in'], '%Y-%m-%d').date(),
             check_out=datetime.strptime(data['check_out'], '%Y-%m-%d').date(),
             points_cost=data['points_cost'],
+            room_type=data.get('room_type') or None,
             status=data['status']
         )
+
+        # Check the cost against the point chart when there is one for every night
+        chart_error = chart_cost_error(stay)
+        if chart_error:
+            return jsonify({'error': chart_error}), 400
+
         db.session.add(stay)
         db.session.flush()  # Get the stay ID
 
@@ -175,65 +1662,303 @@ def add_stay():
                 )
                 db.session.add(stay_member)
 
+        overlaps = check_overlaps(stay)
         db.session.commit()
-        return jsonify({'status': 'success'})
+        return jsonify({'status': 'success', 'overlaps': overlaps})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+STAY_STATUSES = ('planned', 'booked')
+
+def parse_import_lines(stream, file_format):
+    """Yield (line_number, row_dict, error) for each stay in a CSV or NDJSON upload.
+
+    CSV columns: resort, check_in, check_out, points_cost, status, members ("Brian:40;Rachel:20")
+    and guests ("Grammy:Brian:10;Grammy:Rachel:5"). NDJSON objects use the same keys with
+    members as {"Brian": 40} and guests as {"Grammy": {"Brian": 10}}."""
+    if file_format == 'csv':
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8', newline=''))
+        for line, row in enumerate(reader, start=2):
+            try:
+                members = {}
+                for item in filter(None, (row.get('members') or '').split(';')):
+                    name, points = item.rsplit(':', 1)
+                    members[name.strip()] = int(points)
+                guests = {}
+                for item in filter(None, (row.get('guests') or '').split(';')):
+                    guest, member, points = item.rsplit(':', 2)
+                    guests.setdefault(guest.strip(), {})[member.strip()] = int(points)
+                yield line, dict(row, members=members, guests=guests), None
+            except ValueError as e:
+                yield line, None, f'Invalid share list: {str(e)}'
+    else:
+        for line, raw in enumerate(stream, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                yield line, json.loads(raw), None
+            except ValueError as e:
+                yield line, None, f'Invalid JSON: {str(e)}'
+
+def validate_import_row(row):
+    """Normalize one imported stay, raising ValueError with a readable message if it is invalid"""
+    for field in ('resort', 'check_in', 'check_out', 'points_cost', 'status'):
+        if row.get(field) in (None, ''):
+            raise ValueError(f'Missing {field}')
+
+    check_in = datetime.strptime(str(row['check_in']), '%Y-%m-%d').date()
+    check_out = datetime.strptime(str(row['check_out']), '%Y-%m-%d').date()
+    if check_out <= check_in:
+        raise ValueError('Check-out date must be after check-in date')
+
+    points_cost = int(row['points_cost'])
+    if points_cost <= 0:
+        raise ValueError('Points cost must be greater than 0')
+
+    status = row['status']
+    if status not in STAY_STATUSES:
+        raise ValueError(f'Invalid status: {status}')
+
+    members = {name: int(points) for name, points in (row.get('members') or {}).items()}
+    guests = {
+        guest: {name: int(points) for name, points in member_points.items()}
+        for guest, member_points in (row.get('guests') or {}).items()
+    }
+    total = sum(members.values()) + sum(sum(mp.values()) for mp in guests.values())
+    if total != points_cost:
+        raise ValueError('Point shares must sum up to total points cost')
+    if any(points < 0 for points in members.values()) or \
+            any(points < 0 for mp in guests.values() for points in mp.values()):
+        raise ValueError('Point shares cannot be negative')
+
+    return {
+        'resort': row['resort'],
+        'check_in': check_in,
+        'check_out': check_out,
+        'use_year': get_use_year(check_in),
+        'points_cost': points_cost,
+        'status': status,
+        'members': members,
+        'guests': guests
+    }
+
+@app.route('/api/stays/import', methods=['POST'])
+def import_stays():
+    """Import stays from a CSV or NDJSON body (or 'file' upload) in a single transaction.
+
+    Invalid rows are reported and skipped; with ?atomic=1 any invalid row aborts the import."""
+    atomic = request.args.get('atomic', '').lower() in ('1', 'true', 'yes')
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    file_format = request.args.get('format')
+    if not file_format:
+        name = upload.filename if upload else ''
+        content_type = upload.content_type if upload else request.content_type
+        file_format = 'csv' if name.endswith('.csv') or 'csv' in (content_type or '') else 'ndjson'
+    if file_format not in ('csv', 'ndjson'):
+        return jsonify({'error': f'Unsupported format: {file_format}'}), 400
+
+    # Validate everything in memory before touching the database
+    rows, errors = [], []
+    for line, row, error in parse_import_lines(stream, file_format):
+        if error is None:
+            try:
+                rows.append((line, validate_import_row(row)))
+                continue
+            except (ValueError, TypeError, AttributeError) as e:
+                error = str(e)
+        errors.append({'row': line, 'error': error})
+
+    # Resolve every member and guest name with one query each
+    member_names = {name for _, row in rows for name in row['members']}
+    member_names |= {name for _, row in rows for mp in row['guests'].values() for name in mp}
+    guest_names = {guest for _, row in rows for guest in row['guests']}
+    member_ids = dict(db.session.query(Member.name, Member.id).filter(Member.name.in_(member_names)))
+    guest_ids = dict(db.session.query(AdditionalGuest.name, AdditionalGuest.id)
+                     .filter(AdditionalGuest.name.in_(guest_names)))
+
+    # Regular balances for booked stays, checked row by row against a running total
+    booked_keys = {(member_ids.get(name), row['use_year'])
+                   for _, row in rows if row['status'] == 'booked' for name in row['members']}
+    allocations = {}
+    if booked_keys:
+        for allocation_id, member_id, use_year, points in db.session.query(
+                PointAllocation.id, PointAllocation.member_id, PointAllocation.use_year, PointAllocation.points
+        ).filter(
+            PointAllocation.member_id.in_({m for m, _ in booked_keys}),
+            PointAllocation.use_year.in_({y for _, y in booked_keys}),
+            PointAllocation.is_banked == False
+        ):
+            allocations[(member_id, use_year)] = [allocation_id, points]
+
+    accepted = []
+    deductions = {}
+    for line, row in rows:
+        unknown = sorted({name for name in row['members'] if name not in member_ids} |
+                         {name for mp in row['guests'].values() for name in mp if name not in member_ids})
+        unknown_guests = sorted(guest for guest in row['guests'] if guest not in guest_ids)
+        if unknown or unknown_guests:
+            errors.append({'row': line, 'error': f"Unknown members: {', '.join(unknown)}" if unknown
+                           else f"Unknown guests: {', '.join(unknown_guests)}"})
+            continue
+
+        if row['status'] == 'booked':
+            needed = {}
+            for name, points in row['members'].items():
+                key = (member_ids[name], row['use_year'])
+                needed[key] = needed.get(key, 0) + points
+            short = [
+                key for key, points in needed.items()
+                if points and (key not in allocations or allocations[key][1] < points)
+            ]
+            if short:
+                member_id, use_year = short[0]
+                name = next(name for name, id_ in member_ids.items() if id_ == member_id)
+                errors.append({'row': line, 'error': f'{name} does not have enough {use_year} points'})
+                continue
+            for key, points in needed.items():
+                if points:
+                    allocations[key][1] -= points
+                    deductions[key] = deductions.get(key, 0) + points
+
+        accepted.append(row)
+
+    errors.sort(key=lambda e: e['row'])
+    if atomic and errors:
+        return jsonify({'error': 'Import aborted', 'imported': 0, 'errors': errors}), 400
+
+    try:
+        if accepted:
+            stay_ids = db.session.execute(
+                insert(Stay.__table__).returning(Stay.__table__.c.id, sort_by_parameter_order=True),
+                [{field: row[field] for field in
+                  ('resort', 'check_in', 'check_out', 'use_year', 'points_cost', 'status')}
+                 for row in accepted]
+            ).scalars().all()
+
+            stay_members, stay_guests, ledger_entries = [], [], []
+            for stay_id, row in zip(stay_ids, accepted):
+                for name, points in row['members'].items():
+                    stay_members.append({'stay_id': stay_id, 'member_id': member_ids[name], 'points_share': points})
+                    if row['status'] == 'booked' and points:
+                        ledger_entries.append({
+                            'timestamp': datetime.now(), 'member_id': member_ids[name],
+                            'use_year': row['use_year'], 'is_banked': False, 'points': -points,
+                            'entry_type': 'stay_booked', 'stay_id': stay_id, 'counterparty_id': None
+                        })
+                for guest in row['guests']:
+                    stay_guests.append({'stay_id': stay_id, 'guest_id': guest_ids[guest]})
+
+            if stay_members:
+                db.session.execute(insert(StayMember.__table__), stay_members)
+            if stay_guests:
+                stay_guest_ids = db.session.execute(
+                    insert(StayGuest.__table__).returning(StayGuest.__table__.c.id, sort_by_parameter_order=True),
+                    stay_guests
+                ).scalars().all()
+                db.session.execute(insert(stay_additional_guest), stay_guests)
+
+                guest_points = []
+                guest_rows = ((row, guest) for row in accepted for guest in row['guests'])
+                for stay_guest_id, (row, guest) in zip(stay_guest_ids, guest_rows):
+                    for name, points in row['guests'][guest].items():
+                        if points > 0:
+                            guest_points.append({'stay_guest_id': stay_guest_id,
+                                                 'member_id': member_ids[name], 'points': points})
+                if guest_points:
+                    db.session.execute(insert(GuestPoints.__table__), guest_points)
+
+            if ledger_entries:
+                db.session.execute(insert(PointLedgerEntry.__table__), ledger_entries)
+                # Conditional debits: a concurrent writer spending the same points fails the import
+                allocation_table = PointAllocation.__table__
+                updated = db.session.execute(
+                    update(allocation_table)
+                    .where(allocation_table.c.id == bindparam('allocation_id'),
+                           allocation_table.c.points >= bindparam('deduction'))
+                    .values(points=allocation_table.c.points - bindparam('deduction'),
+                            version=allocation_table.c.version + 1),
+                    [{'allocation_id': allocations[key][0], 'deduction': points}
+                     for key, points in deductions.items()]
+                ).rowcount
+                if updated != len(deductions):
+                    raise ConflictError('Point balances changed during the import')
+                db.session.info.setdefault('pending_balances', set()).update(deductions)
+
+        log = ActivityLog(
+            action_type='stays_imported',
+            description=f'Imported {len(accepted)} stays' +
+                        (f' ({len(errors)} rows rejected)' if errors else ''),
+            timestamp=datetime.now()
+        )
+        db.session.add(log)
+        db.session.commit()
+        return jsonify({'imported': len(accepted), 'errors': errors})
+    except CONFLICT_ERRORS as e:
+        return conflict_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/members')
+@cached_response
 def get_members():
     members = Member.query.all()
     return jsonify([{'id': m.id, 'name': m.name} for m in members])
 
 @app.route('/')
+@cached_response
 def home():
     current_year = get_use_year(date.today())
     members = Member.query.all()
     stays = Stay.query.order_by(Stay.check_in.desc()).all()
 
-    # Calculate points used for each member
-    points_used = {}
-    for member in members:
-        points_used[member.id] = calculate_points_used(member.id, current_year)
-
-    # Get point allocations for all members
-    point_allocations = {}
-    for member in members:
-        point_allocations[member.id] = {current_year: {}}
-
-        # Get regular points
-        regular = PointAllocation.query.filter_by(
-            member_id=member.id,
-            use_year=current_year,
-            is_banked=False
-        ).first()
-        point_allocations[member.id][current_year]['regular'] = regular
-
-        # Get banked points
-        banked = PointAllocation.query.filter_by(
-            member_id=member.id,
-            use_year=current_year,
-            is_banked=True
-        ).first()
-        point_allocations[member.id][current_year]['banked'] = banked
+    balances = get_balance_snapshot(use_years=[current_year])
 
     return render_template('index.html',
                          members=members,
                          stays=stays,
                          current_year=current_year,
-                         points_used=points_used,
-                         point_allocations=point_allocations)
+                         balances=balances)
+
+DEFAULT_USE_YEAR_START = 9  # September, for databases without a contract yet
+
+def use_year_start():
+    """Month the contract's use year starts in, read once per app context"""
+    if not has_app_context():
+        return DEFAULT_USE_YEAR_START
+    if 'use_year_start' not in g:
+        with db.session.no_autoflush:
+            g.use_year_start = db.session.query(Contract.use_year_start).order_by(Contract.id).limit(1).scalar() \
+                or DEFAULT_USE_YEAR_START
+    return g.use_year_start
 
 def get_use_year(date):
     """Helper function to determine the use year for a given date.
-    If the date is September 1st or later, it uses that year's points.
-    If the date is before September 1st, it uses the previous year's points."""
-    if date.month >= 9:  # September or later
+    If the date is on or after the first of the contract's use year month, it uses that year's points.
+    Otherwise it uses the previous year's points."""
+    if date.month >= use_year_start():
         return date.year
-    else:  # January through August
+    else:
         return date.year - 1
 
+def unbooking_refunds(stay_ids):
+    """Postings that give back whatever the ledger still holds against each stay, to the
+    member, use year and bucket it came from"""
+    refunds = db.session.query(
+        PointLedgerEntry.stay_id, PointLedgerEntry.member_id, PointLedgerEntry.use_year,
+        PointLedgerEntry.is_banked, func.sum(PointLedgerEntry.points)
+    ).filter(
+        PointLedgerEntry.stay_id.in_(stay_ids)
+    ).group_by(
+        PointLedgerEntry.stay_id, PointLedgerEntry.member_id, PointLedgerEntry.use_year,
+        PointLedgerEntry.is_banked
+    ).having(func.sum(PointLedgerEntry.points) != 0)
+    return [ledger_posting(member_id, use_year, -points, is_banked=is_banked, stay_id=stay_id)
+            for stay_id, member_id, use_year, is_banked, points in refunds]
+
 @app.route('/api/stays/<int:stay_id>/status', methods=['POST'])
 def update_stay_status(stay_id):
     try:
@@ -242,29 +1967,28 @@ def update_stay_status(stay_id):
 
         if new_status not in ['planned', 'booked']:
             return jsonify({'error': 'Invalid status'}), 400
+        check_version(stay, request.form.get('version'))
+
+        old_status = stay.status
+        if new_status == old_status:
+            return jsonify({'status': 'success', 'version': stay.version})
+        postings = []
 
         # If marking as booked, deduct points from members
         if new_status == 'booked':
             # Determine which use year's points to deduct based on check-in date
             use_year = get_use_year(stay.check_in)
 
+            # One posting per share; apply_postings checks a member's shares against their balance together
             for stay_member in stay.members:
-                # Get the member's point allocation
-                point_allocation = PointAllocation.query.filter_by(
-                    member_id=stay_member.member_id,
-                    use_year=use_year,
-                    is_banked=False
-                ).first()
-
-                if not point_allocation or point_allocation.points < stay_member.points_share:
-                    return jsonify({
-                        'error': f'{stay_member.member.name} does not have enough {use_year} points. ' +
-                                f'Needed: {stay_member.points_share}, ' +
-                                f'Available: {point_allocation.points if point_allocation else 0}'
-                    }), 400
+                postings.append(ledger_posting(stay_member.member_id, use_year,
+                                               -stay_member.points_share, stay_id=stay.id))
 
-                # Deduct the points
-                point_allocation.points -= stay_member.points_share
+            apply_postings(postings, 'stay_booked')
+        else:
+            # Unbooking refunds the booking, like the bulk route
+            postings = unbooking_refunds([stay.id])
+            apply_postings(postings, 'stay_unbooked')
 
         stay.status = new_status
 
@@ -276,12 +2000,105 @@ def update_stay_status(stay_id):
             description=f"Stay at {stay.resort} {new_status} for {', '.join(member_descriptions)}{use_year_str}",
             member1_id=stay.members[0].member_id if stay.members else None,
             member2_id=stay.members[1].member_id if len(stay.members) > 1 else None,
-            stay_id=stay.id
+            stay_id=stay.id,
+            undo_data={
+                'postings': postings,
+                'stay_status': {'stay_id': stay.id, 'from': old_status, 'to': new_status}
+            } if postings else None
         )
         db.session.add(log)
 
         db.session.commit()
-        return jsonify({'status': 'success'})
+        return jsonify({'status': 'success', 'version': stay.version})
+    except InsufficientPointsError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except CONFLICT_ERRORS as e:
+        return conflict_response(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+BULK_STATUS_MAX_STAYS = 1000
+
+@app.route('/api/stays/bulk_status', methods=['POST'])
+def bulk_update_stay_status():
+    """Book or unbook many stays in one all-or-nothing transaction.
+
+    Body: {"stay_ids": [...], "status": "booked" | "planned", "versions": {"<id>": version}}.
+    Booking deducts each member's share from their regular points for the stay's use year;
+    unbooking refunds what the ledger deducted for the stay. Stays already in the requested
+    status are left alone."""
+    data = request.get_json(silent=True) or {}
+    new_status = data.get('status')
+    stay_ids = data.get('stay_ids')
+    if new_status not in STAY_STATUSES:
+        return jsonify({'error': 'Invalid status'}), 400
+    if not isinstance(stay_ids, list) or not stay_ids:
+        return jsonify({'error': 'stay_ids must be a non-empty list'}), 400
+    if len(stay_ids) > BULK_STATUS_MAX_STAYS:
+        return jsonify({'error': f'At most {BULK_STATUS_MAX_STAYS} stays per request'}), 400
+
+    try:
+        stay_ids = {int(stay_id) for stay_id in stay_ids}
+        versions = data.get('versions') or {}
+        stays = Stay.query.options(
+            selectinload(Stay.members).joinedload(StayMember.member)
+        ).filter(Stay.id.in_(stay_ids)).order_by(Stay.id).all()
+        missing = stay_ids - {stay.id for stay in stays}
+        if missing:
+            return jsonify({'error': f"Stays not found: {', '.join(map(str, sorted(missing)))}"}), 404
+        for stay in stays:
+            check_version(stay, versions.get(str(stay.id)))
+
+        changed = [stay for stay in stays if stay.status != new_status]
+        new_versions = {str(stay.id): stay.version + (stay.status != new_status) for stay in stays}
+        if not changed:
+            return jsonify({'status': 'success', 'updated': [], 'versions': new_versions})
+
+        if new_status == 'booked':
+            postings = [
+                ledger_posting(stay_member.member_id, get_use_year(stay.check_in),
+                               -stay_member.points_share, stay_id=stay.id)
+                for stay in changed for stay_member in stay.members if stay_member.points_share
+            ]
+            apply_postings_in_bulk(postings, 'stay_booked')
+        else:
+            postings = unbooking_refunds([stay.id for stay in changed])
+            apply_postings_in_bulk(postings, 'stay_unbooked')
+
+        # One versioned UPDATE for every stay; a stay edited meanwhile makes the count come up short
+        updated = db.session.execute(
+            update(Stay).where(
+                tuple_(Stay.id, Stay.version).in_([(stay.id, stay.version) for stay in changed])
+            ).values(
+                status=new_status,
+                version=Stay.version + 1
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        if updated != len(changed):
+            raise ConflictError('Stays changed while their status was being updated')
+
+        names = [f"{stay.resort} ({stay.check_in.strftime('%Y-%m-%d')})" for stay in changed[:5]]
+        if len(changed) > 5:
+            names.append(f'{len(changed) - 5} more')
+        db.session.add(ActivityLog(
+            action_type='stay_booked' if new_status == 'booked' else 'stay_status_updated',
+            description=f"{len(changed)} stays {new_status}: {', '.join(names)}",
+            stay_id=changed[0].id if len(changed) == 1 else None,
+            undo_data={
+                'postings': postings,
+                'stay_statuses': [{'stay_id': stay.id, 'from': stay.status, 'to': new_status} for stay in changed]
+            }
+        ))
+
+        db.session.commit()
+        return jsonify({'status': 'success', 'updated': [stay.id for stay in changed], 'versions': new_versions})
+    except InsufficientPointsError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except CONFLICT_ERRORS as e:
+        return conflict_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -291,7 +2108,8 @@ def update_stay(stay_id):
     try:
         data = request.get_json()
         stay = Stay.query.get_or_404(stay_id)
-        old_use_year = stay.check_in.year
+        check_version(stay, data.get('version'))
+        old_use_year = stay.use_year
 
         # Store old point shares before updating
         old_point_shares = {
@@ -300,14 +2118,23 @@ def update_stay(stay_id):
         }
 
         # Update basic stay information
+        quoted_fields = (stay.resort, stay.room_type, stay.check_in, stay.check_out, stay.points_cost)
         stay.resort = data.get('resort', stay.resort)
-        stay.room_type = data.get('room_type', stay.room_type)
         stay.check_in = datetime.strptime(data['check_in'], '%Y-%m-%d').date()
         stay.check_out = datetime.strptime(data['check_out'], '%Y-%m-%d').date()
         stay.points_cost = data.get('points_cost', stay.points_cost)
+        if 'room_type' in data:
+            stay.room_type = data['room_type'] or None
         stay.status = data.get('status', stay.status)
 
-        new_use_year = stay.check_in.year
+        # Same point chart check as add_stay, whenever something it depends on changed
+        if (stay.resort, stay.room_type, stay.check_in, stay.check_out, stay.points_cost) != quoted_fields:
+            chart_error = chart_cost_error(stay)
+            if chart_error:
+                db.session.rollback()
+                return jsonify({'error': chart_error}), 400
+
+        new_use_year = stay.use_year
 
         # Delete existing member shares
         StayMember.query.filter_by(stay_id=stay_id).delete()
@@ -320,45 +2147,22 @@ def update_stay(stay_id):
             # Return old points to member's allocation if use year hasn't changed
             if member_id in old_point_shares and old_use_year == new_use_year:
                 old_points = old_point_shares[member_id]
-                allocation = PointAllocation.query.filter_by(
-                    member_id=member_id,
-                    use_year=old_use_year,
-                    is_banked=False
-                ).first()
-
-                if allocation:
-                    allocation.points += old_points  # Return old points
-                    allocation.points -= points      # Deduct new points
+                if old_points != points:
+                    post_ledger_entry(member_id, old_use_year, old_points - points,
+                                      'stay_updated', stay_id=stay_id)
 
             # If use year changed, handle both years
             elif member_id in old_point_shares:
                 # Return points to old year
-                old_allocation = PointAllocation.query.filter_by(
-                    member_id=member_id,
-                    use_year=old_use_year,
-                    is_banked=False
-                ).first()
-                if old_allocation:
-                    old_allocation.points += old_point_shares[member_id]
+                post_ledger_entry(member_id, old_use_year, old_point_shares[member_id],
+                                  'stay_updated', stay_id=stay_id)
 
                 # Deduct from new year
-                new_allocation = PointAllocation.query.filter_by(
-                    member_id=member_id,
-                    use_year=new_use_year,
-                    is_banked=False
-                ).first()
-                if new_allocation:
-                    new_allocation.points -= points
+                post_ledger_entry(member_id, new_use_year, -points, 'stay_updated', stay_id=stay_id)
 
             # If this is a new member share, just deduct new points
             else:
-                allocation = PointAllocation.query.filter_by(
-                    member_id=member_id,
-                    use_year=new_use_year,
-                    is_banked=False
-                ).first()
-                if allocation:
-                    allocation.points -= points
+                post_ledger_entry(member_id, new_use_year, -points, 'stay_updated', stay_id=stay_id)
 
             # Create new stay member record
             stay_member = StayMember(
@@ -376,12 +2180,18 @@ def update_stay(stay_id):
         )
         db.session.add(log)
 
+        overlaps = check_overlaps(stay)
         db.session.commit()
-        return jsonify({'message': 'Stay updated successfully'})
+        return jsonify({'message': 'Stay updated successfully', 'version': stay.version, 'overlaps': overlaps})
 
+    except CONFLICT_ERRORS as e:
+        return conflict_response(e)
+    except OverlapError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
-        print(f"Error updating stay: {str(e)}")  # Add debugging output
+        app.logger.exception('Error updating stay %s', stay_id)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/bank_points/<int:member_id>/<int:use_year>', methods=['GET', 'POST'])
@@ -392,46 +2202,33 @@ def bank_points(member_id, use_year):
             member = Member.query.get_or_404(member_id)
 
             # Get regular points allocation
-            regular_allocation = PointAllocation.query.filter_by(
-                member_id=member_id,
-                use_year=use_year,
-                is_banked=False
-            ).first()
-
-            # Get or create banked points allocation
-            banked_allocation = PointAllocation.query.filter_by(
-                member_id=member_id,
-                use_year=use_year,
-                is_banked=True
-            ).first()
-
-            if not banked_allocation:
-                banked_allocation = PointAllocation(
-                    member_id=member_id,
-                    use_year=use_year,
-                    points=0,
-                    is_banked=True
-                )
-                db.session.add(banked_allocation)
+            regular_allocation = get_allocation(member_id, use_year)
 
             if regular_allocation and points <= regular_allocation.points:
-                # Deduct from regular points
-                regular_allocation.points -= points
-                # Add to banked points
-                banked_allocation.points += points
+                # Move points from this use year's regular balance to the next year's banked one
+                postings = [
+                    ledger_posting(member_id, use_year, -points),
+                    ledger_posting(member_id, use_year + 1, points, is_banked=True)
+                ]
+                apply_postings(postings, 'points_banked')
 
                 # Log the activity
                 log_entry = ActivityLog(
                     action_type='points_banked',
                     description=f'{member.name} banked {points} points from {use_year}',
                     member1_id=member_id,
-                    timestamp=datetime.now()
+                    timestamp=datetime.now(),
+                    undo_data={'postings': postings}
                 )
                 db.session.add(log_entry)
                 db.session.commit()
 
                 return redirect(url_for('home'))  # Redirect to home
 
+        except CONFLICT_ERRORS as e:
+            db.session.rollback()
+            flash(f'Points changed while banking, please try again: {str(e)}', 'error')
+            return home(), 409
         except Exception as e:
             db.session.rollback()
             flash(f'Error banking points: {str(e)}', 'error')
@@ -450,176 +2247,240 @@ def manage_guests():
     guests = AdditionalGuest.query.all()
     return render_template('guests.html', guests=guests)
 
+class UndoError(Exception):
+    pass
+
+def snapshot_stay(stay):
+    """Capture a stay and its member and guest shares so it can be recreated by redo"""
+    return {
+        'resort': stay.resort,
+        'check_in': stay.check_in.strftime('%Y-%m-%d'),
+        'check_out': stay.check_out.strftime('%Y-%m-%d'),
+        'points_cost': stay.points_cost,
+        'room_type': stay.room_type,
+        'status': stay.status,
+        'members': [[sm.member_id, sm.points_share] for sm in stay.members],
+        'guests': [{
+            'guest_id': sg.guest_id,
+            'member_points': [[gp.member_id, gp.points] for gp in sg.member_points]
+        } for sg in stay.stay_guests],
+        'additional_guest_ids': [guest.id for guest in stay.additional_guests]
+    }
+
+def restore_stay(snapshot, stay_id=None):
+    stay = Stay(
+        resort=snapshot['resort'],
+        check_in=datetime.strptime(snapshot['check_in'], '%Y-%m-%d').date(),
+        check_out=datetime.strptime(snapshot['check_out'], '%Y-%m-%d').date(),
+        points_cost=snapshot['points_cost'],
+        room_type=snapshot.get('room_type'),
+        status=snapshot['status']
+    )
+    # Reuse the original id when it is still free so later redo steps still refer to this stay
+    if stay_id is not None and not Stay.query.get(stay_id):
+        stay.id = stay_id
+    db.session.add(stay)
+    db.session.flush()
+
+    for member_id, points in snapshot['members']:
+        db.session.add(StayMember(stay_id=stay.id, member_id=member_id, points_share=points))
+    for guest in snapshot['guests']:
+        stay_guest = StayGuest(stay_id=stay.id, guest_id=guest['guest_id'])
+        db.session.add(stay_guest)
+        db.session.flush()
+        for member_id, points in guest['member_points']:
+            db.session.add(GuestPoints(stay_guest_id=stay_guest.id, member_id=member_id, points=points))
+    if snapshot['additional_guest_ids']:
+        stay.additional_guests = AdditionalGuest.query.filter(
+            AdditionalGuest.id.in_(snapshot['additional_guest_ids'])
+        ).all()
+    return stay
+
+def remove_stay(stay_id):
+    stay = Stay.query.get(stay_id)
+    if not stay:
+        raise UndoError('Stay not found')
+    net_points = db.session.query(func.sum(PointLedgerEntry.points)).filter(
+        PointLedgerEntry.stay_id == stay_id
+    ).scalar()
+    if net_points:
+        raise UndoError('Stay still has points deducted for it; unbook it first')
+
+    stay_guest_ids = [sg.id for sg in stay.stay_guests]
+    if stay_guest_ids:
+        GuestPoints.query.filter(GuestPoints.stay_guest_id.in_(stay_guest_ids)).delete(synchronize_session=False)
+    StayGuest.query.filter_by(stay_id=stay_id).delete()
+    StayMember.query.filter_by(stay_id=stay_id).delete()
+    ActivityLog.query.filter_by(stay_id=stay_id).update({'stay_id': None})
+    ActivityLogArchive.query.filter_by(stay_id=stay_id).update({'stay_id': None})
+    stay.additional_guests = []
+    db.session.delete(stay)
+
+def apply_undo_data(undo_data, forward):
+    """Reverse an action (forward=False) or perform it again (forward=True).
+
+    Returns the undo data describing the re-performed action, with ids of recreated rows."""
+    undo_data = json.loads(json.dumps(undo_data))  # Work on a copy
+    entry_type = 'redo' if forward else 'undo'
+
+    status_changes = undo_data.get('stay_statuses', [])
+    if undo_data.get('stay_status'):
+        status_changes = [undo_data['stay_status']]
+    for status_change in status_changes:
+        stay = Stay.query.get(status_change['stay_id'])
+        if not stay:
+            raise UndoError('Stay not found')
+        expected = status_change['from'] if forward else status_change['to']
+        if stay.status != expected:
+            raise UndoError(f'Stay is not in {expected} status')
+        stay.status = status_change['to'] if forward else status_change['from']
+
+    apply_postings(undo_data.get('postings', []), entry_type, sign=1 if forward else -1)
+
+    for key, model in (('point_share', PointShare), ('point_loan', PointLoan)):
+        if key not in undo_data:
+            continue
+        transfer = undo_data[key]
+        if forward:
+            record = model(**transfer)
+            db.session.add(record)
+            db.session.flush()
+            undo_data[f'{key}_id'] = record.id
+        elif not model.query.filter_by(id=undo_data[f'{key}_id']).delete():
+            continue
+        record_transfer(db.session, transfer['lender_id'], transfer['borrower_id'],
+                        transfer['points'] if forward else -transfer['points'], transfer['use_year'])
+
+    if 'stay' in undo_data:
+        if forward:
+            undo_data['stay_id'] = restore_stay(undo_data['stay'], undo_data['stay_id']).id
+        else:
+            remove_stay(undo_data['stay_id'])
+
+    return undo_data
+
+def claim_action(action, reversal):
+    """Mark action as reversed by reversal unless a concurrent undo/redo already did"""
+    claimed = db.session.execute(
+        update(ActivityLog)
+        .where(ActivityLog.id == action.id, ActivityLog.undone_by_id.is_(None))
+        .values(undone_by_id=reversal.id)
+        .execution_options(synchronize_session='fetch')
+    ).rowcount
+    if not claimed:
+        raise ConflictError(f'Action {action.id} was already reversed')
+
+def undo_last():
+    """Reverse the newest action that has not been undone yet and commit"""
+    # The top of the undo stack is the newest action that has not been undone yet
+    last_action = ActivityLog.query.filter(
+        ActivityLog.undone_by_id.is_(None),
+        ActivityLog.action_type != 'undo'
+    ).order_by(ActivityLog.id.desc()).first()
+
+    if not last_action:
+        raise UndoError('No actions to undo')
+
+    if last_action.undo_data is None:
+        raise UndoError(f'Cannot undo action type: {last_action.action_type}')
+
+    apply_undo_data(last_action.undo_data, forward=False)
+    stay_id = None if 'stay' in last_action.undo_data else last_action.stay_id
+
+    # Log the undo action with timestamp reference
+    undo_log = ActivityLog(
+        action_type='undo',
+        description=f"Undid action: {last_action.description} (original timestamp: {last_action.timestamp})",
+        member1_id=last_action.member1_id,
+        member2_id=last_action.member2_id,
+        stay_id=stay_id,
+        undoes_id=last_action.id
+    )
+    db.session.add(undo_log)
+    db.session.flush()
+    claim_action(last_action, undo_log)
+    db.session.commit()
+
+def redo_last():
+    """Re-apply the newest undone action, unless a newer action discarded the redo stack, and commit"""
+    # The top of the redo stack is the newest undo that has not been redone
+    last_undo = ActivityLog.query.filter(
+        ActivityLog.action_type == 'undo',
+        ActivityLog.undone_by_id.is_(None),
+        ActivityLog.undoes_id.isnot(None)
+    ).order_by(ActivityLog.id.desc()).first()
+
+    if not last_undo:
+        raise UndoError('No actions to redo')
+
+    # Any new undoable action after the undo discards the redo stack
+    newer_action = ActivityLog.query.filter(
+        ActivityLog.id > last_undo.id,
+        ActivityLog.undo_data.isnot(None),
+        ActivityLog.action_type != 'redo'
+    ).first()
+    if newer_action:
+        raise UndoError('No actions to redo')
+
+    original = ActivityLog.query.get(last_undo.undoes_id)
+    undo_data = apply_undo_data(original.undo_data, forward=True)
+
+    redo_log = ActivityLog(
+        action_type='redo',
+        description=f'Redid action: {original.description}',
+        member1_id=original.member1_id,
+        member2_id=original.member2_id,
+        stay_id=undo_data.get('stay_id', original.stay_id),
+        undo_data=undo_data
+    )
+    db.session.add(redo_log)
+    db.session.flush()
+    claim_action(last_undo, redo_log)
+    db.session.commit()
+
 @app.route('/api/undo_last_action', methods=['POST'])
 def undo_last_action():
     try:
-        # Skip past any 'undo' actions to find the last real action
-        last_action = ActivityLog.query.filter(
-            ActivityLog.action_type != 'undo'
-        ).order_by(ActivityLog.id.desc()).first()
-
-        if not last_action:
-            return jsonify({'error': 'No actions to undo'}), 400
-
-        # Check if this action has already been undone
-        already_undone = ActivityLog.query.filter(
-            ActivityLog.action_type == 'undo',
-            ActivityLog.description.like(f'Undid action: {last_action.description}%')
-        ).first()
-
-        if already_undone:
-            return jsonify({'error': 'This action has already been undone'}), 400
-
-        if last_action.action_type == 'points_banked':
-            member = Member.query.get(last_action.member1_id)
-            if not member:
-                return jsonify({'error': 'Member not found'}), 400
-
-            current_year = get_use_year(date.today())
-
-            regular_points = PointAllocation.query.filter_by(
-                member_id=member.id,
-                use_year=current_year,
-                is_banked=False
-            ).first()
-
-            banked_points = PointAllocation.query.filter_by(
-                member_id=member.id,
-                use_year=current_year,
-                is_banked=True
-            ).first()
-
-            if not banked_points:
-                return jsonify({'error': 'Banked points allocation not found'}), 400
-
-            try:
-                points_amount = int(last_action.description.split(' banked ')[1].split(' points')[0])
-            except (IndexError, ValueError):
-                return jsonify({'error': 'Invalid action description format'}), 400
-
-            # Verify banked points has enough points to return
-            if banked_points.points < points_amount:
-                return jsonify({'error': 'Not enough banked points to undo this action'}), 400
-
-            if not regular_points:
-                regular_points = PointAllocation(
-                    member_id=member.id,
-                    use_year=current_year,
-                    points=0,
-                    is_banked=False
-                )
-                db.session.add(regular_points)
-
-            regular_points.points += points_amount
-            banked_points.points -= points_amount
-
-        elif last_action.action_type == 'stay_booked':
-            stay = Stay.query.get(last_action.stay_id)
-            if not stay:
-                return jsonify({'error': 'Stay not found'}), 400
-
-            if stay.status != 'booked':
-                return jsonify({'error': 'Stay is not in booked status'}), 400
-
-            stay.status = 'planned'
-
-            # Return points to members
-            use_year = get_use_year(stay.check_in)
-            for stay_member in stay.members:
-                point_allocation = PointAllocation.query.filter_by(
-                    member_id=stay_member.member_id,
-                    use_year=use_year,
-                    is_banked=False
-                ).first()
-
-                if not point_allocation:
-                    point_allocation = PointAllocation(
-                        member_id=stay_member.member_id,
-                        use_year=use_year,
-                        points=0,
-                        is_banked=False
-                    )
-                    db.session.add(point_allocation)
-
-                point_allocation.points += stay_member.points_share
-
-        elif last_action.action_type == 'stay_created':
-            stay = Stay.query.get(last_action.stay_id)
-            if not stay:
-                return jsonify({'error': 'Stay not found'}), 400
-
-            # If stay was booked, return points first
-            if stay.status == 'booked':
-                use_year = get_use_year(stay.check_in)
-                for stay_member in stay.members:
-                    point_allocation = PointAllocation.query.filter_by(
-                        member_id=stay_member.member_id,
-                        use_year=use_year,
-                        is_banked=False
-                    ).first()
-
-                    if point_allocation:
-                        point_allocation.points += stay_member.points_share
-
-            # Remove guest associations
-            stay.additional_guests = []
-
-            # Delete associated stay members
-            StayMember.query.filter_by(stay_id=stay.id).delete()
-            db.session.delete(stay)
-
-        else:
-            return jsonify({'error': f'Cannot undo action type: {last_action.action_type}'}), 400
-
-        # Log the undo action with timestamp reference
-        undo_log = ActivityLog(
-            action_type='undo',
-            description=f"Undid action: {last_action.description} (original timestamp: {last_action.timestamp})",
-            member1_id=last_action.member1_id,
-            member2_id=last_action.member2_id,
-            stay_id=last_action.stay_id
-        )
-        db.session.add(undo_log)
-        db.session.commit()
+        undo_last()
+        return jsonify({'status': 'success'})
+    except CONFLICT_ERRORS as e:
+        return conflict_response(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
 
+@app.route('/api/redo_last_action', methods=['POST'])
+def redo_last_action():
+    try:
+        redo_last()
         return jsonify({'status': 'success'})
+    except CONFLICT_ERRORS as e:
+        return conflict_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/stays/<int:stay_id>', methods=['GET'])
 def get_stay(stay_id):
-    stay = Stay.query.get_or_404(stay_id)
-
-    # Get guest point allocations
-    stay.guest_points = {}
-    for guest in stay.additional_guests:
-        guest_points = GuestPoints.query.filter_by(
-            stay_id=stay.id,
-            guest_id=guest.id
-        ).all()
-
-        stay.guest_points[guest.id] = {
-            'total': sum(gp.points for gp in guest_points),
-            **{gp.member_id: gp.points for gp in guest_points}
-        }
-
-    return jsonify(stay.to_dict())
+    stay = Stay.query.options(*stay_load_options()).get_or_404(stay_id)
+    return jsonify(serialize_stay(stay))
 
 @app.route('/stays/new', methods=['GET', 'POST'])
 def new_stay():
     if request.method == 'POST':
         try:
-            print("Form data received:", request.form)  # Debug print
-
             # Create new stay
             stay = Stay(
                 resort=request.form['resort'],
-                check_in=datetime.strptime(request.form['check_in'], '%Y-%m-%d'),
-                check_out=datetime.strptime(request.form['check_out'], '%Y-%m-%d'),
+                check_in=datetime.strptime(request.form['check_in'], '%Y-%m-%d').date(),
+                check_out=datetime.strptime(request.form['check_out'], '%Y-%m-%d').date(),
                 points_cost=int(request.form['points_cost']),
+                room_type=request.form.get('room_type') or None,
                 status=request.form['status']
             )
+            chart_error = chart_cost_error(stay)
+            if chart_error:
+                raise ValueError(chart_error)
             db.session.add(stay)
             db.session.flush()  # Get the stay ID
 
@@ -680,22 +2541,28 @@ def new_stay():
                         stay.additional_guests.append(guest)
 
             # Log the activity
+            db.session.flush()
+            db.session.refresh(stay)
             log_entry = ActivityLog(
                 action_type='create_stay',
                 description=f'Created stay at {stay.resort}',
                 stay_id=stay.id,
-                timestamp=datetime.now()
+                timestamp=datetime.now(),
+                undo_data={'stay': snapshot_stay(stay), 'stay_id': stay.id}
             )
             db.session.add(log_entry)
 
+            overlaps = check_overlaps(stay)
             db.session.commit()
             flash('Stay created successfully', 'success')
+            if overlaps:
+                flash(describe_overlaps(overlaps), 'warning')
             return redirect(url_for('home'))
 
         except Exception as e:
             db.session.rollback()
             flash(f'Error creating stay: {str(e)}', 'error')
-            print(f"Error details: {str(e)}")  # Debug print
+            app.logger.exception('Error creating stay')
             return redirect(url_for('home'))
 
     # GET request - show the form
@@ -716,14 +2583,23 @@ def edit_stay(stay_id):
     if request.method == 'POST':
         try:
             # Update stay details
+            quoted_fields = (stay.resort, stay.room_type, stay.check_in, stay.check_out, stay.points_cost)
             stay.resort = request.form['resort']
-            stay.check_in = datetime.strptime(request.form['check_in'], '%Y-%m-%d')
-            stay.check_out = datetime.strptime(request.form['check_out'], '%Y-%m-%d')
+            stay.check_in = datetime.strptime(request.form['check_in'], '%Y-%m-%d').date()
+            stay.check_out = datetime.strptime(request.form['check_out'], '%Y-%m-%d').date()
             stay.points_cost = int(request.form['points_cost'])
+            stay.room_type = request.form.get('room_type') or None
             stay.status = request.form['status']
+            if (stay.resort, stay.room_type, stay.check_in, stay.check_out, stay.points_cost) != quoted_fields:
+                chart_error = chart_cost_error(stay)
+                if chart_error:
+                    raise ValueError(chart_error)
 
             # Clear existing relationships
             StayMember.query.filter_by(stay_id=stay_id).delete()
+            stay_guest_ids = [sg.id for sg in stay.stay_guests]
+            if stay_guest_ids:
+                GuestPoints.query.filter(GuestPoints.stay_guest_id.in_(stay_guest_ids)).delete(synchronize_session=False)
             StayGuest.query.filter_by(stay_id=stay_id).delete()
 
             # Handle member point shares
@@ -776,8 +2652,11 @@ def edit_stay(stay_id):
             )
             db.session.add(log_entry)
 
+            overlaps = check_overlaps(stay)
             db.session.commit()
             flash('Stay updated successfully', 'success')
+            if overlaps:
+                flash(describe_overlaps(overlaps), 'warning')
             return redirect(url_for('home'))
 
         except Exception as e:
@@ -790,7 +2669,7 @@ def edit_stay(stay_id):
     additional_guests = AdditionalGuest.query.all()
 
     # Get existing member point shares
-    stay_members = {sm.member_id: sm.points_share for sm in stay.stay_members}
+    stay_members = {sm.member_id: sm for sm in stay.members}
 
     # Get existing guest data
     stay_guests = {}
@@ -803,12 +2682,6 @@ def edit_stay(stay_id):
         for member_point in stay_guest.member_points:
             guest_points[stay_guest.guest_id][member_point.member_id] = member_point.points
 
-    print("Debug - Stay:", stay.resort)
-    print("Debug - Stay Members:", stay_members)
-    print("Debug - Stay Guests:", stay_guests)
-    print("Debug - Guest Points:", guest_points)
-    print("Debug - Additional Guests:", [g.name for g in stay.additional_guests])
-
     return render_template('stay_form.html',
                          stay=stay,
                          members=members,
@@ -824,6 +2697,11 @@ class StayGuest(db.Model):
     guest = db.relationship('AdditionalGuest')
     member_points = db.relationship('GuestPoints', backref='stay_guest', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_stay_guest_stay_id', 'stay_id'),
+        db.Index('ix_stay_guest_guest_id', 'guest_id'),
+    )
+
 class GuestPoints(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     stay_guest_id = db.Column(db.Integer, db.ForeignKey('stay_guest.id'), nullable=False)
@@ -831,39 +2709,367 @@ class GuestPoints(db.Model):
     points = db.Column(db.Integer, nullable=False)
     member = db.relationship('Member')
 
-def calculate_points_used(member_id, year):
-    """Calculate total points used by a member in a given year, including guest contributions"""
-    total_points = 0
-
-    # Get points from direct stay memberships
-    stay_points = db.session.query(
-        func.sum(StayMember.points_share)
-    ).join(Stay).filter(
-        StayMember.member_id == member_id,
-        extract('year', Stay.check_in) == year
-    ).scalar() or 0
-
-    # Get points contributed to guests
-    guest_points = db.session.query(
-        func.sum(GuestPoints.points)
-    ).join(
-        StayGuest, GuestPoints.stay_guest_id == StayGuest.id
-    ).join(
-        Stay, StayGuest.stay_id == Stay.id
-    ).filter(
-        GuestPoints.member_id == member_id,
-        extract('year', Stay.check_in) == year
-    ).scalar() or 0
+    __table_args__ = (
+        db.Index('ix_guest_points_stay_guest_id', 'stay_guest_id'),
+        db.Index('ix_guest_points_member_id', 'member_id'),
+    )
 
-    total_points = stay_points + guest_points
+def empty_balance():
+    return {'regular': 0, 'banked': 0, 'used': 0, 'shared': 0, 'borrowed': 0}
+
+def get_balance_snapshot(use_years=None, member_ids=None):
+    """Compute point balances for members and use years with a fixed number of grouped queries.
+
+    Returns {member_id: {use_year: {'regular', 'banked', 'used', 'shared', 'borrowed',
+    'remaining', 'available'}}}. Every requested member/year pair is present, zero-filled.
+    'regular' and 'banked' are the ledger balances, already net of booked stays and transfers;
+    'banked' is what was banked into the use year from the one before, so both are spendable in it;
+    'used' (points in stays) and 'shared'/'borrowed' (recorded loans) are for display only."""
+    snapshot = {}
+
+    def bucket(member_id, use_year):
+        return snapshot.setdefault(member_id, {}).setdefault(use_year, empty_balance())
+
+    def scoped(query, member_column, year_column):
+        if member_ids is not None:
+            query = query.filter(member_column.in_(member_ids))
+        if use_years is not None:
+            query = query.filter(year_column.in_(use_years))
+        return query
+
+    if member_ids is None:
+        ids = [row[0] for row in db.session.query(Member.id)]
+    else:
+        ids = list(member_ids)
+    for member_id in ids:
+        for use_year in use_years or []:
+            bucket(member_id, use_year)
+
+    # Regular and banked allocations
+    allocations = scoped(
+        db.session.query(PointAllocation.member_id, PointAllocation.use_year,
+                         PointAllocation.is_banked, func.sum(PointAllocation.points)),
+        PointAllocation.member_id, PointAllocation.use_year
+    ).group_by(PointAllocation.member_id, PointAllocation.use_year, PointAllocation.is_banked)
+    for member_id, use_year, is_banked, points in allocations:
+        bucket(member_id, use_year)['banked' if is_banked else 'regular'] += points or 0
+
+    # Points used by direct stay shares and by guest contributions
+    stay_shares = scoped(
+        db.session.query(StayMember.member_id, Stay.use_year, func.sum(StayMember.points_share))
+        .join(Stay, StayMember.stay_id == Stay.id),
+        StayMember.member_id, Stay.use_year
+    ).group_by(StayMember.member_id, Stay.use_year)
+    guest_shares = scoped(
+        db.session.query(GuestPoints.member_id, Stay.use_year, func.sum(GuestPoints.points))
+        .join(StayGuest, GuestPoints.stay_guest_id == StayGuest.id)
+        .join(Stay, StayGuest.stay_id == Stay.id),
+        GuestPoints.member_id, Stay.use_year
+    ).group_by(GuestPoints.member_id, Stay.use_year)
+    for query in (stay_shares, guest_shares):
+        for member_id, use_year, points in query:
+            bucket(member_id, use_year)['used'] += points or 0
+
+    # Points shared with and borrowed from other members
+    lent = scoped(
+        db.session.query(PointLoan.lender_id, PointLoan.use_year, func.sum(PointLoan.points)),
+        PointLoan.lender_id, PointLoan.use_year
+    ).group_by(PointLoan.lender_id, PointLoan.use_year)
+    for member_id, use_year, points in lent:
+        bucket(member_id, use_year)['shared'] += points or 0
+    borrowed = scoped(
+        db.session.query(PointLoan.borrower_id, PointLoan.use_year, func.sum(PointLoan.points)),
+        PointLoan.borrower_id, PointLoan.use_year
+    ).group_by(PointLoan.borrower_id, PointLoan.use_year)
+    for member_id, use_year, points in borrowed:
+        bucket(member_id, use_year)['borrowed'] += points or 0
+
+    for years in snapshot.values():
+        for balance in years.values():
+            balance['remaining'] = balance['regular'] + balance['banked']
+            # What share_points_between() accepts
+            balance['available'] = balance['regular']
+
+    return snapshot
+
+@app.route('/api/balances')
+@cached_response
+def get_balances():
+    use_year = request.args.get('use_year', type=int)
+    member_id = request.args.get('member_id', type=int)
+    use_years = [use_year] if use_year is not None else None
+    member_ids = [member_id] if member_id is not None else None
+
+    snapshot = get_balance_snapshot(use_years=use_years, member_ids=member_ids)
+    return jsonify([{
+        'member_id': member_id,
+        'use_years': {str(year): balance for year, balance in sorted(years.items())}
+    } for member_id, years in sorted(snapshot.items())])
+
+# Regular points must be banked within this many months of the start of their use year
+BANKING_DEADLINE_MONTHS = 8
+PROJECTION_DEFAULT_YEARS = 3
+PROJECTION_MAX_YEARS = 10
+# Bound on scenarios x members x years x 12 months, so one request cannot exhaust memory
+PROJECTION_MAX_CELLS = 5_000_000
+
+class BalanceProjector:
+    """Projects point balances per member, use year and month with NumPy arrays.
+
+    For the projected use years it keeps regular[p, y], the member's regular balance (the
+    PointAllocation row, already net of booked stays, or for a use year without one the
+    member's latest opening allocation), carried[p, y], the banked row of the use year (points
+    banked into it from the year before), and demand[p, y, m], the planned stays charged in the month they check in.
+    Stays spend carried points first, since those expire at the end of the year. Scenarios
+    add hypothetical bookings to demand along a leading axis, so thousands of them are
+    evaluated in one pass. Inputs are built on first use and dropped when the data version
+    moves on.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.inputs = {}
+
+    def load(self, first_year, years):
+        version = data_version()
+        key = (current_tenant(), first_year, years)
+        with self.lock:
+            if version != self.version:
+                self.version, self.inputs = version, {}
+            inputs = self.inputs.get(key)
+        if inputs is None:
+            inputs = self.build(first_year, years)
+            with self.lock:
+                if version == self.version:
+                    self.inputs[key] = inputs
+        return inputs
+
+    def build(self, first_year, years):
+        last_year = first_year + years - 1
+        member_ids = [row[0] for row in db.session.query(Member.id).order_by(Member.id)]
+        index = {member_id: i for i, member_id in enumerate(member_ids)}
+        regular = np.zeros((len(member_ids), years), dtype=np.int64)
+        allocated = np.zeros((len(member_ids), years), dtype=bool)
+        carried = np.zeros((len(member_ids), years), dtype=np.int64)
+
+        allocations = db.session.query(
+            PointAllocation.member_id, PointAllocation.use_year, PointAllocation.is_banked,
+            func.sum(PointAllocation.points)
+        ).filter(
+            PointAllocation.use_year.between(first_year, last_year)
+        ).group_by(PointAllocation.member_id, PointAllocation.use_year, PointAllocation.is_banked)
+        for member_id, use_year, is_banked, points in allocations:
+            if is_banked:
+                carried[index[member_id], use_year - first_year] += points
+            else:
+                regular[index[member_id], use_year - first_year] += points
+                allocated[index[member_id], use_year - first_year] = True
+
+        # Use years not allocated yet repeat the member's latest opening allocation, or an
+        # even split of the contract's points for members that never had one
+        contract_points = db.session.query(Contract.total_points).order_by(Contract.id).limit(1).scalar() or 0
+        annual = np.full(len(member_ids), contract_points // max(len(member_ids), 1), dtype=np.int64)
+        openings = db.session.query(
+            PointLedgerEntry.member_id, PointLedgerEntry.use_year, func.sum(PointLedgerEntry.points)
+        ).filter(
+            # Databases migrated to the ledger opened each existing balance as 'opening_balance'
+            PointLedgerEntry.entry_type.in_(('allocation', 'opening_balance')),
+            PointLedgerEntry.is_banked.is_(False)
+        ).group_by(PointLedgerEntry.member_id, PointLedgerEntry.use_year).order_by(PointLedgerEntry.use_year)
+        for member_id, use_year, points in openings:
+            annual[index[member_id]] = points
+        regular = np.where(allocated, regular, annual[:, None])
+
+        # Planned stays (booked ones are already deducted), by member, use year and check-in
+        stay_points = db.session.query(
+            StayMember.member_id, Stay.use_year, Stay.check_in, func.sum(StayMember.points_share)
+        ).join(Stay, StayMember.stay_id == Stay.id)
+        guest_points = db.session.query(
+            GuestPoints.member_id, Stay.use_year, Stay.check_in, func.sum(GuestPoints.points)
+        ).join(StayGuest, GuestPoints.stay_guest_id == StayGuest.id).join(Stay, StayGuest.stay_id == Stay.id)
+        rows = []
+        for query, member_column in ((stay_points, StayMember.member_id), (guest_points, GuestPoints.member_id)):
+            rows.extend(query.filter(
+                Stay.status == 'planned',
+                Stay.use_year.between(first_year, last_year)
+            ).group_by(member_column, Stay.use_year, Stay.check_in))
+
+        demand = np.zeros((len(member_ids), years, 12), dtype=np.int64)
+        if rows:
+            start = use_year_start()
+            np.add.at(demand, (
+                np.array([index[member_id] for member_id, _, _, _ in rows]),
+                np.array([use_year - first_year for _, use_year, _, _ in rows]),
+                np.array([(check_in.month - start) % 12 for _, _, check_in, _ in rows])
+            ), np.array([points or 0 for _, _, _, points in rows], dtype=np.int64))
+
+        return {'member_ids': member_ids, 'index': index, 'regular': regular,
+                'carried': carried, 'demand': demand}
+
+    def project(self, inputs, bank=False, extra=None):
+        """Run the projection for the baseline plus extra[s, p, y, m] booked points per scenario.
+
+        Returns arrays with a leading scenario axis: available[s, p, y, m], the points still
+        usable in the use year at the end of each month (negative when overdrawn), and per
+        use year carried_in, banked_out (regular points left at the end of the year, banked
+        at the deadline when bank is set), expiring and shortfall (largest overdraft)."""
+        demand = inputs['demand'][None] if extra is None else inputs['demand'][None] + extra
+        scenarios, members, years, _ = demand.shape
+        available = np.empty(demand.shape, dtype=np.int64)
+        carried_in, banked_out, expiring = (np.zeros((scenarios, members, years), dtype=np.int64)
+                                            for _ in range(3))
+
+        banked = np.zeros((scenarios, members), dtype=np.int64)
+        for y in range(years):
+            carried = inputs['carried'][None, :, y] + banked
+            spent = np.cumsum(demand[:, :, y], axis=-1)
+            from_carried = np.minimum(spent, carried[..., None])
+            regular_left = inputs['regular'][None, :, y, None] - (spent - from_carried)
+            banked = np.clip(regular_left[..., -1], 0, None) if bank else np.zeros_like(banked)
+            regular_left[..., BANKING_DEADLINE_MONTHS - 1:] -= banked[..., None]
+            available[:, :, y] = carried[..., None] - from_carried + regular_left
+
+            carried_in[..., y] = carried
+            banked_out[..., y] = banked
+            expiring[..., y] = carried - from_carried[..., -1] + np.clip(regular_left[..., -1], 0, None)
+
+        shortfall = np.clip(-available.min(axis=-1), 0, None)
+        return {'available': available, 'carried_in': carried_in, 'banked_out': banked_out,
+                'expiring': expiring, 'shortfall': shortfall}
+
+balance_projector = BalanceProjector()
+
+def use_year_month(use_year, month, start):
+    """'YYYY-MM' of the month-th month (0-based) of a use year starting in month start"""
+    year, month = divmod(start - 1 + month, 12)
+    return f'{use_year + year}-{month + 1:02d}'
+
+def projection_years():
+    years = request.args.get('years', PROJECTION_DEFAULT_YEARS, type=int)
+    if not 1 <= years <= PROJECTION_MAX_YEARS:
+        raise ValueError(f'years must be between 1 and {PROJECTION_MAX_YEARS}')
+    return years
+
+@app.route('/api/projection')
+@cached_response
+def get_projection():
+    """Month-by-month balances for the next ?years use years, starting with the current one.
+
+    With ?bank=1, regular points the planned stays leave unused are banked at the deadline
+    instead of expiring."""
+    try:
+        years = projection_years()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    member_id = request.args.get('member_id', type=int)
+    first_year = get_use_year(date.today())
+    start = use_year_start()
 
-    return total_points
+    inputs = balance_projector.load(first_year, years)
+    result = balance_projector.project(inputs, bank=request.args.get('bank', 0, type=int) == 1)
+    planned = inputs['demand'].sum(axis=-1)
+
+    return jsonify([{
+        'member_id': m,
+        'use_years': {str(first_year + y): {
+            'regular': int(inputs['regular'][p, y]),
+            'carried_in': int(result['carried_in'][0, p, y]),
+            'planned': int(planned[p, y]),
+            'banked_out': int(result['banked_out'][0, p, y]),
+            'expiring': int(result['expiring'][0, p, y]),
+            'shortfall': int(result['shortfall'][0, p, y]),
+            'months': {use_year_month(first_year + y, month, start): int(points)
+                       for month, points in enumerate(result['available'][0, p, y])}
+        } for y in range(years)}
+    } for p, m in enumerate(inputs['member_ids']) if member_id in (None, m)])
+
+@app.route('/api/projection', methods=['POST'])
+def simulate_bookings():
+    """Evaluate what-if booking scenarios against the projection in one batched pass.
+
+    Body: {"years", "bank", "scenarios": [{"bookings": [{"check_in", "shares":
+    [{"member_id", "points"}, ...]}, ...]}, ...]}. Each scenario reports whether every
+    member can cover its bookings, the first month each member-year runs short, and the
+    points that would expire."""
+    data = request.get_json(silent=True) or {}
+    scenarios = data.get('scenarios')
+    if not isinstance(scenarios, list) or not scenarios:
+        return jsonify({'error': 'scenarios must be a non-empty list'}), 400
 
-def init_db():
+    try:
+        years = int(data.get('years', PROJECTION_DEFAULT_YEARS))
+        if not 1 <= years <= PROJECTION_MAX_YEARS:
+            raise ValueError(f'years must be between 1 and {PROJECTION_MAX_YEARS}')
+        first_year = get_use_year(date.today())
+        start = use_year_start()
+        inputs = balance_projector.load(first_year, years)
+        index = inputs['index']
+        if len(scenarios) * len(index) * years * 12 > PROJECTION_MAX_CELLS:
+            raise ValueError('Too many scenarios for this many members and years')
+
+        cells = []  # (scenario, member, use year, month, points) for every booked share
+        positions = {}  # Scenarios mostly reuse dates, so each distinct check-in is parsed once
+        for s, scenario in enumerate(scenarios):
+            for booking in scenario['bookings']:
+                check_in = booking['check_in']
+                if check_in not in positions:
+                    day = datetime.strptime(check_in, '%Y-%m-%d').date()
+                    positions[check_in] = (get_use_year(day) - first_year, (day.month - start) % 12)
+                y, month = positions[check_in]
+                if not 0 <= y < years:
+                    raise ValueError(f'{check_in} is outside the projected use years')
+                for share in booking['shares']:
+                    if share['member_id'] not in index:
+                        raise ValueError(f"Unknown member {share['member_id']}")
+                    cells.append((s, index[share['member_id']], y, month, int(share['points'])))
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid scenario: {str(e)}'}), 400
+
+    extra = np.zeros((len(scenarios), len(index), years, 12), dtype=np.int64)
+    if cells:
+        s, p, y, month, points = np.array(cells, dtype=np.int64).T
+        np.add.at(extra, (s, p, y, month), points)
+    result = balance_projector.project(inputs, bank=bool(data.get('bank')), extra=extra)
+
+    # First overdrawn month of every member-year that runs short
+    overdrawn = result['available'] < 0
+    first_month = overdrawn.argmax(axis=-1)
+    short = {}
+    for s, p, y in zip(*np.nonzero(overdrawn.any(axis=-1))):
+        short.setdefault(int(s), []).append({
+            'member_id': inputs['member_ids'][p],
+            'use_year': first_year + int(y),
+            'month': use_year_month(first_year + int(y), int(first_month[s, p, y]), start),
+            'points': int(result['shortfall'][s, p, y])
+        })
+    expiring = result['expiring'].sum(axis=(1, 2))
+    banked = result['banked_out'].sum(axis=(1, 2))
+
+    return jsonify({
+        'first_use_year': first_year,
+        'years': years,
+        'scenarios': [{
+            'feasible': s not in short,
+            'shortfalls': short.get(s, []),
+            'expiring': int(expiring[s]),
+            'banked': int(banked[s])
+        } for s in range(len(scenarios))]
+    })
+
+def init_db(reset=False):
     with app.app_context():
-        # Create all tables
-        db.drop_all()
-        db.create_all()
+        if reset:
+            db.drop_all()
+            with db.engine.begin() as conn:
+                migrations.stamp(conn, 0)
+
+        # Create or migrate the schema in place
+        upgrade_database()
+
+        # Only seed sample data into an empty database
+        if Member.query.first():
+            return
 
         # Create contract
         contract = Contract(use_year_start=9, total_points=230)  # September, 230 points
@@ -878,23 +3084,15 @@ def init_db():
 
         current_year = get_use_year(date.today())
 
-        # Create point allocations for current use year
+        # Create point allocations for current use year through the ledger
         # Regular points
-        allocations = [
-            PointAllocation(member_id=brian.id, use_year=current_year, points=77, is_banked=False),
-            PointAllocation(member_id=rachel.id, use_year=current_year, points=77, is_banked=False),
-            PointAllocation(member_id=parents.id, use_year=current_year, points=76, is_banked=False),
-        ]
+        for member, points in [(brian, 77), (rachel, 77), (parents, 76)]:
+            post_ledger_entry(member.id, current_year, points, 'allocation')
 
         # Banked points from previous year
-        banked_allocations = [
-            PointAllocation(member_id=brian.id, use_year=current_year, points=75, is_banked=True),
-            PointAllocation(member_id=rachel.id, use_year=current_year, points=75, is_banked=True),
-            PointAllocation(member_id=parents.id, use_year=current_year, points=76, is_banked=True),
-        ]
-
-        db.session.add_all(allocations)
-        db.session.add_all(banked_allocations)
+        for member, points in [(brian, 75), (rachel, 75), (parents, 76)]:
+            post_ledger_entry(member.id, current_year, points, 'allocation', is_banked=True)
+
         db.session.commit()
 
         # Create some sample additional guests
@@ -903,37 +3101,417 @@ def init_db():
         db.session.add_all([grammy, aunt_jane])
         db.session.commit()
 
+def upgrade_database():
+    """Create a fresh schema or migrate an existing database in place to the latest version"""
+    with db.engine.begin() as conn:
+        if not inspect(conn).has_table('member'):
+            db.metadata.create_all(conn)
+            migrations.stamp(conn)
+            return []
+        return migrations.upgrade(conn)
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations to the database, or to every tenant's database"""
+    for tenant in tenant_names() if app.config['TENANT_DIR'] else [None]:
+        prefix = f'{tenant}: ' if tenant else ''
+        with tenant_context(tenant):
+            applied = upgrade_database()
+        for version, description in applied:
+            print(f'{prefix}Applied migration {version}: {description}')
+        print(f'{prefix}Database is at schema version {migrations.latest_version()}')
+
+@app.cli.command('tenant-create')
+@click.argument('name')
+@click.option('--use-year-start', type=click.IntRange(1, 12), default=DEFAULT_USE_YEAR_START,
+              help='Month the contract\'s use year starts in')
+@click.option('--total-points', type=int, required=True, help='Annual points of the contract')
+def tenant_create_command(name, use_year_start, total_points):
+    """Create a tenant: a new database file in TENANT_DIR holding one contract"""
+    if not app.config['TENANT_DIR']:
+        raise click.ClickException('Set TENANT_DIR to create tenants')
+    if not TENANT_NAME.fullmatch(name):
+        raise click.ClickException('Tenant names use lowercase letters, digits, "-" and "_"')
+    path = tenant_path(name)
+    if os.path.exists(path):
+        raise click.ClickException(f'{path} already exists')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    sqlite3.connect(path).close()
+
+    with tenant_context(name):
+        upgrade_database()
+        db.session.add(Contract(use_year_start=use_year_start, total_points=total_points))
+        db.session.commit()
+    print(f'Created tenant {name} at {path}')
+
+@app.cli.command('db-version')
+def db_version_command():
+    """Show the current and latest schema versions"""
+    with db.engine.connect() as conn:
+        print(f'Current schema version: {migrations.current_version(conn)}')
+    print(f'Latest schema version: {migrations.latest_version()}')
+
+@app.cli.command('ledger-check')
+def ledger_check_command():
+    """Verify that every PointAllocation balance equals the sum of its ledger entries, and every
+    PointBalance the sum of the loans and transfers between its members"""
+    ledger_totals = {
+        (member_id, use_year, bool(is_banked)): points
+        for member_id, use_year, is_banked, points in db.session.query(
+            PointLedgerEntry.member_id, PointLedgerEntry.use_year,
+            PointLedgerEntry.is_banked, func.sum(PointLedgerEntry.points)
+        ).group_by(PointLedgerEntry.member_id, PointLedgerEntry.use_year, PointLedgerEntry.is_banked)
+    }
+
+    mismatches = 0
+    for allocation in PointAllocation.query.all():
+        key = (allocation.member_id, allocation.use_year, bool(allocation.is_banked))
+        expected = ledger_totals.pop(key, 0)
+        if expected != allocation.points:
+            mismatches += 1
+            print(f'Mismatch for member {key[0]}, {key[1]}, banked={key[2]}: '
+                  f'balance {allocation.points}, ledger {expected}')
+    for key, points in ledger_totals.items():
+        if points:
+            mismatches += 1
+            print(f'Ledger entries without a balance for member {key[0]}, {key[1]}, banked={key[2]}: {points}')
+
+    # The pairwise matrix must equal a replay of every loan and transfer
+    pair_totals = {}
+    for model in (PointLoan, PointShare):
+        for lender_id, borrower_id, use_year, points in db.session.query(
+            model.lender_id, model.borrower_id, model.use_year, func.sum(model.points)
+        ).filter(model.lender_id != model.borrower_id).group_by(model.lender_id, model.borrower_id, model.use_year):
+            member1_id, member2_id, owed = transfer_pair(lender_id, borrower_id, points)
+            key = (member1_id, member2_id, use_year)
+            pair_totals[key] = pair_totals.get(key, 0) + owed
+    for balance in PointBalance.query.all():
+        key = (balance.member1_id, balance.member2_id, balance.use_year)
+        expected = pair_totals.pop(key, 0)
+        if expected != balance.points:
+            mismatches += 1
+            print(f'Mismatch between members {key[0]} and {key[1]}, {key[2]}: '
+                  f'balance {balance.points}, transfers {expected}')
+    for key, points in pair_totals.items():
+        if points:
+            mismatches += 1
+            print(f'Transfers without a balance between members {key[0]} and {key[1]}, {key[2]}: {points}')
+
+    print(f'{mismatches} mismatches found')
+
+ACTIVITY_ARCHIVE_BATCH_SIZE = 10000  # Entries moved per transaction, so web writers are not locked out for long
+
+def activity_archive_cutoff(before):
+    """Lowest ActivityLog id to keep when archiving entries older than before.
+
+    An undo entry is never kept without the action it undoes, so redo always finds the original.
+    The newest entry always stays, so SQLite goes on numbering new entries after the archived ones."""
+    cutoff = db.session.query(func.min(ActivityLog.id)).filter(ActivityLog.timestamp >= before).scalar() \
+        or db.session.query(func.max(ActivityLog.id)).scalar() or 0
+    while True:
+        undone = db.session.query(func.min(ActivityLog.undoes_id)).filter(ActivityLog.id >= cutoff).scalar()
+        if undone is None or undone >= cutoff:
+            return cutoff
+        cutoff = undone
+
+def archive_activity(before):
+    """Move ActivityLog entries older than before into ActivityLogArchive and count them into
+    ActivityRollup, committing every ACTIVITY_ARCHIVE_BATCH_SIZE ids. Returns the number moved.
+
+    Archived actions drop off the undo stack: undo only reaches back to the retention horizon."""
+    columns = [c.name for c in ActivityLog.__table__.columns]
+    day = func.date(ActivityLog.timestamp)
+    moved = 0
+
+    while True:
+        db.session.connection(execution_options={'write_transaction': True})
+        # Recomputed under the write lock, since an undo after the last batch may have reached an older entry
+        cutoff = activity_archive_cutoff(before)
+        low = db.session.query(func.min(ActivityLog.id)).scalar()
+        if low is None or low >= cutoff:
+            db.session.commit()
+            return moved
+        high = min(low + ACTIVITY_ARCHIVE_BATCH_SIZE, cutoff)
+        batch = (ActivityLog.id >= low, ActivityLog.id < high)
+
+        rollup = sqlite_insert(ActivityRollup).from_select(
+            ['day', 'action_type', 'count'],
+            select(day, ActivityLog.action_type, func.count()).where(*batch).group_by(day, ActivityLog.action_type)
+        )
+        db.session.execute(rollup.on_conflict_do_update(
+            index_elements=['day', 'action_type'], set_={'count': ActivityRollup.count + rollup.excluded['count']}
+        ))
+        db.session.execute(insert(ActivityLogArchive).from_select(
+            columns, select(*ActivityLog.__table__.columns).where(*batch)
+        ))
+        moved += ActivityLog.query.filter(*batch).delete(synchronize_session=False)
+        db.session.commit()
+
+@app.cli.command('activity-archive')
+@click.option('--days', type=click.IntRange(min=0), default=None,
+              help='Days of activity to keep in the hot table (default ACTIVITY_RETENTION_DAYS)')
+def activity_archive_command(days):
+    """Move activity older than the retention horizon to the archive, in every tenant's database"""
+    days = app.config['ACTIVITY_RETENTION_DAYS'] if days is None else days
+    before = datetime.utcnow() - timedelta(days=days)
+    for tenant in tenant_names() if app.config['TENANT_DIR'] else [None]:
+        prefix = f'{tenant}: ' if tenant else ''
+        with tenant_context(tenant):
+            moved = archive_activity(before)
+        print(f'{prefix}Archived {moved} activity entries from before {before:%Y-%m-%d %H:%M} UTC')
+
+@app.route('/api/ledger')
+def get_ledger():
+    member_id = request.args.get('member_id', type=int)
+    use_year = request.args.get('use_year', type=int)
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    before_id = request.args.get('before_id', type=int)
+
+    query = PointLedgerEntry.query
+    if member_id is not None:
+        query = query.filter(PointLedgerEntry.member_id == member_id)
+    if use_year is not None:
+        query = query.filter(PointLedgerEntry.use_year == use_year)
+    if before_id is not None:
+        query = query.filter(PointLedgerEntry.id < before_id)
+
+    entries = query.order_by(PointLedgerEntry.id.desc()).limit(limit).all()
+    return jsonify([{
+        'id': entry.id,
+        'timestamp': entry.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'member_id': entry.member_id,
+        'use_year': entry.use_year,
+        'bucket': 'banked' if entry.is_banked else 'regular',
+        'points': entry.points,
+        'entry_type': entry.entry_type,
+        'stay_id': entry.stay_id,
+        'counterparty_id': entry.counterparty_id
+    } for entry in entries])
+
+EXPORT_BATCH_SIZE = 1000  # Rows fetched per round trip by the server-side cursor
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+def format_share_list(shares):
+    """Format (name, points) pairs the way the stay import CSV expects them"""
+    return ';'.join(f'{name}:{points}' for name, points in shares)
+
+def export_stays(start=None, end=None, member_id=None, use_year=None):
+    query = Stay.query.options(
+        selectinload(Stay.members).selectinload(StayMember.member),
+        selectinload(Stay.stay_guests).selectinload(StayGuest.guest),
+        selectinload(Stay.stay_guests).selectinload(StayGuest.member_points).selectinload(GuestPoints.member)
+    )
+    if start:
+        query = query.filter(Stay.check_in >= start)
+    if end:
+        query = query.filter(Stay.check_in <= end)
+    if use_year is not None:
+        query = query.filter(Stay.use_year == use_year)
+    if member_id is not None:
+        query = query.filter(Stay.members.any(StayMember.member_id == member_id))
+
+    stays = db.session.scalars(query.order_by(Stay.id).statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for stay in stays:
+        yield {
+            'id': stay.id,
+            'resort': stay.resort,
+            'check_in': stay.check_in.strftime('%Y-%m-%d'),
+            'check_out': stay.check_out.strftime('%Y-%m-%d'),
+            'use_year': stay.use_year,
+            'points_cost': stay.points_cost,
+            'status': stay.status,
+            'members': format_share_list((sm.member.name, sm.points_share) for sm in stay.members),
+            'guests': ';'.join(
+                f'{sg.guest.name}:{gp.member.name}:{gp.points}'
+                for sg in stay.stay_guests for gp in sg.member_points
+            )
+        }
+
+def export_allocations(start=None, end=None, member_id=None, use_year=None):
+    query = db.session.query(
+        PointAllocation.member_id, Member.name, PointAllocation.use_year,
+        PointAllocation.is_banked, PointAllocation.points
+    ).join(Member, PointAllocation.member_id == Member.id)
+    if member_id is not None:
+        query = query.filter(PointAllocation.member_id == member_id)
+    if use_year is not None:
+        query = query.filter(PointAllocation.use_year == use_year)
+
+    query = query.order_by(PointAllocation.member_id, PointAllocation.use_year, PointAllocation.is_banked)
+    for allocation_member_id, name, allocation_year, is_banked, points in \
+            query.execution_options(yield_per=EXPORT_BATCH_SIZE):
+        yield {
+            'member_id': allocation_member_id,
+            'member': name,
+            'use_year': allocation_year,
+            'bucket': 'banked' if is_banked else 'regular',
+            'points': points
+        }
+
+def export_activity(start=None, end=None, member_id=None, use_year=None):
+    # Archived entries first; they all have lower ids than the ones still in ActivityLog
+    for model in (ActivityLogArchive, ActivityLog):
+        query = db.session.query(
+            model.id, model.timestamp, model.action_type, model.description,
+            model.member1_id, model.member2_id, model.stay_id
+        )
+        if start:
+            query = query.filter(model.timestamp >= start)
+        if end:
+            query = query.filter(model.timestamp < end + timedelta(days=1))
+        if member_id is not None:
+            query = query.filter(db.or_(model.member1_id == member_id, model.member2_id == member_id))
+
+        for row in query.order_by(model.id).execution_options(yield_per=EXPORT_BATCH_SIZE):
+            yield {
+                'id': row.id,
+                'timestamp': row.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                'action_type': row.action_type,
+                'description': row.description,
+                'member1_id': row.member1_id,
+                'member2_id': row.member2_id,
+                'stay_id': row.stay_id
+            }
+
+def export_shares(start=None, end=None, member_id=None, use_year=None):
+    # Point transfers (PointShare) followed by recorded loans (PointLoan)
+    for kind, model in (('transfer', PointShare), ('loan', PointLoan)):
+        query = db.session.query(
+            model.id, model.timestamp, model.lender_id, model.borrower_id, model.points, model.use_year
+        )
+        if start:
+            query = query.filter(model.timestamp >= start)
+        if end:
+            query = query.filter(model.timestamp < end + timedelta(days=1))
+        if member_id is not None:
+            query = query.filter(db.or_(model.lender_id == member_id, model.borrower_id == member_id))
+        if use_year is not None:
+            query = query.filter(model.use_year == use_year)
+
+        for row in query.order_by(model.id).execution_options(yield_per=EXPORT_BATCH_SIZE):
+            yield {
+                'kind': kind,
+                'id': row.id,
+                'timestamp': row.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                'lender_id': row.lender_id,
+                'borrower_id': row.borrower_id,
+                'points': row.points,
+                'use_year': row.use_year
+            }
+
+EXPORTS = {
+    'stays': (export_stays, ['id', 'resort', 'check_in', 'check_out', 'use_year', 'points_cost',
+                             'status', 'members', 'guests']),
+    'allocations': (export_allocations, ['member_id', 'member', 'use_year', 'bucket', 'points']),
+    'activity': (export_activity, ['id', 'timestamp', 'action_type', 'description',
+                                   'member1_id', 'member2_id', 'stay_id']),
+    'shares': (export_shares, ['kind', 'id', 'timestamp', 'lender_id', 'borrower_id', 'points', 'use_year']),
+}
+
+@app.route('/export/<any(stays, allocations, activity, shares):dataset>.<any(csv, ndjson):file_format>')
+def export_data(dataset, file_format):
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        filters = {
+            'start': datetime.strptime(start, '%Y-%m-%d').date() if start else None,
+            'end': datetime.strptime(end, '%Y-%m-%d').date() if end else None,
+            'member_id': request.args.get('member_id', type=int),
+            'use_year': request.args.get('use_year', type=int)
+        }
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameters: {str(e)}'}), 400
+
+    export_rows, columns = EXPORTS[dataset]
+
+    def generate():
+        rows = export_rows(**filters)
+        if file_format == 'ndjson':
+            for row in rows:
+                yield json.dumps(row) + '\n'
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+            if buffer.tell() >= EXPORT_FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    mimetype = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={dataset}.{file_format}'
+    })
+
+def plan_settlements(net):
+    """Repayments that settle every member, given net[member_id] = points owed to them.
+
+    Debtors and creditors owing exactly the same amount are paired first, since each such
+    pair settles in one transfer. The rest is settled greedily: the largest debtor pays the
+    largest creditor, and whoever is left with a remainder goes back on its heap. That takes
+    at most one transfer fewer than the members involved. Returns (debtor_id, creditor_id, points)."""
+    transfers = []
+    creditors, debtors = {}, {}
+    for member_id, points in sorted(net.items()):
+        if points > 0:
+            creditors.setdefault(points, []).append(member_id)
+        elif points < 0:
+            debtors.setdefault(-points, []).append(member_id)
+
+    for points in list(debtors):
+        while debtors[points] and creditors.get(points):
+            transfers.append((debtors[points].pop(), creditors[points].pop(), points))
+
+    # Max-heaps of (-points, member_id)
+    creditor_heap = [(-points, member_id) for points, ids in creditors.items() for member_id in ids]
+    debtor_heap = [(-points, member_id) for points, ids in debtors.items() for member_id in ids]
+    heapq.heapify(creditor_heap)
+    heapq.heapify(debtor_heap)
+    while creditor_heap and debtor_heap:
+        owed, creditor_id = heapq.heappop(creditor_heap)
+        owing, debtor_id = heapq.heappop(debtor_heap)
+        points = min(-owed, -owing)
+        transfers.append((debtor_id, creditor_id, points))
+        if -owed > points:
+            heapq.heappush(creditor_heap, (owed + points, creditor_id))
+        if -owing > points:
+            heapq.heappush(debtor_heap, (owing + points, debtor_id))
+    return transfers
+
+@app.route('/api/settlements')
+@cached_response
+def get_settlements():
+    """The fewest repayments (near enough) that square every member, per use year (?use_year to pick one)"""
+    use_year = request.args.get('use_year', type=int)
+
+    # Each member's net position: points owed to them (as member2) minus points they owe (as member1).
+    # One grouped query per side, so each is a single scan of its covering index.
+    nets = {}
+    for member, sign in ((PointBalance.member2_id, 1), (PointBalance.member1_id, -1)):
+        query = db.session.query(PointBalance.use_year, member, func.sum(PointBalance.points))
+        if use_year is not None:
+            query = query.filter(PointBalance.use_year == use_year)
+        for year, member_id, points in query.group_by(PointBalance.use_year, member):
+            net = nets.setdefault(year, {})
+            net[member_id] = net.get(member_id, 0) + sign * points
+
+    return jsonify([{
+        'use_year': year,
+        'transfers': [{'debtor_id': debtor_id, 'creditor_id': creditor_id, 'points': points}
+                      for debtor_id, creditor_id, points in plan_settlements(net)]
+    } for year, net in sorted(nets.items())])
+
 @app.route('/point-sharing')
+@cached_response
 def view_loans():
     current_year = get_use_year(date.today())
     members = Member.query.all()
-    point_shares = get_point_sharing_summary()
-
-    # Calculate points used for each member
-    points_used = {}
-    for member in members:
-        points_used[member.id] = calculate_points_used(member.id, current_year)
-
-    # Get point allocations for all members
-    point_allocations = {}
-    for member in members:
-        point_allocations[member.id] = {current_year: {}}
-
-        # Get regular points
-        regular = PointAllocation.query.filter_by(
-            member_id=member.id,
-            use_year=current_year,
-            is_banked=False
-        ).first()
-        point_allocations[member.id][current_year]['regular'] = regular
-
-        # Get banked points
-        banked = PointAllocation.query.filter_by(
-            member_id=member.id,
-            use_year=current_year,
-            is_banked=True
-        ).first()
-        point_allocations[member.id][current_year]['banked'] = banked
+    balances = get_balance_snapshot(use_years=[current_year])
+    debts, net_positions = get_point_sharing_summary(current_year)
 
     # Get recent activity
     activities = ActivityLog.query.filter(
@@ -943,70 +3521,64 @@ def view_loans():
     return render_template('loans.html',
                          members=members,
                          current_year=current_year,
-                         point_allocations=point_allocations,
-                         point_shares=point_shares,
-                         points_used=points_used,
+                         balances=balances,
+                         debts=debts,
+                         net_positions=net_positions,
+                         member_names={member.id: member.name for member in members},
                          activities=activities)
 
-def get_point_sharing_summary():
-    members = Member.query.all()
-    summary = {}
-
-    # Initialize summary for all members
-    for member in members:
-        summary[member.id] = {
-            'shared': 0,
-            'borrowed': 0
-        }
-
-    # Get all point sharing records
-    shares = PointLoan.query.all()
-
-    # Update summary with actual sharing data
-    for share in shares:
-        summary[share.lender_id]['shared'] += share.points
-        summary[share.borrower_id]['borrowed'] += share.points
-
-    return summary
+def get_point_sharing_summary(use_year):
+    """Who owes whom in a use year, read from the PointBalance matrix.
+
+    Returns (debts, net): debts lists {'debtor_id', 'creditor_id', 'points'} for every pair
+    that is not square, and net maps member ids to the points owed to them (negative: owed
+    by them), counting both loans and transfers."""
+    debts, net = [], {}
+    for member1_id, member2_id, points in db.session.query(
+        PointBalance.member1_id, PointBalance.member2_id, PointBalance.points
+    ).filter(PointBalance.use_year == use_year, PointBalance.points != 0):
+        # Positive points: member1 owes member2
+        debtor_id, creditor_id = (member1_id, member2_id) if points > 0 else (member2_id, member1_id)
+        debts.append({'debtor_id': debtor_id, 'creditor_id': creditor_id, 'points': abs(points)})
+        net[creditor_id] = net.get(creditor_id, 0) + abs(points)
+        net[debtor_id] = net.get(debtor_id, 0) - abs(points)
+    return debts, net
+
+@app.route('/api/point_balances')
+@cached_response
+def get_point_balances():
+    """Net points owed between members per use year (?use_year to pick one)"""
+    query = db.session.query(PointBalance).filter(PointBalance.points != 0)
+    use_year = request.args.get('use_year', type=int)
+    if use_year is not None:
+        query = query.filter(PointBalance.use_year == use_year)
+    return jsonify([{
+        'use_year': balance.use_year,
+        'debtor_id': balance.member1_id if balance.points > 0 else balance.member2_id,
+        'creditor_id': balance.member2_id if balance.points > 0 else balance.member1_id,
+        'points': abs(balance.points)
+    } for balance in query.order_by(PointBalance.use_year, PointBalance.member1_id, PointBalance.member2_id)])
 
 @app.route('/activity')
+@cached_response
 def activity_log():  # This function name needs to match what's in url_for()
-    activity_type = request.args.get('type', 'all')
-    member_id = request.args.get('member_id', 'all')
-
-    # Get all unique activity types for the filter dropdown
-    activity_types = db.session.query(ActivityLog.action_type).distinct().all()
-    activity_types = [t[0] for t in activity_types]
-
-    # Get all members for the filter dropdown
-    members = Member.query.all()
-
-    # Build the query
-    query = ActivityLog.query
-
-    # Filter by activity type if specified
-    if activity_type and activity_type != 'all':
-        query = query.filter_by(action_type=activity_type)
-
-    # Filter by member if specified
-    if member_id and member_id != 'all':
-        member_id = int(member_id)
-        query = query.filter(
-            db.or_(
-                ActivityLog.member1_id == member_id,
-                ActivityLog.member2_id == member_id
-            )
-        )
-
-    # Get the filtered logs
-    logs = query.order_by(ActivityLog.timestamp.desc()).all()
-
-    return render_template('activity.html',
-                         logs=logs,
-                         activity_types=activity_types,
-                         members=members,
-                         selected_type=activity_type,
-                         selected_member=member_id)
+    # The page loads its entries from /api/activity_logs, so nothing is queried here
+    return render_template('activity.html')
+
+def point_loan_log(loan, lender, borrower):
+    """Activity entry for a recorded (flushed) loan; undoing it deletes the loan"""
+    return ActivityLog(
+        action_type='point_share',
+        description=f'{lender.name} shared {loan.points} points with {borrower.name} for {loan.use_year}',
+        member1_id=loan.lender_id,
+        member2_id=loan.borrower_id,
+        timestamp=datetime.now(),
+        undo_data={
+            'point_loan': {'lender_id': loan.lender_id, 'borrower_id': loan.borrower_id,
+                           'points': loan.points, 'use_year': loan.use_year},
+            'point_loan_id': loan.id
+        }
+    )
 
 @app.route('/api/loans', methods=['POST'])
 def create_loan():
@@ -1029,25 +3601,20 @@ def create_loan():
             use_year=use_year
         )
         db.session.add(loan)
+        db.session.flush()
+        record_transfer(db.session, lender_id, borrower_id, points, use_year)
 
         # Log the activity
         lender = Member.query.get(lender_id)
         borrower = Member.query.get(borrower_id)
-        log_entry = ActivityLog(
-            action_type='point_share',
-            description=f'{lender.name} shared {points} points with {borrower.name} for {use_year}',
-            member1_id=lender_id,
-            member2_id=borrower_id,
-            timestamp=datetime.now()
-        )
-        db.session.add(log_entry)
+        db.session.add(point_loan_log(loan, lender, borrower))
 
         db.session.commit()
         return jsonify({'message': 'Point sharing recorded successfully'})
 
     except Exception as e:
         db.session.rollback()
-        print(f"Error recording point share: {str(e)}")
+        app.logger.exception('Error recording point loan')
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/guests', methods=['POST'])
@@ -1110,14 +3677,163 @@ def remove_guest(guest_id):
 
     return redirect(url_for('manage_guests'))
 
-@app.route('/api/activity_logs')
-def get_activity_logs():
-    logs = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).all()
-    return jsonify([{
+ACTIVITY_LOGS_DEFAULT_LIMIT = 100
+ACTIVITY_LOGS_MAX_LIMIT = 1000
+
+def serialize_activity_log(log):
+    return {
+        'id': log.id,
         'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
         'action_type': log.action_type,
         'description': log.description
-    } for log in logs])
+    }
+
+def activity_logs_etag(version, archived, min_id, max_id, limit, before_id, since_id):
+    """Validator for an activity log page. The id range moves when entries are added or archived;
+    the data version also catches in-place updates such as undo marking an entry as undone."""
+    return (f"{'archive-' if archived else ''}{response_cache.epoch}.{version}-"
+            f"{min_id}-{max_id}-{limit}-{before_id}-{since_id}")
+
+def activity_logs_query(model, limit, before_id=None, since_id=None):
+    """One page of ActivityLog (or ActivityLogArchive) entries, newest first.
+
+    With since_id it is the oldest entries after since_id instead, plus one to tell whether
+    more follow, so a client that fell more than limit entries behind misses none of them."""
+    query = select(model)
+    if before_id is not None:
+        query = query.where(model.id < before_id)
+    if since_id is None:
+        return query.order_by(model.id.desc()).limit(limit)
+    return query.where(model.id > since_id).order_by(model.id).limit(limit + 1)
+
+def activity_logs_page(logs, limit, since_id=None):
+    """Entries of activity_logs_query() newest first, and the since_id to fetch the rest with (or None)"""
+    if since_id is None:
+        return logs, None
+    page = logs[:limit][::-1]
+    return page, page[0].id if len(logs) > limit else None
+
+@app.route('/api/activity_logs')
+def get_activity_logs():
+    """Newest entries first; ?archived=1 pages through ActivityLogArchive the same way"""
+    try:
+        # int() rather than type=int, which would quietly drop a malformed value
+        limit = min(int(request.args.get('limit', ACTIVITY_LOGS_DEFAULT_LIMIT)), ACTIVITY_LOGS_MAX_LIMIT)
+        before_id = int(request.args['before_id']) if 'before_id' in request.args else None
+        since_id = int(request.args['since_id']) if 'since_id' in request.args else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameters: {str(e)}'}), 400
+
+    if limit <= 0:
+        return jsonify({'error': 'limit must be positive'}), 400
+
+    archived = request.args.get('archived', '').lower() in ('1', 'true', 'yes')
+    model = ActivityLogArchive if archived else ActivityLog
+
+    min_id, max_id = db.session.query(func.min(model.id), func.max(model.id)).one()
+    etag = activity_logs_etag(data_version(), archived, min_id, max_id, limit, before_id, since_id)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    logs, next_since_id = activity_logs_page(
+        db.session.scalars(activity_logs_query(model, limit, before_id, since_id)).all(), limit, since_id
+    )
+    response = jsonify([serialize_activity_log(log) for log in logs])
+    response.set_etag(etag)
+    if next_since_id is not None:
+        response.headers['X-Next-Since-Id'] = str(next_since_id)
+    return response
+
+@app.route('/api/activity_rollup')
+@cached_response
+def get_activity_rollup():
+    """Entries per day (UTC) and action type over the whole history: the archived counts kept in
+    ActivityRollup plus a live count of the hot table. Optional start/end dates and type."""
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameters: {str(e)}'}), 400
+    action_type = request.args.get('type')
+
+    archived = db.session.query(ActivityRollup.day, ActivityRollup.action_type, ActivityRollup.count)
+    day = func.date(ActivityLog.timestamp)
+    live = db.session.query(day, ActivityLog.action_type, func.count()).group_by(day, ActivityLog.action_type)
+    if start:
+        archived = archived.filter(ActivityRollup.day >= start)
+        live = live.filter(ActivityLog.timestamp >= start)
+    if end:
+        archived = archived.filter(ActivityRollup.day <= end)
+        live = live.filter(ActivityLog.timestamp < end + timedelta(days=1))
+    if action_type:
+        archived = archived.filter(ActivityRollup.action_type == action_type)
+        live = live.filter(ActivityLog.action_type == action_type)
+
+    counts = {}
+    for rollup_day, rollup_type, count in archived:
+        counts[rollup_day.isoformat(), rollup_type] = count
+    for live_day, live_type, count in live:
+        counts[live_day, live_type] = counts.get((live_day, live_type), 0) + count
+    return jsonify([{'day': key[0], 'action_type': key[1], 'count': count}
+                    for key, count in sorted(counts.items())])
+
+def share_points_between(lender_id, borrower_id, points, use_year):
+    """Transfer regular points from lender to borrower for a use year and commit"""
+    # Get lender's regular point allocation
+    lender_allocation = get_allocation(lender_id, use_year)
+
+    if not lender_allocation:
+        raise InsufficientPointsError('No points available to share')
+
+    # The balance is already net of booked stays and earlier transfers, which the ledger debited
+    available_points = lender_allocation.points
+
+    if available_points < points:
+        raise InsufficientPointsError(
+            f'Insufficient points available to share. You have {available_points} points available.')
+
+    # Create point share record
+    share = PointShare(
+        lender_id=lender_id,
+        borrower_id=borrower_id,
+        points=points,
+        use_year=use_year,
+        timestamp=datetime.now()
+    )
+    db.session.add(share)
+    db.session.flush()
+    record_transfer(db.session, lender_id, borrower_id, points, use_year)
+
+    # Move the points between allocations
+    postings = [
+        ledger_posting(lender_id, use_year, -points, counterparty_id=borrower_id),
+        ledger_posting(borrower_id, use_year, points, counterparty_id=lender_id)
+    ]
+    apply_postings(postings, 'points_transferred')
+
+    # Log the activity
+    lender = Member.query.get(lender_id)
+    borrower = Member.query.get(borrower_id)
+    log = ActivityLog(
+        action_type='points_transferred',
+        description=f'{lender.name} shared {points} points with {borrower.name}',
+        member1_id=lender_id,
+        member2_id=borrower_id,
+        timestamp=datetime.now(),
+        undo_data={
+            'postings': postings,
+            'point_share': {'lender_id': lender_id, 'borrower_id': borrower_id,
+                            'points': points, 'use_year': use_year},
+            'point_share_id': share.id
+        }
+    )
+    db.session.add(log)
+
+    db.session.commit()
 
 @app.route('/api/points/share', methods=['POST'])
 def share_points():
@@ -1127,79 +3843,16 @@ def share_points():
         points = int(request.form['points'])
         use_year = int(request.form['use_year'])
 
-        # Get lender's regular point allocation
-        lender_allocation = PointAllocation.query.filter_by(
-            member_id=lender_id,
-            use_year=use_year,
-            is_banked=False
-        ).first()
-
-        if not lender_allocation:
-            flash('No points available to share', 'error')
-            return redirect(url_for('view_loans'))
-
-        # Calculate points already used in stays
-        points_used = calculate_points_used(lender_id, use_year)
-
-        # Calculate points already shared
-        points_shared = db.session.query(func.sum(PointShare.points))\
-            .filter(PointShare.lender_id == lender_id,
-                   PointShare.use_year == use_year)\
-            .scalar() or 0
-
-        # Calculate available points
-        available_points = lender_allocation.points - points_used - points_shared
-
-        if available_points < points:
-            flash(f'Insufficient points available to share. You have {available_points} points available.', 'error')
-            return redirect(url_for('view_loans'))
-
-        # Create point share record
-        share = PointShare(
-            lender_id=lender_id,
-            borrower_id=borrower_id,
-            points=points,
-            use_year=use_year,
-            timestamp=datetime.now()
-        )
-        db.session.add(share)
-
-        # Update point allocations
-        lender_allocation.points -= points
-
-        # Get or create borrower allocation
-        borrower_allocation = PointAllocation.query.filter_by(
-            member_id=borrower_id,
-            use_year=use_year,
-            is_banked=False
-        ).first()
-
-        if not borrower_allocation:
-            borrower_allocation = PointAllocation(
-                member_id=borrower_id,
-                use_year=use_year,
-                points=0,
-                is_banked=False
-            )
-            db.session.add(borrower_allocation)
-
-        borrower_allocation.points += points
-
-        # Log the activity
-        lender = Member.query.get(lender_id)
-        borrower = Member.query.get(borrower_id)
-        log = ActivityLog(
-            action_type='points_transferred',
-            description=f'{lender.name} shared {points} points with {borrower.name}',
-            member1_id=lender_id,
-            member2_id=borrower_id,
-            timestamp=datetime.now()
-        )
-        db.session.add(log)
-
-        db.session.commit()
+        share_points_between(lender_id, borrower_id, points, use_year)
         flash(f'Successfully shared {points} points', 'success')
 
+    except InsufficientPointsError as e:
+        db.session.rollback()
+        flash(str(e), 'error')
+    except CONFLICT_ERRORS as e:
+        db.session.rollback()
+        flash(f'Points changed while sharing, please try again: {str(e)}', 'error')
+        return view_loans(), 409
     except Exception as e:
         db.session.rollback()
         flash(f'Error sharing points: {str(e)}', 'error')
@@ -1218,13 +3871,14 @@ class PointShare(db.Model):
     lender = db.relationship('Member', foreign_keys=[lender_id], backref='points_shared')
     borrower = db.relationship('Member', foreign_keys=[borrower_id], backref='points_borrowed')
 
+    __table_args__ = (
+        db.Index('ix_point_share_lender_year', 'lender_id', 'use_year'),
+        db.Index('ix_point_share_borrower_year', 'borrower_id', 'use_year'),
+    )
+
     def __repr__(self):
         return f'<PointShare {self.points} points from {self.lender_id} to {self.borrower_id}>'
 
 if __name__ == '__main__':
-    # Delete the database file if it exists
-    if os.path.exists('dvc_points.db'):
-        os.remove('dvc_points.db')
-
-    init_db()  # Initialize database with test data
+    init_db()  # Migrate the database in place, seeding test data if it is empty
     app.run(debug=True)  # Added debug=True to see any errors
@@ -0,0 +1,324 @@
+"""Versioned, in-place schema migrations for the SQLite database.
+
+The applied schema version is kept in SQLite's ``PRAGMA user_version``. Each
+migration takes an open SQLAlchemy connection and brings the schema from the
+previous version to its own. Fresh databases are created from the models and
+stamped with the latest version instead of replaying history.
+"""
+import json
+import re
+
+from sqlalchemy import inspect, text
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a migration function for the given schema version"""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(conn):
+    return conn.execute(text('PRAGMA user_version')).scalar()
+
+
+def stamp(conn, version=None):
+    """Mark the database as being at a schema version without running migrations"""
+    version = latest_version() if version is None else version
+    conn.execute(text(f'PRAGMA user_version = {int(version)}'))
+
+
+def upgrade(conn, target=None):
+    """Apply all pending migrations up to target (default: latest). Returns the applied versions."""
+    target = latest_version() if target is None else target
+    version = current_version(conn)
+    applied = []
+    for migration_version, description, func in MIGRATIONS:
+        if version < migration_version <= target:
+            func(conn)
+            stamp(conn, migration_version)
+            applied.append((migration_version, description))
+    return applied
+
+
+def column_names(conn, table):
+    return [column['name'] for column in inspect(conn).get_columns(table)]
+
+
+def ledger_posting(member_id, use_year, points, is_banked, stay_id=None):
+    """Same shape as main.ledger_posting, used when reconstructing undo data"""
+    return {
+        'member_id': member_id,
+        'use_year': use_year,
+        'points': points,
+        'is_banked': is_banked,
+        'stay_id': stay_id,
+        'counterparty_id': None
+    }
+
+
+@migration(1, 'Add indexed stay.use_year derived from check_in')
+def add_stay_use_year(conn):
+    if 'use_year' not in column_names(conn, 'stay'):
+        conn.execute(text('ALTER TABLE stay ADD COLUMN use_year INTEGER'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_stay_use_year ON stay (use_year)'))
+    # Check-ins from the contract's start month on belong to that year, earlier ones to the previous year
+    start = conn.execute(text('SELECT use_year_start FROM contract ORDER BY id LIMIT 1')).scalar() or 9
+    conn.execute(text(
+        "UPDATE stay SET use_year = CAST(strftime('%Y', check_in) AS INTEGER)"
+        " - (CAST(strftime('%m', check_in) AS INTEGER) < :start)"
+    ), {'start': start})
+
+
+@migration(2, 'Unique point allocations and composite lookup indexes')
+def add_lookup_indexes(conn):
+    # Merge duplicate allocations into the oldest row before enforcing uniqueness
+    conn.execute(text('UPDATE point_allocation SET is_banked = 0 WHERE is_banked IS NULL'))
+    conn.execute(text(
+        'UPDATE point_allocation SET points = ('
+        ' SELECT SUM(p2.points) FROM point_allocation p2'
+        ' WHERE p2.member_id = point_allocation.member_id'
+        ' AND p2.use_year = point_allocation.use_year'
+        ' AND p2.is_banked = point_allocation.is_banked)'
+        ' WHERE id IN (SELECT MIN(id) FROM point_allocation'
+        ' GROUP BY member_id, use_year, is_banked HAVING COUNT(*) > 1)'
+    ))
+    conn.execute(text(
+        'DELETE FROM point_allocation WHERE id NOT IN ('
+        ' SELECT MIN(id) FROM point_allocation GROUP BY member_id, use_year, is_banked)'
+    ))
+
+    statements = [
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_point_allocation_member_year_banked'
+        ' ON point_allocation (member_id, use_year, is_banked)',
+        'CREATE INDEX IF NOT EXISTS ix_point_allocation_use_year ON point_allocation (use_year)',
+        'CREATE INDEX IF NOT EXISTS ix_stay_member_stay_id ON stay_member (stay_id)',
+        'CREATE INDEX IF NOT EXISTS ix_stay_member_member_stay ON stay_member (member_id, stay_id)',
+        'CREATE INDEX IF NOT EXISTS ix_stay_check_in_id ON stay (check_in, id)',
+        'CREATE INDEX IF NOT EXISTS ix_stay_guest_stay_id ON stay_guest (stay_id)',
+        'CREATE INDEX IF NOT EXISTS ix_stay_guest_guest_id ON stay_guest (guest_id)',
+        'CREATE INDEX IF NOT EXISTS ix_guest_points_stay_guest_id ON guest_points (stay_guest_id)',
+        'CREATE INDEX IF NOT EXISTS ix_guest_points_member_id ON guest_points (member_id)',
+        'CREATE INDEX IF NOT EXISTS ix_activity_log_action_type_id ON activity_log (action_type, id)',
+        'CREATE INDEX IF NOT EXISTS ix_activity_log_timestamp ON activity_log (timestamp)',
+        'CREATE INDEX IF NOT EXISTS ix_activity_log_member1_id ON activity_log (member1_id)',
+        'CREATE INDEX IF NOT EXISTS ix_activity_log_member2_id ON activity_log (member2_id)',
+        'CREATE INDEX IF NOT EXISTS ix_activity_log_stay_id ON activity_log (stay_id)',
+        'CREATE INDEX IF NOT EXISTS ix_point_share_lender_year ON point_share (lender_id, use_year)',
+        'CREATE INDEX IF NOT EXISTS ix_point_share_borrower_year ON point_share (borrower_id, use_year)',
+        'CREATE INDEX IF NOT EXISTS ix_point_loan_lender_year ON point_loan (lender_id, use_year)',
+        'CREATE INDEX IF NOT EXISTS ix_point_loan_borrower_year ON point_loan (borrower_id, use_year)',
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+@migration(3, 'Append-only point ledger seeded with opening balances')
+def add_point_ledger(conn):
+    # No foreign key on stay_id: ledger rows are an audit trail and must survive undoing a stay's creation
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS point_ledger_entry ('
+        ' id INTEGER NOT NULL,'
+        ' timestamp DATETIME NOT NULL,'
+        ' member_id INTEGER NOT NULL,'
+        ' use_year INTEGER NOT NULL,'
+        ' is_banked BOOLEAN NOT NULL,'
+        ' points INTEGER NOT NULL,'
+        ' entry_type VARCHAR(50) NOT NULL,'
+        ' stay_id INTEGER,'
+        ' counterparty_id INTEGER,'
+        ' PRIMARY KEY (id),'
+        ' FOREIGN KEY(member_id) REFERENCES member (id),'
+        ' FOREIGN KEY(counterparty_id) REFERENCES member (id))'
+    ))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_point_ledger_entry_balance'
+        ' ON point_ledger_entry (member_id, use_year, is_banked, id)'
+    ))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_point_ledger_entry_stay_id ON point_ledger_entry (stay_id)'
+    ))
+    # Existing balances become the opening entries so the ledger sums match them
+    conn.execute(text(
+        "INSERT INTO point_ledger_entry (timestamp, member_id, use_year, is_banked, points, entry_type)"
+        " SELECT datetime('now'), member_id, use_year, is_banked, points, 'opening_balance'"
+        " FROM point_allocation WHERE points != 0"
+    ))
+
+
+@migration(4, 'Structured undo metadata on activity_log')
+def add_undo_metadata(conn):
+    columns = column_names(conn, 'activity_log')
+    if 'undo_data' not in columns:
+        conn.execute(text('ALTER TABLE activity_log ADD COLUMN undo_data JSON'))
+    if 'undoes_id' not in columns:
+        conn.execute(text('ALTER TABLE activity_log ADD COLUMN undoes_id INTEGER REFERENCES activity_log (id)'))
+    if 'undone_by_id' not in columns:
+        conn.execute(text('ALTER TABLE activity_log ADD COLUMN undone_by_id INTEGER REFERENCES activity_log (id)'))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_activity_log_undone_by_id_id ON activity_log (undone_by_id, id)'
+    ))
+
+    logs = conn.execute(text(
+        'SELECT id, action_type, description, member1_id, stay_id FROM activity_log ORDER BY id'
+    )).all()
+
+    # Link legacy 'Undid action: ...' entries to the newest matching action before them
+    open_actions = []
+    for log in logs:
+        if log.action_type != 'undo':
+            open_actions.append(log)
+            continue
+        for action in reversed(open_actions):
+            if log.description.startswith(f'Undid action: {action.description}'):
+                conn.execute(text('UPDATE activity_log SET undone_by_id = :undo WHERE id = :id'),
+                             {'undo': log.id, 'id': action.id})
+                conn.execute(text('UPDATE activity_log SET undoes_id = :id WHERE id = :undo'),
+                             {'undo': log.id, 'id': action.id})
+                open_actions.remove(action)
+                break
+
+    # Recover undo data for the action types the old undo understood
+    for log in open_actions:
+        undo_data = None
+        if log.action_type == 'points_banked':
+            match = re.search(r' banked (\d+) points from (\d+)', log.description)
+            if match and log.member1_id:
+                points, use_year = int(match.group(1)), int(match.group(2))
+                undo_data = {'postings': [
+                    ledger_posting(log.member1_id, use_year, -points, False),
+                    ledger_posting(log.member1_id, use_year, points, True),
+                ]}
+        elif log.action_type == 'stay_booked' and log.stay_id:
+            stay = conn.execute(text('SELECT use_year FROM stay WHERE id = :id'), {'id': log.stay_id}).first()
+            if stay:
+                shares = conn.execute(text(
+                    'SELECT member_id, points_share FROM stay_member WHERE stay_id = :id'
+                ), {'id': log.stay_id}).all()
+                undo_data = {
+                    'postings': [
+                        ledger_posting(member_id, stay.use_year, -points, False, log.stay_id)
+                        for member_id, points in shares
+                    ],
+                    'stay_status': {'stay_id': log.stay_id, 'from': 'planned', 'to': 'booked'}
+                }
+        if undo_data:
+            conn.execute(text('UPDATE activity_log SET undo_data = :data WHERE id = :id'),
+                         {'data': json.dumps(undo_data), 'id': log.id})
+
+
+@migration(5, 'Row versions on stay and point_allocation for optimistic concurrency')
+def add_row_versions(conn):
+    for table in ('stay', 'point_allocation'):
+        if 'version' not in column_names(conn, table):
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+
+
+@migration(6, 'Resort point charts and stay.room_type')
+def add_point_charts(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS point_chart ('
+        ' id INTEGER NOT NULL,'
+        ' resort VARCHAR(100) NOT NULL,'
+        ' room_type VARCHAR(100) NOT NULL,'
+        ' start_date DATE NOT NULL,'
+        ' end_date DATE NOT NULL,'
+        ' weekday_points INTEGER NOT NULL,'
+        ' weekend_points INTEGER NOT NULL,'
+        ' PRIMARY KEY (id))'
+    ))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_point_chart_resort_room_start'
+        ' ON point_chart (resort, room_type, start_date)'
+    ))
+    if 'room_type' not in column_names(conn, 'stay'):
+        conn.execute(text('ALTER TABLE stay ADD COLUMN room_type VARCHAR(100)'))
+
+
+@migration(7, 'Index stay lengths to bound overlapping-stay range scans')
+def add_stay_nights_index(conn):
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_stay_nights ON stay ((julianday(check_out) - julianday(check_in)))'
+    ))
+
+
+@migration(8, 'Pairwise point_balance matrix, rebuilt from loans and transfers')
+def rebuild_point_balances(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS point_balance ('
+        ' id INTEGER NOT NULL,'
+        ' member1_id INTEGER NOT NULL,'
+        ' member2_id INTEGER NOT NULL,'
+        ' use_year INTEGER NOT NULL,'
+        ' points INTEGER NOT NULL,'
+        ' timestamp DATETIME NOT NULL,'
+        ' PRIMARY KEY (id),'
+        ' FOREIGN KEY(member1_id) REFERENCES member (id),'
+        ' FOREIGN KEY(member2_id) REFERENCES member (id))'
+    ))
+    # Nothing wrote the table before; replay history into one row per pair and use year
+    conn.execute(text('DELETE FROM point_balance'))
+    conn.execute(text(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_point_balance_pair_year'
+        ' ON point_balance (member1_id, member2_id, use_year)'
+    ))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_point_balance_use_year ON point_balance (use_year)'))
+    # member1 is the lower id of the pair; positive points mean member1 owes member2
+    conn.execute(text(
+        "INSERT INTO point_balance (member1_id, member2_id, use_year, points, timestamp)"
+        " SELECT MIN(lender_id, borrower_id), MAX(lender_id, borrower_id), use_year,"
+        " SUM(CASE WHEN borrower_id < lender_id THEN points ELSE -points END), datetime('now')"
+        " FROM (SELECT lender_id, borrower_id, use_year, points FROM point_loan"
+        "       UNION ALL SELECT lender_id, borrower_id, use_year, points FROM point_share)"
+        " WHERE lender_id != borrower_id"
+        " GROUP BY MIN(lender_id, borrower_id), MAX(lender_id, borrower_id), use_year"
+    ))
+
+
+@migration(9, 'Covering point_balance indexes for summing each member side per use year')
+def add_point_balance_side_indexes(conn):
+    conn.execute(text('DROP INDEX IF EXISTS ix_point_balance_use_year'))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_point_balance_member1_sum ON point_balance (use_year, member1_id, points)'
+    ))
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_point_balance_member2_sum ON point_balance (use_year, member2_id, points)'
+    ))
+
+
+@migration(10, 'Activity log archive and per-day rollup tables for retention')
+def add_activity_archive(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_activity_log_undoes_id ON activity_log (undoes_id)'))
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS activity_log_archive ('
+        ' id INTEGER NOT NULL,'
+        ' timestamp DATETIME NOT NULL,'
+        ' action_type VARCHAR(50) NOT NULL,'
+        ' description VARCHAR(500) NOT NULL,'
+        ' member1_id INTEGER,'
+        ' member2_id INTEGER,'
+        ' stay_id INTEGER,'
+        ' undo_data JSON,'
+        ' undoes_id INTEGER,'
+        ' undone_by_id INTEGER,'
+        ' PRIMARY KEY (id))'
+    ))
+    for column in ('timestamp', 'member1_id', 'member2_id', 'stay_id'):
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS ix_activity_log_archive_{column} ON activity_log_archive ({column})'
+        ))
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS activity_rollup ('
+        ' day DATE NOT NULL,'
+        ' action_type VARCHAR(50) NOT NULL,'
+        ' count INTEGER NOT NULL,'
+        ' PRIMARY KEY (day, action_type))'
+    ))
@@ -1,6 +1,7 @@
 export class StayManager {
-    constructor() {
+    constructor(pageSize = 500) {
         this.stays = [];
+        this.pageSize = pageSize;
         this.listeners = new Set();
     }
 
@@ -13,10 +14,32 @@ export class StayManager {
         this.listeners.forEach(listener => listener(this.stays));
     }
 
-    async fetchStays() {
+    listen(filters = {}) {
+        // Refetch whenever the server reports a change instead of polling
+        const source = new EventSource('/api/events');
+        const refresh = () => this.fetchStays(filters);
+        source.addEventListener('activity', event => {
+            const data = JSON.parse(event.data);
+            if (data.stay_id || data.action_type === 'undo' || data.action_type === 'redo') {
+                refresh();
+            }
+        });
+        source.addEventListener('resync', refresh);
+        return () => source.close();
+    }
+
+    async fetchStays(filters = {}) {
         try {
-            const response = await fetch('/api/stays');
-            this.stays = await response.json();
+            const stays = [];
+            let cursor = null;
+            do {
+                const params = new URLSearchParams({ ...filters, limit: this.pageSize });
+                if (cursor) params.set('after', cursor);
+                const response = await fetch(`/api/stays?${params}`);
+                stays.push(...await response.json());
+                cursor = response.headers.get('X-Next-Cursor');
+            } while (cursor);
+            this.stays = stays;
             this.notify();
         } catch (error) {
             ErrorHandler.showError('Failed to fetch stays');